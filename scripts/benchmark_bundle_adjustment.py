@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import numpy as np
+from scipy import optimize
+from scipy.spatial.transform import Rotation
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "server"))
+from settings import intrinsic_matrices, distortion_coefs
+from SyntheticCameraSource import ring_camera_poses
+from CalibrationSampleBuffer import select_samples
+from helpers import (
+    bundle_adjustment,
+    calculate_reprojection_errors,
+    camera_poses_to_projection_matrices,
+    image_points_to_array,
+    project_points,
+    triangulate_points
+)
+
+# Compares the sparse jacobian bundle adjustment against the previous one, which re-triangulated
+# every point inside the residual and took finite differences over the camera poses only. Both
+# start from the same perturbed poses on a synthetic wand capture. Then checks a solve on the
+# samples select_samples picks from a longer capture does as well as a solve on all of them
+
+num_samples = 1000
+selection_num_samples = 3000
+# Over all samples, the most worse the selected subset's reprojection error may be
+selection_error_tolerance = 0.01
+dimensions = (320, 240)
+pixel_noise = 0.3
+dropout_probability = 0.2
+num_cameras = len(intrinsic_matrices)
+
+rng = np.random.default_rng(0)
+
+# Poses relative to the first camera, as calibration produces them
+world_poses = ring_camera_poses(num_cameras)
+R0, t0 = world_poses[0]["R"], world_poses[0]["t"]
+true_poses = []
+for pose in world_poses:
+    R = pose["R"] @ R0.T
+    true_poses.append({"R": R, "t": pose["t"] - R @ t0})
+
+def synthetic_capture(num_samples):
+    world_points = rng.uniform((-1, -1, 0), (1, 1, 1), (num_samples, 3))
+    camera_points = world_points @ R0.T + t0
+    image_points = project_points(camera_points, camera_poses_to_projection_matrices(true_poses, intrinsic_matrices))
+    image_points += rng.normal(0, pixel_noise, image_points.shape)
+    out_of_frame = np.any((image_points < 0) | (image_points >= dimensions), axis=2)
+    image_points = image_points.astype(object)
+    image_points[out_of_frame | (rng.random((num_samples, num_cameras)) < dropout_probability)] = [None, None]
+    return image_points
+
+image_points = synthetic_capture(num_samples)
+
+starting_poses = [true_poses[0]]
+for pose in true_poses[1:]:
+    starting_poses.append({
+        "R": Rotation.from_rotvec(rng.normal(0, 0.02, 3)).as_matrix() @ pose["R"],
+        "t": pose["t"] + rng.normal(0, 0.05, 3)
+    })
+
+def legacy_bundle_adjustment(image_points, intrinsic_matrices, camera_poses):
+    section_size = 6
+
+    def parse_params(params):
+        return [
+            {
+                "R": Rotation.from_rotvec(params[i * section_size : i * section_size + 3]).as_matrix(),
+                "t": params[i * section_size + 3 : i * section_size + 6]
+            }
+            for i in range(0, num_cameras)
+        ]
+
+    def residual_function(params):
+        projection_matrices = camera_poses_to_projection_matrices(parse_params(params), intrinsic_matrices)
+        object_points = triangulate_points(image_points, projection_matrices)
+        return calculate_reprojection_errors(image_points, object_points, projection_matrices)
+
+    params = np.concatenate([
+        np.concatenate((Rotation.from_matrix(pose["R"]).as_rotvec(), np.asarray(pose["t"]).flatten()))
+        for pose in camera_poses
+    ])
+    res = optimize.least_squares(
+        residual_function,
+        params,
+        max_nfev=1000,
+        jac='3-point',
+        x_scale='jac',
+        method='dogbox',
+        loss="linear",
+        ftol=1e-15,
+        xtol=None
+    )
+    return parse_params(res.x)
+
+def summarise(name, solve, image_points):
+    start = time.perf_counter()
+    poses = solve()
+    duration = time.perf_counter() - start
+    projection_matrices = camera_poses_to_projection_matrices(poses, intrinsic_matrices)
+    object_points = triangulate_points(image_points, projection_matrices)
+    error = np.mean(calculate_reprojection_errors(image_points, object_points, projection_matrices))
+    # Scale is left free and the legacy solver also moves the first camera, so compare the
+    # rotations of the cameras relative to the first
+    rotation_error = max(
+        Rotation.from_matrix(pose["R"] @ np.asarray(poses[0]["R"]).T @ true_pose["R"].T).magnitude()
+        for pose, true_pose in zip(poses, true_poses)
+    )
+    print(f"{name:>8}: {duration:.2f} s, mean squared reprojection error {error:.4f} px^2, worst rotation error {np.degrees(rotation_error):.3f} deg")
+    return duration, error
+
+print(f"{num_cameras} cameras, {num_samples} samples, {pixel_noise} px noise")
+before, before_error = summarise(
+    "legacy", lambda: legacy_bundle_adjustment(image_points, intrinsic_matrices, starting_poses), image_points
+)
+after, after_error = summarise(
+    "sparse",
+    lambda: bundle_adjustment(image_points, intrinsic_matrices, distortion_coefs, starting_poses, verbose=0),
+    image_points
+)
+print(f"Speedup: {before / after:.2f}x")
+if after_error > before_error:
+    sys.exit(f"Sparse bundle adjustment is less accurate than the legacy one, {after_error:.4f} > {before_error:.4f} px^2")
+
+selection_image_points = image_points_to_array(synthetic_capture(selection_num_samples))
+selected, coverage = select_samples(selection_image_points, dimensions)
+print(f"\n{selection_num_samples} samples, {len(selected)} selected covering {', '.join(f'{camera['coverage']:.0%}' for camera in coverage)} of each camera")
+_, all_error = summarise(
+    "all",
+    lambda: bundle_adjustment(selection_image_points, intrinsic_matrices, distortion_coefs, starting_poses, verbose=0),
+    selection_image_points
+)
+_, selected_error = summarise(
+    "selected",
+    lambda: bundle_adjustment(selection_image_points[selected], intrinsic_matrices, distortion_coefs, starting_poses, verbose=0),
+    selection_image_points
+)
+if selected_error > all_error * (1 + selection_error_tolerance):
+    sys.exit(f"Solving on the selected samples is less accurate than on all of them, {selected_error:.4f} > {all_error:.4f} px^2")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import numpy as np
+from scipy.signal import butter, lfilter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "server"))
+from LowPassFilter import LowPassFilter
+
+# Compares the streaming filter against the previous one, which stacked every sample onto a
+# 300 row buffer and re-ran lfilter over all of it to get the newest value. Also checks the
+# streaming output matches lfilter over the whole signal, which the old buffer truncation broke
+
+num_samples = 2000
+num_objects = 4
+dims = 4
+
+rng = np.random.default_rng(0)
+signal = np.cumsum(rng.normal(0, 1, (num_samples, num_objects, dims)), axis=0)
+
+class LegacyLowPassFilter:
+    def __init__(self, cutoff_frequency, sampling_frequency, dims, order=5, buffer_size=300):
+        self.buffer_size = buffer_size
+        self.buffered_data = np.empty((0, dims))
+        self.b, self.a = butter(order, cutoff_frequency / (sampling_frequency / 2), btype="low")
+
+    def filter(self, data):
+        self.buffered_data = np.vstack((self.buffered_data, data[np.newaxis]))
+        filtered_data = np.apply_along_axis(lambda x: lfilter(self.b, self.a, x), axis=0, arr=self.buffered_data)
+        if self.buffered_data.shape[0] >= self.buffer_size:
+            self.buffered_data = self.buffered_data[-self.buffer_size // 2:]
+        return filtered_data[-1]
+
+b, a = butter(5, 20 / (60.0 / 2), btype="low")
+reference = lfilter(b, a, signal, axis=0)
+
+legacy_filters = [LegacyLowPassFilter(20, 60.0, dims) for _ in range(num_objects)]
+start = time.perf_counter()
+legacy = np.array([
+    [legacy_filter.filter(sample[i]) for i, legacy_filter in enumerate(legacy_filters)]
+    for sample in signal
+])
+legacy_time = time.perf_counter() - start
+
+streaming_filter = LowPassFilter(20, 60.0, (num_objects, dims))
+start = time.perf_counter()
+streaming = np.array([
+    [streaming_filter.filter(sample[i], index=i).copy() for i in range(num_objects)]
+    for sample in signal
+])
+streaming_time = time.perf_counter() - start
+
+print(f"{num_samples} samples, {num_objects} objects of {dims} dims")
+print(f"  legacy: {legacy_time * 1e6 / num_samples:.1f} us per frame, max error from lfilter {np.max(np.abs(legacy - reference)):.3g}")
+print(f"streaming: {streaming_time * 1e6 / num_samples:.1f} us per frame, max error from lfilter {np.max(np.abs(streaming - reference)):.3g}")
+print(f"Speedup: {legacy_time / streaming_time:.1f}x")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import numpy as np
+
+# Runs the whole tracking pipeline on synthetic cameras so it needs no hardware
+os.environ["WECCAP_CAMERA_SOURCE"] = "synthetic"
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "server"))
+from mocap_system import MocapSystem, Modes, DEFAULT_FPS
+from SyntheticCameraSource import SyntheticCameraSource
+
+# Times each stage of the pipeline at the tracking rate and checks the triangulated markers
+# against the positions the synthetic cameras rendered them at
+
+frames_per_mode = 500
+
+mocap_system = MocapSystem.instance()
+# Free running so the pipeline, not the frame rate, sets the pace
+mocap_system.cameras.end()
+mocap_system.cameras = SyntheticCameraSource(fps=DEFAULT_FPS, realtime=False, seed=0)
+cameras = mocap_system.cameras
+
+# Keeps hold of the world points the pipeline triangulated on the last frame
+triangulated = []
+triangulation = mocap_system._triangulation
+def record_triangulation(image_points):
+    object_points, errors, epipolar_lines = triangulation(image_points)
+    triangulated[:] = [object_points]
+    return object_points, errors, epipolar_lines
+mocap_system._triangulation = record_triangulation
+
+def triangulation_errors():
+    if len(triangulated) == 0 or len(triangulated[0]) == 0:
+        return []
+    # distance from each true marker to the closest triangulated point
+    distances = np.linalg.norm(
+        cameras.marker_positions[:, np.newaxis] - np.asarray(triangulated[0])[np.newaxis], axis=2
+    )
+    return np.min(distances, axis=1).tolist()
+
+mode_names = {
+    Modes.ImageProcessing: "Image processing",
+    Modes.PointCapture: "Point capture",
+    Modes.Triangulation: "Triangulation",
+    Modes.ObjectDetection: "Object detection"
+}
+
+def benchmark(mode):
+    mocap_system.capture_mode = mode
+    errors = []
+    mocap_system._camera_read()
+    start = time.perf_counter()
+    for _ in range(frames_per_mode):
+        mocap_system._camera_read()
+        if mode >= Modes.Triangulation:
+            errors += triangulation_errors()
+    per_frame = (time.perf_counter() - start) / frames_per_mode
+    print(f"{mode_names[mode]:>16}: {per_frame * 1000:.3f} ms per frame, {1 / per_frame:.0f} fps (target {DEFAULT_FPS})")
+    if len(errors) > 0:
+        print(f"{'':>16}  marker error median {np.median(errors) * 1000:.2f} mm, 95th percentile {np.percentile(errors, 95) * 1000:.2f} mm")
+
+print(f"{cameras.num_cameras} synthetic cameras, {frames_per_mode} frames per mode")
+for mode in mode_names:
+    benchmark(mode)
+
+mocap_system.end()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import numpy as np
+import cv2 as cv
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "server"))
+from settings import intrinsic_matrices, distortion_coefs
+from helpers import camera_undistort_maps
+
+# Compares the per-frame cv.undistort the run loop used to do against cached remap tables
+# for every camera at the small PSEye resolution
+
+dimensions = (320, 240)
+iterations = 1000
+num_cameras = len(intrinsic_matrices)
+
+rng = np.random.default_rng(0)
+frames = [
+    rng.integers(0, 255, (dimensions[1], dimensions[0], 3), dtype=np.uint8) for _ in range(num_cameras)
+]
+
+def benchmark(name, process):
+    process()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        process()
+    per_frame = (time.perf_counter() - start) / iterations
+    print(f"{name:>10}: {per_frame * 1000:.3f} ms per frame set ({num_cameras} cameras)")
+    return per_frame
+
+def undistort():
+    return [
+        cv.undistort(frames[i], intrinsic_matrices[i], distortion_coefs[i]) for i in range(num_cameras)
+    ]
+
+maps = camera_undistort_maps(intrinsic_matrices, distortion_coefs, dimensions)
+outputs = [np.empty_like(frame) for frame in frames]
+
+def remap():
+    return [
+        cv.remap(frames[i], maps[i][0], maps[i][1], cv.INTER_LINEAR, dst=outputs[i]) for i in range(num_cameras)
+    ]
+
+before = benchmark("undistort", undistort)
+after = benchmark("remap", remap)
+print(f"Speedup: {before / after:.2f}x")
+
+max_difference = max(
+    np.max(np.abs(a.astype(np.int16) - b.astype(np.int16))) for a, b in zip(undistort(), remap())
+)
+print(f"Largest pixel difference between the two methods: {max_difference}")
@@ -1,81 +1,150 @@
 #!/usr/bin/env python
+import argparse
+import glob
+import hashlib
 import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
-import os
-import glob
- 
-cam_images_folder_name = 'cam_4_wide'
-cam_images_folder_name_calibrated = f'{cam_images_folder_name}_c'
 
-# Defining the dimensions of checkerboard
-CHECKERBOARD = (6,9)
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "server"))
+from intrinsics_profile import save_intrinsics_profile
+
+# Calibrates the intrinsics of every camera from folders of checkerboard images, one folder per
+# camera in camera order, and writes a profile the server loads on start.
+#
+#   generate_intrinsics.py cam_1_wide cam_2_wide cam_3_wide cam_4_wide
+#
+# Corners are found across a process pool. The corners found in each image are cached in the
+# image folder keyed by a hash of the image, so re-running after adding images only looks at the
+# new ones.
+
+CACHE_FILE_NAME = ".corners_cache.json"
 criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 3000, 0.000001)
- 
-# Creating vector to store vectors of 3D points for each checkerboard image
-objpoints = []
-# Creating vector to store vectors of 2D points for each checkerboard image
-imgpoints = [] 
- 
- 
-# Defining the world coordinates for 3D points
-objp = np.zeros((1, CHECKERBOARD[0] * CHECKERBOARD[1], 3), np.float32)
-objp[0,:,:2] = np.mgrid[0:CHECKERBOARD[0], 0:CHECKERBOARD[1]].T.reshape(-1, 2)
-prev_img_shape = None
- 
-# Extracting path of individual image stored in a given directory
-images = glob.glob(f'./{cam_images_folder_name}/*.jpg')
-print(images)
-for fname in images:
-    img = cv2.imread(fname)
-    # kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-    # img = cv2.filter2D(img, -1, kernel)
-    img = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
-    # Find the chess board corners
-    # If desired number of corners are found in the image then ret = true
-    # ret, corners = cv2.findChessboardCorners(gray, CHECKERBOARD, cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_FAST_CHECK + cv2.CALIB_CB_NORMALIZE_IMAGE)
-    ret, corners = cv2.findChessboardCorners(img, CHECKERBOARD, cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_FAST_CHECK + cv2.CALIB_CB_NORMALIZE_IMAGE )
-    
-    if ret:
-        print(f"Found chessboard in image {fname}")
-    else:
-        print(f"Failed to find chessboard in image {fname}")
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def detect_corners(path, checkerboard, annotated_path=None):
     """
-    If desired number of corner are detected,
-    we refine the pixel coordinates and display 
-    them on the images of checker board
+    Returns the image size and the subpixel checkerboard corners, or None for the corners if the
+    board was not found.
     """
-    if ret == True:
-        objpoints.append(objp)
-        # refining pixel coordinates for given 2d points.
-        corners2 = cv2.cornerSubPix(img, corners, (5,5),(-1,-1), criteria)
-         
-        imgpoints.append(corners2)
- 
-        # Draw and display the corners
-        img = cv2.drawChessboardCorners(img, CHECKERBOARD, corners2, ret)
-     
-    # cv2.imshow('img',img)
-    # cv2.waitKey(0)
-    
-    new_frame_name = cam_images_folder_name_calibrated + '/' + os.path.basename(fname)
-    # print(new_frame_name)
-    cv2.imwrite(new_frame_name, img)
-
- 
-# cv2.destroyAllWindows()
- 
-h,w = img.shape[:2]
- 
-"""
-Performing camera calibration by 
-passing the value of known 3D points (objpoints)
-and corresponding pixel coordinates of the 
-detected corners (imgpoints)
-"""
-ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, img.shape[::-1], None, None)
- 
-print("Camera matrix : \n")
-print(repr(mtx))
-print("dist : \n")
-print(repr(dist))
\ No newline at end of file
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None, None
+    found, corners = cv2.findChessboardCorners(
+        img, checkerboard, cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_FAST_CHECK + cv2.CALIB_CB_NORMALIZE_IMAGE
+    )
+    if found:
+        corners = cv2.cornerSubPix(img, corners, (5, 5), (-1, -1), criteria)
+    if annotated_path is not None:
+        annotated = cv2.drawChessboardCorners(cv2.cvtColor(img, cv2.COLOR_GRAY2BGR), checkerboard, corners, found)
+        cv2.imwrite(annotated_path, annotated)
+    size = (img.shape[1], img.shape[0])
+    return size, corners.reshape(-1, 2).tolist() if found else None
+
+def calibrate(corners, size, checkerboard):
+    objp = np.zeros((checkerboard[0] * checkerboard[1], 3), np.float32)
+    objp[:, :2] = np.mgrid[0:checkerboard[0], 0:checkerboard[1]].T.reshape(-1, 2)
+    objpoints = [objp] * len(corners)
+    imgpoints = [np.array(image_corners, dtype=np.float32).reshape(-1, 1, 2) for image_corners in corners]
+    rms, mtx, dist, _, _ = cv2.calibrateCamera(objpoints, imgpoints, tuple(size), None, None)
+    return rms, mtx, dist
+
+def load_cache(folder):
+    try:
+        with open(os.path.join(folder, CACHE_FILE_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_cache(folder, cache):
+    with open(os.path.join(folder, CACHE_FILE_NAME), "w") as f:
+        json.dump(cache, f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate camera intrinsics from checkerboard images")
+    parser.add_argument("folders", nargs="+", help="a folder of checkerboard .jpg images per camera, in camera order")
+    parser.add_argument(
+        "--output",
+        default=os.path.join(os.path.dirname(__file__), "..", "server", "intrinsics.json"),
+        help="where to write the intrinsics profile"
+    )
+    parser.add_argument("--checkerboard", default="6x9", help="inner corners of the checkerboard, columns x rows")
+    parser.add_argument("--workers", type=int, default=None, help="processes to find corners with, defaults to the cpu count")
+    parser.add_argument(
+        "--annotate", action="store_true",
+        help="write every image with its corners drawn on to a <folder>_c folder, this skips the cache"
+    )
+    args = parser.parse_args()
+
+    checkerboard = tuple(int(n) for n in args.checkerboard.split("x"))
+    checkerboard_key = f"{checkerboard[0]}x{checkerboard[1]}"
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        cameras_images = []
+        pending = []
+        for folder in args.folders:
+            images = sorted(glob.glob(os.path.join(folder, "*.jpg")))
+            if len(images) == 0:
+                sys.exit(f"No .jpg images in {folder}")
+            annotated_folder = f"{folder.rstrip(os.sep)}_c"
+            if args.annotate:
+                os.makedirs(annotated_folder, exist_ok=True)
+
+            cache = load_cache(folder)
+            keys = [f"{file_hash(path)}-{checkerboard_key}" for path in images]
+            cameras_images.append((folder, keys, cache))
+            for path, key in zip(images, keys):
+                if key in cache and not args.annotate:
+                    continue
+                annotated_path = os.path.join(annotated_folder, os.path.basename(path)) if args.annotate else None
+                pending.append((cache, key, path, executor.submit(detect_corners, path, checkerboard, annotated_path)))
+
+        num_images = sum(len(keys) for _, keys, _ in cameras_images)
+        print(f"Finding corners in {len(pending)} images, {num_images - len(pending)} cached")
+        for cache, key, path, future in pending:
+            size, corners = future.result()
+            if size is None:
+                print(f"Could not read {path}")
+                continue
+            print(f"{'Found' if corners is not None else 'Failed to find'} chessboard in image {path}")
+            cache[key] = {"size": size, "corners": corners}
+
+        calibrations = []
+        for folder, keys, cache in cameras_images:
+            save_cache(folder, cache)
+            detections = [cache[key] for key in keys if key in cache and cache[key]["corners"] is not None]
+            if len(detections) == 0:
+                sys.exit(f"No checkerboards found in {folder}")
+            sizes = {tuple(detection["size"]) for detection in detections}
+            if len(sizes) > 1:
+                sys.exit(f"Images in {folder} are different sizes: {sorted(sizes)}")
+            size = sizes.pop()
+            corners = [detection["corners"] for detection in detections]
+            # the cameras calibrate alongside each other in the same pool
+            calibrations.append((folder, size, len(corners), executor.submit(calibrate, corners, size, checkerboard)))
+
+        cameras = []
+        for folder, size, num_used, future in calibrations:
+            rms, mtx, dist = future.result()
+            print(f"{folder}: {num_used} images, rms error {rms:.4f} px")
+            print(repr(mtx))
+            print(repr(dist))
+            cameras.append({
+                "name": os.path.basename(folder.rstrip(os.sep)),
+                "image_size": list(size),
+                "intrinsic_matrix": mtx,
+                "distortion_coefs": dist,
+                "rms": rms,
+                "images": num_used
+            })
+
+    save_intrinsics_profile(args.output, cameras, checkerboard)
+    print(f"Wrote {args.output}")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+import argparse
+import os
+import sys
+
+# Re-runs the tracking pipeline over a raw recording as fast as it can, writing the triangulated
+# points to a csv the same way a live recording does. The calibration comes from the recording
+# unless a profile is given, and dot detection uses the server defaults unless overridden.
+#
+#   reprocess_recording.py recordings/<name> data/<output>.csv --profile server/calibration_profiles/<profile>.npz
+
+parser = argparse.ArgumentParser(description="Re-run tracking over a raw recording")
+parser.add_argument("recording", help="recording folder written by the server")
+parser.add_argument("output", help="csv file to write the triangulated points to")
+parser.add_argument(
+    "--profile",
+    help="calibration profile .npz to use instead of the poses the recording was made with"
+)
+parser.add_argument("--threshold", type=float, help="dot brightness threshold, 0 to 1")
+parser.add_argument("--detector", choices=["components", "contours"], help="dot detector")
+parser.add_argument("--min-area", type=float, help="smallest dot area in pixels")
+parser.add_argument("--max-area", type=float, help="largest dot area in pixels")
+parser.add_argument("--min-circularity", type=float, help="least circularity of a dot, 0 to 1")
+args = parser.parse_args()
+
+if args.profile is not None:
+    if not os.path.exists(args.profile):
+        sys.exit(f"No calibration profile at {args.profile}")
+    os.environ["WECCAP_CALIBRATION_PROFILE"] = os.path.abspath(args.profile)
+os.environ["WECCAP_CAMERA_SOURCE"] = "replay"
+os.environ["WECCAP_REPLAY_RECORDING"] = args.recording
+os.environ["WECCAP_REPLAY_SPEED"] = "0"
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "server"))
+from mocap_system import MocapSystem, Modes
+from CameraSource import SourceFinished
+
+mocap_system = MocapSystem.instance()
+if mocap_system.capture_mode < Modes.CamerasFound:
+    sys.exit(f"Could not open {args.recording}")
+
+if args.threshold is not None:
+    mocap_system.contour_threshold = args.threshold
+if args.detector is not None:
+    mocap_system.dot_detector = args.detector
+if args.min_area is not None:
+    mocap_system.min_dot_area = args.min_area
+if args.max_area is not None:
+    mocap_system.max_dot_area = args.max_area
+if args.min_circularity is not None:
+    mocap_system.min_dot_circularity = args.min_circularity
+
+mocap_system.capture_mode = Modes.Triangulation
+mocap_system.output_file = open(args.output, "w")
+frames = 0
+try:
+    while True:
+        mocap_system._camera_read()
+        frames += 1
+except SourceFinished:
+    pass
+mocap_system.output_file.close()
+mocap_system.output_file = None
+print(f"Reprocessed {frames} frames into {args.output}")
+mocap_system.end()
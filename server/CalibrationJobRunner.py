@@ -0,0 +1,147 @@
+import itertools
+import threading
+import time
+import traceback
+import multiprocessing as mp
+from helpers import bundle_adjustment, initial_camera_poses
+
+# Least time in seconds between progress messages from a running solve
+PROGRESS_INTERVAL = 0.1
+# Pose solves refine the linear result with this robust loss so stray dots and mismatched
+# correspondences in the samples count for less, f_scale comes from the linear residuals
+CALIBRATION_LOSS = "huber"
+
+# Sent to the front end as the kind of each calibration-job event
+class CalibrationJobs():
+    CameraPose = "camera-pose"
+    BundleAdjustment = "bundle-adjustment"
+
+
+def _calibration_worker(connection, kind, image_points, intrinsic_matrices, distortion_coefs, camera_poses):
+    last_progress = 0
+
+    def progress(evaluations, cost):
+        nonlocal last_progress
+        now = time.time()
+        if now - last_progress >= PROGRESS_INTERVAL:
+            last_progress = now
+            connection.send(("progress", evaluations, float(cost)))
+
+    try:
+        if kind == CalibrationJobs.CameraPose:
+            camera_poses = initial_camera_poses(image_points, intrinsic_matrices)
+        new_poses = bundle_adjustment(
+            image_points, intrinsic_matrices, distortion_coefs, camera_poses,
+            loss=CALIBRATION_LOSS, verbose=0, progress=progress
+        )
+        connection.send(("result", new_poses))
+    except Exception as e:
+        traceback.print_exc()
+        connection.send(("error", str(e)))
+    connection.close()
+
+
+class CalibrationJob:
+    def __init__(self, job_id, kind, image_points, process, connection):
+        self.id = job_id
+        self.kind = kind
+        # Every sample the job was started with, not just those it solves on
+        self.image_points = image_points
+        self.process = process
+        self.connection = connection
+        self.cancelled = False
+
+
+class CalibrationJobRunner:
+    """
+    Runs calibration solves in a worker process so the server keeps serving the preview and
+    tracking while they run. Only one job runs at a time, starting another cancels it.
+
+    on_started(job_id, kind) is called before the job can report anything, on_progress(job_id,
+    evaluations, cost) as the solve goes, then one of on_finished(job_id, kind, camera_poses,
+    image_points), on_error(job_id, message) or on_cancelled(job_id). image_points are all the
+    samples the job was started with. A cancelled job never publishes its poses. on_progress,
+    on_finished and on_error run on a monitoring thread.
+    """
+
+    def __init__(self, on_started, on_progress, on_finished, on_error, on_cancelled):
+        self.on_started = on_started
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.on_error = on_error
+        self.on_cancelled = on_cancelled
+        self.job = None
+        self.job_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        # spawn rather than fork as the parent is running flask and camera threads
+        self.context = mp.get_context("spawn")
+
+    def start(self, kind, image_points, intrinsic_matrices, distortion_coefs, camera_poses=None, selected=None):
+        """
+        Solves on image_points[selected], or all of image_points if selected is None. A job that
+        is already running is cancelled.
+        """
+        self.cancel()
+        solve_points = image_points if selected is None else image_points[selected]
+        connection, child_connection = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=_calibration_worker,
+            args=(child_connection, kind, solve_points, intrinsic_matrices, distortion_coefs, camera_poses),
+            daemon=True
+        )
+        process.start()
+        child_connection.close()
+
+        with self.lock:
+            job = CalibrationJob(next(self.job_ids), kind, image_points, process, connection)
+            self.job = job
+        # The monitor isn't running yet, so started always comes before anything the job reports
+        self.on_started(job.id, kind)
+        threading.Thread(target=self._monitor, args=(job,), daemon=True).start()
+        return job.id
+
+    def cancel(self, job_id=None):
+        """
+        Stops the running job, or only the job with job_id if given. Returns whether a job was stopped.
+        """
+        with self.lock:
+            job = self.job
+            if job is None or (job_id is not None and job.id != job_id):
+                return False
+            job.cancelled = True
+            self.job = None
+        job.process.terminate()
+        self.on_cancelled(job.id)
+        return True
+
+    def _monitor(self, job):
+        while True:
+            try:
+                message = job.connection.recv()
+            except (EOFError, OSError):
+                # the worker was terminated or died without reporting
+                break
+
+            with self.lock:
+                if job.cancelled:
+                    break
+                if message[0] != "progress" and self.job is job:
+                    self.job = None
+
+            if message[0] == "progress":
+                self.on_progress(job.id, message[1], message[2])
+            elif message[0] == "result":
+                self.on_finished(job.id, job.kind, message[1], job.image_points)
+                break
+            elif message[0] == "error":
+                self.on_error(job.id, message[1])
+                break
+
+        job.connection.close()
+        job.process.join()
+        with self.lock:
+            stopped_unexpectedly = self.job is job
+            if stopped_unexpectedly:
+                self.job = None
+        if stopped_unexpectedly:
+            self.on_error(job.id, "Calibration worker stopped unexpectedly")
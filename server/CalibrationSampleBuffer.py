@@ -0,0 +1,147 @@
+import threading
+import numpy as np
+
+DEFAULT_CAPACITY = 4096
+# Most samples handed to a pose solve, its time grows with every one
+MAX_SOLVE_SAMPLES = 1000
+# Cells each camera image is split into, across and down, when judging how well it is covered
+COVERAGE_GRID = (16, 12)
+# Samples within this many pixels of each other in every camera that sees them are duplicates
+DUPLICATE_DISTANCE = 1
+
+
+class CalibrationSampleBuffer:
+    """
+    Wand samples for camera pose calibration, held on the server as they are captured.
+
+    Each sample is one image point per camera in a preallocated float32 (capacity, num_cameras, 2)
+    array, with a matching visibility mask for the cameras that saw it. The arrays double in size
+    when full. Samples are added from the tracking thread and read from socket handlers, so every
+    access takes the lock.
+    """
+
+    def __init__(self, num_cameras, capacity=DEFAULT_CAPACITY):
+        self.num_cameras = num_cameras
+        self.points = np.zeros((capacity, num_cameras, 2), dtype=np.float32)
+        self.visible = np.zeros((capacity, num_cameras), dtype=bool)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def add(self, points, visible):
+        with self.lock:
+            if self.count == len(self.points):
+                self.points = np.concatenate((self.points, np.zeros_like(self.points)))
+                self.visible = np.concatenate((self.visible, np.zeros_like(self.visible)))
+            self.points[self.count] = np.where(visible[:, np.newaxis], points, 0)
+            self.visible[self.count] = visible
+            self.count += 1
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+
+    def samples(self, start=0):
+        """
+        A float64 (samples, num_cameras, 2) copy of the samples from start on, NaN where a camera
+        did not see the sample, the layout triangulate_points and bundle_adjustment take.
+        """
+        with self.lock:
+            points = self.points[start:self.count].astype(np.float64)
+            points[~self.visible[start:self.count]] = np.nan
+        return points
+
+    def camera_counts(self):
+        # How many samples each camera saw
+        with self.lock:
+            return np.sum(self.visible[:self.count], axis=0)
+
+    def to_serializable(self, start=0):
+        samples = self.samples(start)
+        return [
+            [[None, None] if np.isnan(point[0]) else point.tolist() for point in sample]
+            for sample in samples
+        ]
+
+    def save(self, path):
+        with self.lock:
+            np.savez_compressed(path, points=self.points[:self.count], visible=self.visible[:self.count])
+
+    def load(self, path):
+        """
+        Replaces the samples with those saved at path. Raises a ValueError if they were captured
+        with a different number of cameras.
+        """
+        with np.load(path) as saved:
+            points = saved["points"].astype(np.float32)
+            visible = saved["visible"].astype(bool)
+        if points.shape[1:] != (self.num_cameras, 2) or visible.shape != points.shape[:2]:
+            raise ValueError(f"{path} holds samples for {points.shape[1]} cameras, not {self.num_cameras}")
+
+        with self.lock:
+            capacity = max(len(self.points), len(points))
+            self.points = np.zeros((capacity, self.num_cameras, 2), dtype=np.float32)
+            self.visible = np.zeros((capacity, self.num_cameras), dtype=bool)
+            self.points[:len(points)] = points
+            self.visible[:len(points)] = visible
+            self.count = len(points)
+
+
+def select_samples(samples, dimensions, max_samples=MAX_SOLVE_SAMPLES, grid=COVERAGE_GRID):
+    """
+    Picks a well spread subset of at most max_samples calibration samples.
+
+    Samples seen by fewer than two cameras are dropped, as are duplicates, samples that land on the
+    same pixel of every camera (the wand held still). If more than max_samples remain, each
+    observation is binned into a grid cell of its camera's image and samples are taken one at a
+    time, favouring those seen by more cameras and in cells that have been picked least so far.
+
+    Returns the indexes of the chosen samples and, for each camera, the number of chosen samples
+    it sees and the fraction of its grid cells they cover.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    num_cameras = samples.shape[1]
+    width, height = dimensions
+    columns, rows = grid
+    num_cells = columns * rows
+
+    visible = ~np.any(np.isnan(samples), axis=2)
+    pixels = np.where(visible[:, :, np.newaxis], np.floor(np.nan_to_num(samples) / DUPLICATE_DISTANCE), -1)
+    _, candidates = np.unique(pixels.reshape(len(samples), -1), axis=0, return_index=True)
+    candidates = np.sort(candidates)
+    candidates = candidates[np.sum(visible[candidates], axis=1) >= 2]
+
+    cell_x = np.clip(np.nan_to_num(samples[:, :, 0]) * columns // width, 0, columns - 1)
+    cell_y = np.clip(np.nan_to_num(samples[:, :, 1]) * rows // height, 0, rows - 1)
+    cells = np.where(visible, cell_y * columns + cell_x, -1).astype(np.int64)
+
+    if len(candidates) > max_samples:
+        candidate_cells = cells[candidates]
+        candidate_visible = visible[candidates]
+        camera_indexes = np.broadcast_to(np.arange(num_cameras), candidate_cells.shape)
+        picked = np.zeros((num_cameras, num_cells))
+        available = np.ones(len(candidates), dtype=bool)
+        chosen = []
+        for _ in range(max_samples):
+            gains = np.sum(
+                np.where(candidate_visible, 1 / (1 + picked[camera_indexes, np.maximum(candidate_cells, 0)]), 0),
+                axis=1
+            )
+            gains[~available] = -np.inf
+            best = int(np.argmax(gains))
+            available[best] = False
+            chosen.append(best)
+            picked[np.flatnonzero(candidate_visible[best]), candidate_cells[best][candidate_visible[best]]] += 1
+        candidates = np.sort(candidates[chosen])
+
+    coverage = []
+    for camera in range(0, num_cameras):
+        camera_cells = cells[candidates, camera]
+        camera_cells = camera_cells[camera_cells >= 0]
+        coverage.append({
+            "samples": len(camera_cells),
+            "coverage": len(np.unique(camera_cells)) / num_cells
+        })
+    return candidates, coverage
@@ -0,0 +1,189 @@
+import copy
+import numpy as np
+from helpers import camera_poses_to_projection_matrices, camera_fundamental_matrices, camera_undistort_maps
+
+# Bumped whenever the layout written by CalibrationState.save changes, older profiles are refused
+PROFILE_VERSION = 1
+
+
+class CalibrationState:
+    """
+    Everything the tracking loop derives from the camera calibration, built once when the
+    calibration changes instead of deep inside the run loop.
+
+    world_projection_matrices are the projection matrices composed with the inverse of the
+    to-world matrix, so points triangulated through them are already in world coordinates.
+    projection_matrices stay in the first camera's frame for the calibration steps.
+
+    A state is never modified once built. MocapSystem swaps in a new one through the with_*
+    methods so the tracking thread always sees a consistent set of matrices.
+
+    save writes the whole state, derived matrices and undistort maps included, to one
+    uncompressed npz so load can bring it back in a single read without recomputing anything.
+    The intrinsics saved with it only say what the derived matrices were built from, the
+    intrinsics in use always come from settings.py, see with_profile.
+    """
+
+    def __init__(
+        self,
+        intrinsic_matrices,
+        distortion_coefs,
+        num_cameras,
+        dimensions,
+        camera_poses=None,
+        to_world_coords_matrix=None,
+        undistort_maps=None
+    ):
+        self.intrinsic_matrices = intrinsic_matrices
+        self.distortion_coefs = distortion_coefs
+        self.num_cameras = num_cameras
+        self.dimensions = dimensions
+        self.camera_poses = camera_poses
+        self.to_world_coords_matrix = to_world_coords_matrix
+
+        if undistort_maps is None:
+            undistort_maps = camera_undistort_maps(
+                intrinsic_matrices[:num_cameras], distortion_coefs[:num_cameras], dimensions
+            )
+        self.undistort_maps = undistort_maps
+
+        self.projection_matrices = None
+        self.world_projection_matrices = None
+        self.fundamental_matrices = None
+        if camera_poses is not None:
+            self.projection_matrices = camera_poses_to_projection_matrices(camera_poses, intrinsic_matrices)
+            to_world = np.eye(4) if to_world_coords_matrix is None else np.asarray(to_world_coords_matrix, dtype=np.float64)
+            self.world_projection_matrices = np.asarray(self.projection_matrices, dtype=np.float64) @ np.linalg.inv(to_world)
+            self.fundamental_matrices = camera_fundamental_matrices(self.world_projection_matrices)
+
+    def with_intrinsics(self, intrinsic_matrices, distortion_coefs):
+        return CalibrationState(
+            intrinsic_matrices,
+            distortion_coefs,
+            self.num_cameras,
+            self.dimensions,
+            self.camera_poses,
+            self.to_world_coords_matrix
+        )
+
+    def with_num_cameras(self, num_cameras):
+        return CalibrationState(
+            self.intrinsic_matrices,
+            self.distortion_coefs,
+            num_cameras,
+            self.dimensions,
+            self.camera_poses,
+            self.to_world_coords_matrix
+        )
+
+    def with_camera_poses(self, camera_poses):
+        return CalibrationState(
+            self.intrinsic_matrices,
+            self.distortion_coefs,
+            self.num_cameras,
+            self.dimensions,
+            camera_poses,
+            self.to_world_coords_matrix,
+            self.undistort_maps
+        )
+
+    def with_to_world_coords_matrix(self, to_world_coords_matrix):
+        return CalibrationState(
+            self.intrinsic_matrices,
+            self.distortion_coefs,
+            self.num_cameras,
+            self.dimensions,
+            self.camera_poses,
+            to_world_coords_matrix,
+            self.undistort_maps
+        )
+
+    def with_profile(self, profile):
+        """
+        The poses and to-world matrix of a loaded profile on top of this state's intrinsics. The
+        profile's derived matrices are used as they are if it was saved with the same intrinsics
+        for the cameras in use, otherwise they are rebuilt.
+        """
+        num_cameras = self.num_cameras
+        same_intrinsics = (
+            profile.num_cameras == num_cameras
+            and len(profile.intrinsic_matrices) >= num_cameras
+            and np.array_equal(
+                np.asarray(profile.intrinsic_matrices[:num_cameras], dtype=np.float64),
+                np.asarray(self.intrinsic_matrices[:num_cameras], dtype=np.float64)
+            )
+            and np.array_equal(
+                np.array([np.asarray(coefs, dtype=np.float64).flatten() for coefs in profile.distortion_coefs[:num_cameras]]),
+                np.array([np.asarray(coefs, dtype=np.float64).flatten() for coefs in self.distortion_coefs[:num_cameras]])
+            )
+        )
+        if same_intrinsics:
+            state = copy.copy(profile)
+            state.intrinsic_matrices = self.intrinsic_matrices
+            state.distortion_coefs = self.distortion_coefs
+            return state
+
+        return CalibrationState(
+            self.intrinsic_matrices,
+            self.distortion_coefs,
+            self.num_cameras,
+            self.dimensions,
+            profile.camera_poses,
+            profile.to_world_coords_matrix,
+            self.undistort_maps
+        )
+
+    def save(self, path):
+        arrays = {
+            "version": PROFILE_VERSION,
+            "intrinsic_matrices": np.asarray(self.intrinsic_matrices, dtype=np.float64),
+            "distortion_coefs": np.array(
+                [np.asarray(coefs, dtype=np.float64).flatten() for coefs in self.distortion_coefs]
+            ),
+            "num_cameras": self.num_cameras,
+            "dimensions": self.dimensions,
+            "undistort_map1": np.array([map1 for map1, _ in self.undistort_maps]),
+            "undistort_map2": np.array([map2 for _, map2 in self.undistort_maps])
+        }
+        if self.camera_poses is not None:
+            arrays.update({
+                "R": np.array([np.asarray(pose["R"], dtype=np.float64) for pose in self.camera_poses]),
+                "t": np.array([np.asarray(pose["t"], dtype=np.float64).flatten() for pose in self.camera_poses]),
+                "projection_matrices": np.asarray(self.projection_matrices, dtype=np.float64),
+                "world_projection_matrices": self.world_projection_matrices,
+                "fundamental_matrices": self.fundamental_matrices
+            })
+        if self.to_world_coords_matrix is not None:
+            arrays["to_world_coords_matrix"] = np.asarray(self.to_world_coords_matrix, dtype=np.float64)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a state written by save. Raises a ValueError if it was written by a different
+        version. Poses come back as lists, the same as when the UI sends them.
+        """
+        with np.load(path, allow_pickle=False) as profile:
+            arrays = {key: profile[key] for key in profile.files}
+        if int(arrays["version"]) != PROFILE_VERSION:
+            raise ValueError(f"{path} is calibration profile version {int(arrays['version'])}, expected {PROFILE_VERSION}")
+
+        # Everything derived was saved with the profile, so skip __init__ rather than recompute it
+        state = cls.__new__(cls)
+        state.intrinsic_matrices = list(arrays["intrinsic_matrices"])
+        state.distortion_coefs = list(arrays["distortion_coefs"])
+        state.num_cameras = int(arrays["num_cameras"])
+        state.dimensions = tuple(int(n) for n in arrays["dimensions"])
+        state.undistort_maps = list(zip(arrays["undistort_map1"], arrays["undistort_map2"]))
+        state.to_world_coords_matrix = arrays.get("to_world_coords_matrix")
+
+        state.camera_poses = None
+        state.projection_matrices = None
+        state.world_projection_matrices = None
+        state.fundamental_matrices = None
+        if "R" in arrays:
+            state.camera_poses = [{"R": R.tolist(), "t": t.tolist()} for R, t in zip(arrays["R"], arrays["t"])]
+            state.projection_matrices = list(arrays["projection_matrices"])
+            state.world_projection_matrices = arrays["world_projection_matrices"]
+            state.fundamental_matrices = arrays["fundamental_matrices"]
+        return state
@@ -0,0 +1,104 @@
+class CameraSources():
+    PSEye = "pseye"
+    Synthetic = "synthetic"
+    Replay = "replay"
+
+
+class SourceFinished(Exception):
+    """
+    Raised by read once a source has no more frames, such as at the end of a replayed recording.
+    """
+
+
+class CameraSource:
+    """
+    Where MocapSystem gets its frames from.
+
+    read returns a list of frames, one per camera, and a list of capture timestamps in seconds.
+    exposure, gain, sharpness and contrast are per camera lists. Sources that know the
+    calibration of their cameras, such as the synthetic one or a recording, also provide
+    camera_poses and to_world_coords_matrix. MocapSystem starts from those unless it is given a
+    calibration profile.
+    """
+
+    num_cameras = 0
+    camera_poses = None
+    to_world_coords_matrix = None
+
+    def __init__(self):
+        self.exposure = [0] * self.num_cameras
+        self.gain = [0] * self.num_cameras
+        self.sharpness = [0] * self.num_cameras
+        self.contrast = [0] * self.num_cameras
+
+    def read(self, squeeze=False):
+        raise NotImplementedError
+
+    def stream(self, file_name):
+        """
+        Starts recording video to file_name, returns an object with an end method or None if
+        the source can't record video.
+        """
+        print(f"{type(self).__name__} cannot record video")
+        return None
+
+    def end(self):
+        pass
+
+
+class PSEyeCameraSource(CameraSource):
+    """
+    Sony PSEye cameras through pseyepy.
+    """
+
+    def __init__(self, fps, exposure=50, gain=1):
+        # Only needed when there is camera hardware
+        from pseyepy import Camera, cam_count
+
+        self.camera = Camera(
+            fps=fps, resolution=Camera.RES_SMALL, colour=True, gain=gain, exposure=exposure
+        )
+        self.num_cameras = cam_count()
+
+    @property
+    def exposure(self):
+        return self.camera.exposure
+
+    @exposure.setter
+    def exposure(self, exposure):
+        self.camera.exposure = exposure
+
+    @property
+    def gain(self):
+        return self.camera.gain
+
+    @gain.setter
+    def gain(self, gain):
+        self.camera.gain = gain
+
+    @property
+    def sharpness(self):
+        return self.camera.sharpness
+
+    @sharpness.setter
+    def sharpness(self, sharpness):
+        self.camera.sharpness = sharpness
+
+    @property
+    def contrast(self):
+        return self.camera.contrast
+
+    @contrast.setter
+    def contrast(self, contrast):
+        self.camera.contrast = contrast
+
+    def read(self, squeeze=False):
+        return self.camera.read(squeeze=squeeze)
+
+    def stream(self, file_name):
+        from pseyepy import Stream
+
+        return Stream(self.camera, file_name=file_name, display=True)
+
+    def end(self):
+        self.camera.end()
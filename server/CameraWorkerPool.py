@@ -0,0 +1,186 @@
+import threading
+import traceback
+import multiprocessing as mp
+import numpy as np
+import cv2 as cv
+from blob_detection import find_dots_around
+from helpers import camera_undistort_maps, undistort_points
+from FrameRingBuffer import FrameRingBuffer
+
+
+def _process_frame(message, camera, raw_frames, processed_frames, map1, map2, intrinsic_matrix, distortion_coef):
+    (
+        _, sequence_number, processed_sequence_number, detect, point_space, preview, want_contours,
+        detection_settings, search_centers, search_radius
+    ) = message
+    frame = raw_frames.view(sequence_number, camera)
+    output = None
+    if processed_sequence_number is not None:
+        output = processed_frames.view(processed_sequence_number, camera)
+    image_points = np.empty((0, 2))
+    contours = []
+
+    if not point_space:
+        cv.remap(frame, map1, map2, cv.INTER_LINEAR, dst=output)
+    if detect:
+        contours, image_points = find_dots_around(
+            frame if point_space else output, search_centers, search_radius, **detection_settings
+        )
+        if point_space:
+            image_points = undistort_points(image_points, intrinsic_matrix, distortion_coef)
+            if want_contours:
+                contours = [
+                    np.round(
+                        undistort_points(contour, intrinsic_matrix, distortion_coef)
+                    ).astype(np.int32).reshape(-1, 1, 2)
+                    for contour in contours
+                ]
+    if point_space and preview:
+        # Only frames that are going to be displayed need every pixel undistorted
+        cv.remap(frame, map1, map2, cv.INTER_LINEAR, dst=output)
+    # the views into shared memory go out of scope here, before it can be closed
+    return image_points, contours if want_contours else []
+
+def _camera_worker(connection, camera, num_cameras, dimensions, num_slots, raw_frames_name, processed_frames_name):
+    raw_frames = FrameRingBuffer(num_cameras, dimensions, num_slots, name=raw_frames_name)
+    processed_frames = FrameRingBuffer(num_cameras, dimensions, num_slots, name=processed_frames_name)
+    intrinsic_matrix = None
+    distortion_coef = None
+    map1, map2 = None, None
+
+    while True:
+        message = connection.recv()
+        if message[0] == "stop":
+            break
+        elif message[0] == "intrinsics":
+            _, intrinsic_matrix, distortion_coef = message
+            [(map1, map2)] = camera_undistort_maps([intrinsic_matrix], [distortion_coef], dimensions)
+        elif message[0] == "process":
+            try:
+                image_points, contours = _process_frame(
+                    message, camera, raw_frames, processed_frames, map1, map2, intrinsic_matrix, distortion_coef
+                )
+            except Exception:
+                # One bad frame shouldn't take the worker down, the parent gets no dots for it
+                traceback.print_exc()
+                image_points, contours = np.empty((0, 2)), []
+            # Only the compact centroid array (and contours for previews) goes back through the pipe
+            connection.send((image_points, contours))
+
+    raw_frames.end()
+    processed_frames.end()
+
+
+class CameraWorkerError(RuntimeError):
+    """
+    A camera worker process died, the pool can't be used any more.
+    """
+
+
+class CameraWorkerPool:
+    """
+    Runs the per camera image stage (undistortion, thresholding and dot detection) in one
+    worker process per camera.
+
+    Workers read frames straight out of the shared raw frame ring buffer and write processed
+    frames into the processed ring buffer, no frames are pickled. A frame a worker fails on comes
+    back with no dots, a worker that dies makes process raise CameraWorkerError.
+    """
+
+    def __init__(self, num_cameras, dimensions, raw_frames, processed_frames):
+        self.num_cameras = num_cameras
+        self.connections = []
+        self.processes = []
+        self.pending_intrinsics = None
+        self.lock = threading.Lock()
+
+        # spawn rather than fork as the parent is running flask and camera threads
+        context = mp.get_context("spawn")
+        for camera in range(0, num_cameras):
+            connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=_camera_worker,
+                args=(
+                    child_connection,
+                    camera,
+                    num_cameras,
+                    dimensions,
+                    raw_frames.num_slots,
+                    raw_frames.name,
+                    processed_frames.name
+                ),
+                daemon=True
+            )
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def set_intrinsics(self, intrinsic_matrices, distortion_coefs):
+        # Picked up by the tracking thread on its next call to process so the pipes only ever
+        # have one writer
+        with self.lock:
+            self.pending_intrinsics = (intrinsic_matrices, distortion_coefs)
+
+    def process(self, sequence_number, processed_sequence_number, detect, point_space, preview, want_contours, detection_settings, search_centers=None, search_radius=0):
+        """
+        Processes the frames in a raw ring buffer slot from every camera in parallel, writing
+        undistorted frames to the processed ring buffer slot if one is given. If search centers
+        are given for a camera, dots are only searched for in windows around them.
+
+        Returns the image points and contours for each camera.
+        """
+        with self.lock:
+            pending_intrinsics = self.pending_intrinsics
+            self.pending_intrinsics = None
+        if pending_intrinsics is not None:
+            intrinsic_matrices, distortion_coefs = pending_intrinsics
+            for i in range(0, self.num_cameras):
+                self._send(i, (
+                    "intrinsics",
+                    np.asarray(intrinsic_matrices[i], dtype=np.float64),
+                    np.asarray(distortion_coefs[i], dtype=np.float64)
+                ))
+
+        for i in range(0, self.num_cameras):
+            self._send(i, (
+                "process",
+                sequence_number,
+                processed_sequence_number,
+                detect,
+                point_space,
+                preview,
+                want_contours,
+                detection_settings,
+                search_centers[i] if search_centers is not None else None,
+                search_radius
+            ))
+
+        image_points = []
+        contours = []
+        for i, connection in enumerate(self.connections):
+            try:
+                camera_image_points, camera_contours = connection.recv()
+            except (EOFError, OSError) as e:
+                raise CameraWorkerError(f"Camera {i} worker stopped") from e
+            image_points.append(camera_image_points)
+            contours.append(camera_contours)
+        return image_points, contours
+
+    def _send(self, camera, message):
+        try:
+            self.connections[camera].send(message)
+        except OSError as e:
+            raise CameraWorkerError(f"Camera {camera} worker stopped") from e
+
+    def end(self):
+        for connection in self.connections:
+            try:
+                connection.send(("stop",))
+            except OSError:
+                # already gone
+                pass
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
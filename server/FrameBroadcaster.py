@@ -0,0 +1,89 @@
+import threading
+
+
+class FrameSubscription:
+    """
+    A latest-value slot for a single viewer of the camera stream.
+
+    Publishing overwrites whatever the viewer has not picked up yet, so a slow viewer only
+    ever drops frames, it never holds up the producer or the other viewers. Use it as a
+    context manager so the subscription is removed when the viewer goes away.
+
+    Frames are views into a FrameRingBuffer, check is_valid once done with a frame in case
+    the ring wrapped around and overwrote it in the meantime.
+    """
+
+    def __init__(self, broadcaster, camera=None):
+        self.broadcaster = broadcaster
+        self.camera = camera
+        self._published = None
+        self._current = None
+        self._lock = threading.Lock()
+        self._has_new_frames = threading.Event()
+
+    def offer(self, ring_buffer, sequence_number):
+        with self._lock:
+            self._published = (ring_buffer, sequence_number)
+            self._has_new_frames.set()
+
+    def get(self, timeout=1):
+        """
+        Waits for the next published frame set and returns the view this subscriber asked
+        for, either a single camera or all cameras stacked horizontally. Returns None on timeout.
+        """
+        if not self._has_new_frames.wait(timeout):
+            return None
+        with self._lock:
+            published = self._published
+            self._published = None
+            self._has_new_frames.clear()
+        if published is None:
+            return None
+        self._current = published
+        ring_buffer, sequence_number = published
+        return ring_buffer.view(sequence_number, self.camera)
+
+    def is_valid(self):
+        if self._current is None:
+            return False
+        ring_buffer, sequence_number = self._current
+        return ring_buffer.is_valid(sequence_number)
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FrameBroadcaster:
+    """
+    Fans frames out from the single tracking loop to any number of stream viewers.
+    """
+
+    def __init__(self):
+        self._subscriptions = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, camera=None):
+        subscription = FrameSubscription(self, camera)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def has_subscribers(self):
+        return len(self._subscriptions) > 0
+
+    def publish(self, ring_buffer, sequence_number):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.offer(ring_buffer, sequence_number)
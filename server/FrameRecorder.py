@@ -0,0 +1,78 @@
+import os
+import json
+import numpy as np
+
+RECORDING_VERSION = 1
+HEADER_FILE = "recording.json"
+FRAMES_FILE = "frames.raw"
+TIMESTAMPS_FILE = "timestamps.raw"
+
+
+class FrameRecorder:
+    """
+    Records raw camera frames so a session can be replayed through the pipeline later.
+
+    A recording is a directory holding a json header, an append-only file of frame sets and an
+    append-only index of camera timestamps. Each frame set is written exactly as it sits in a
+    FrameRingBuffer slot, every camera side by side as uint8, so the replay can memory map the
+    file and hand out views. Frames are written before their timestamps and readers only trust
+    as many frames as there are timestamps, so a recording cut short by a crash is still usable.
+    """
+
+    def __init__(self, path, num_cameras, dimensions, camera_poses=None, to_world_coords_matrix=None):
+        width, height = dimensions
+        os.makedirs(path)
+        header = {
+            "version": RECORDING_VERSION,
+            "num_cameras": num_cameras,
+            "width": width,
+            "height": height,
+            # The calibration at the time, replays start with it but can be recalibrated
+            "camera_poses": camera_poses,
+            "to_world_coords_matrix": (
+                np.asarray(to_world_coords_matrix).tolist() if to_world_coords_matrix is not None else None
+            )
+        }
+        with open(os.path.join(path, HEADER_FILE), "w") as header_file:
+            json.dump(header, header_file)
+
+        self.path = path
+        self.num_frames = 0
+        self.frames_file = open(os.path.join(path, FRAMES_FILE), "ab")
+        self.timestamps_file = open(os.path.join(path, TIMESTAMPS_FILE), "ab")
+
+    def write(self, frames, timestamps):
+        """
+        Appends a frame set, frames being every camera side by side in one contiguous array
+        such as a FrameRingBuffer view.
+        """
+        self.frames_file.write(np.ascontiguousarray(frames).data)
+        self.timestamps_file.write(np.asarray(timestamps, dtype=np.float64).tobytes())
+        self.num_frames += 1
+
+    def end(self):
+        self.frames_file.close()
+        self.timestamps_file.close()
+
+
+def read_recording(path):
+    """
+    Memory maps a recording, returns its header, the frame sets as a read only
+    (frames, height, width * num_cameras, 3) array and the (frames, num_cameras) timestamps.
+    """
+    with open(os.path.join(path, HEADER_FILE)) as header_file:
+        header = json.load(header_file)
+    if header["version"] != RECORDING_VERSION:
+        raise ValueError(f"Unsupported recording version {header['version']}")
+
+    num_cameras = header["num_cameras"]
+    frame_shape = (header["height"], header["width"] * num_cameras, 3)
+    timestamps = np.fromfile(os.path.join(path, TIMESTAMPS_FILE), dtype=np.float64)
+    timestamps = timestamps[:len(timestamps) // num_cameras * num_cameras].reshape(-1, num_cameras)
+
+    frames_path = os.path.join(path, FRAMES_FILE)
+    num_frames = min(len(timestamps), os.path.getsize(frames_path) // int(np.prod(frame_shape)))
+    if num_frames == 0:
+        raise ValueError(f"Recording {path} has no frames")
+    frames = np.memmap(frames_path, dtype=np.uint8, mode="r", shape=(num_frames,) + frame_shape)
+    return header, frames, timestamps[:num_frames]
@@ -0,0 +1,82 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+DEFAULT_SLOTS = 8
+
+
+class FrameRingBuffer:
+    """
+    A preallocated ring of frame slots backed by shared memory.
+
+    Each slot holds one frame from every camera side by side, so the stacked preview is a view
+    of a slot and a single camera is a column slice of it, neither needs a copy. Slots carry a
+    sequence number and the camera timestamps. A reader holds on to a sequence number and should
+    check it is still valid once it is done with a view, as the slot is reused when the ring wraps.
+
+    Only the process that created the buffer tracks sequence numbers, worker processes attach
+    by name and are told which slot to use.
+    """
+
+    def __init__(self, num_cameras, dimensions, num_slots=DEFAULT_SLOTS, name=None):
+        width, height = dimensions
+        self.num_cameras = num_cameras
+        self.num_slots = num_slots
+        self.width = width
+        self.shape = (num_slots, height, width * num_cameras, 3)
+
+        self.is_owner = name is None
+        if self.is_owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)))
+        else:
+            # The owner unlinks the memory, so don't let this process's resource tracker do it
+            self.memory = shared_memory.SharedMemory(name=name, track=False)
+        self.name = self.memory.name
+        self.frames = np.ndarray(self.shape, dtype=np.uint8, buffer=self.memory.buf)
+
+        self.sequence_numbers = np.full(num_slots, -1, dtype=np.int64)
+        self.timestamps = np.zeros((num_slots, num_cameras), dtype=np.float64)
+        self.next_sequence_number = 0
+
+    def slot(self, sequence_number):
+        return sequence_number % self.num_slots
+
+    def claim(self):
+        """
+        Reserves the next slot for writing and returns its sequence number. The slot is marked
+        invalid until it is committed so readers of the frame it used to hold can tell.
+        """
+        sequence_number = self.next_sequence_number
+        self.next_sequence_number += 1
+        self.sequence_numbers[self.slot(sequence_number)] = -1
+        return sequence_number
+
+    def commit(self, sequence_number, timestamps=None):
+        slot = self.slot(sequence_number)
+        if timestamps is not None:
+            self.timestamps[slot] = timestamps
+        self.sequence_numbers[slot] = sequence_number
+
+    def write(self, frames, timestamps):
+        sequence_number = self.claim()
+        for camera_view, frame in zip(self.camera_views(sequence_number), frames):
+            np.copyto(camera_view, frame)
+        self.commit(sequence_number, timestamps)
+        return sequence_number
+
+    def is_valid(self, sequence_number):
+        return sequence_number >= 0 and self.sequence_numbers[self.slot(sequence_number)] == sequence_number
+
+    def view(self, sequence_number, camera=None):
+        frame = self.frames[self.slot(sequence_number)]
+        if camera is None:
+            return frame
+        return frame[:, camera * self.width:(camera + 1) * self.width]
+
+    def camera_views(self, sequence_number):
+        return [self.view(sequence_number, camera) for camera in range(0, self.num_cameras)]
+
+    def end(self):
+        self.frames = None
+        self.memory.close()
+        if self.is_owner:
+            self.memory.unlink()
@@ -13,9 +13,10 @@ class KalmanFilter:
         self.prev_measurement_time = 0
         self.prev_positions = []
 
-        self.low_pass_filter_xy = []
-        self.low_pass_filter_z = []
-        self.heading_low_pass_filter = []
+        # One filter smooths every object's velocity and heading, a row per object
+        self.low_pass_filter = LowPassFilter(
+            cutoff_frequency=20, sampling_frequency=60.0, shape=(num_objects, 4)
+        )
         self.num_objects = num_objects
 
         for i in range(num_objects):
@@ -54,16 +55,6 @@ class KalmanFilter:
 
             self.kalmans[i].statePost = np.zeros((9, 1), dtype=np.float32)
 
-            self.low_pass_filter_xy.append(
-                LowPassFilter(cutoff_frequency=20, sampling_frequency=60.0, dims=2)
-            )
-            self.low_pass_filter_z.append(
-                LowPassFilter(cutoff_frequency=20, sampling_frequency=60.0, dims=1)
-            )
-            self.heading_low_pass_filter.append(
-                LowPassFilter(cutoff_frequency=20, sampling_frequency=60.0, dims=1)
-            )
-
     def predict_location(self, objects):
         res = []
 
@@ -106,12 +97,11 @@ class KalmanFilter:
             predicted_state = kalman.statePre[:6].T[0]  # Predicted 3D location
 
             heading = possible_new_objects[closest_match_i]["heading"]
-            heading = self.heading_low_pass_filter[drone_index].filter(heading)[0]
-            # heading, self.z = signal.lfilter(self.b, 1, [heading], zi=self.z)
-
-            vel = predicted_state[3:6].copy()
-            vel[0:2] = self.low_pass_filter_xy[drone_index].filter(vel[0:2])
-            vel[2] = self.low_pass_filter_z[drone_index].filter(vel[2])[0]
+            filtered = self.low_pass_filter.filter(
+                (*predicted_state[3:6], heading), index=drone_index
+            )
+            vel = filtered[:3].astype(np.float32)
+            heading = float(filtered[3])
 
             res.append(
                 {
@@ -130,3 +120,4 @@ class KalmanFilter:
         for i, kalman in enumerate(self.kalmans):
             kalman.statePost = np.zeros((9, 1), dtype=np.float32)
             self.prev_positions[i] = np.array([0, 0, 0])
+        self.low_pass_filter.reset()
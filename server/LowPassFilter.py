@@ -1,34 +1,68 @@
 import numpy as np
-from scipy.signal import butter, lfilter
+from scipy.signal import butter
 
 
 class LowPassFilter:
+    """
+    Streaming butterworth low pass filter, one sample in and one out per call.
 
-    def __init__(
-        self, cutoff_frequency, sampling_frequency, dims, order=5, buffer_size=300
-    ):
+    The filter runs as second-order sections in transposed direct form II and keeps each
+    section's state between calls, so every sample costs the same and nothing is allocated
+    while filtering. shape is the shape of one sample, e.g. (num_objects, dims), so a single
+    filter can smooth many objects and dimensions together. Passing index to filter steps just
+    that row, for objects that were not all seen in the same frame.
+
+    The state starts at zero, the same as running lfilter over the history without zi.
+    """
+
+    def __init__(self, cutoff_frequency, sampling_frequency, shape, order=5):
         self.sampling_frequency = sampling_frequency
         self.cutoff_frequency = cutoff_frequency
         self.order = order
-        self.dims = dims
-        self.buffer_size = buffer_size
-        self.buffered_data = np.empty((0, dims))
-        self.b, self.a = butter(
+        self.shape = (shape,) if np.isscalar(shape) else tuple(shape)
+        self.sos = butter(
             self.order,
             self.cutoff_frequency / (self.sampling_frequency / 2),
             btype="low",
+            output="sos",
         )
+        # Two delay values per section for every element of a sample
+        self.state = np.zeros((len(self.sos), 2) + self.shape)
+        # Scratch buffers reused by every call
+        self.input = np.zeros(self.shape)
+        self.output = np.zeros(self.shape)
+        self.scratch = np.zeros(self.shape)
 
-    def filter(self, data):
-        self.buffered_data = np.vstack((self.buffered_data, data[np.newaxis]))
-
-        filtered_data = np.apply_along_axis(
-            lambda x: lfilter(self.b, self.a, x), axis=0, arr=self.buffered_data
-        )
+    def filter(self, data, index=None):
+        """
+        Filters the next sample and returns the filtered value. With index only that row of the
+        sample is filtered and returned. The returned array is reused by the next call, copy it to
+        keep it.
+        """
+        if index is None:
+            x, y, scratch, state = self.input, self.output, self.scratch, self.state
+        else:
+            x, y, scratch = self.input[index], self.output[index], self.scratch[index]
+            state = self.state[:, :, index]
 
-        if self.buffered_data.shape[0] >= self.buffer_size:
-            self.buffered_data = self.buffered_data[
-                -self.buffer_size // 2 :
-            ]  # Keep the last half of the buffered data for the next filtering iteration
+        np.copyto(x, data)
+        for section, (b0, b1, b2, _, a1, a2) in enumerate(self.sos):
+            z0, z1 = state[section, 0], state[section, 1]
+            # y = b0 x + z0
+            np.multiply(x, b0, out=y)
+            y += z0
+            # z0 = b1 x - a1 y + z1
+            np.multiply(x, b1, out=z0)
+            np.multiply(y, a1, out=scratch)
+            z0 -= scratch
+            z0 += z1
+            # z1 = b2 x - a2 y
+            np.multiply(x, b2, out=z1)
+            np.multiply(y, a2, out=scratch)
+            z1 -= scratch
+            # this section's output feeds the next
+            np.copyto(x, y)
+        return y
 
-        return filtered_data[-1]
+    def reset(self):
+        self.state[:] = 0
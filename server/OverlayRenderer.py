@@ -0,0 +1,70 @@
+import time
+import cv2 as cv
+from helpers import drawlines
+
+DEFAULT_PREVIEW_FPS = 30
+
+
+class OverlayRenderer:
+    """
+    Draws the tracking annotations onto frames that have been picked for the preview.
+
+    Tracking frames carry their contours, image points and epipolar lines as data, drawing only
+    happens here and only at the preview rate, so the tracking loop never pays for it.
+    """
+
+    def __init__(self, preview_fps=DEFAULT_PREVIEW_FPS):
+        self.preview_fps = preview_fps
+        self.show_contours = True
+        self.show_centroids = True
+        self.show_labels = True
+        self.show_epipolar_lines = True
+        self.last_render_time = 0
+
+    def update_settings(self, preview_fps, show_contours, show_centroids, show_labels, show_epipolar_lines):
+        self.preview_fps = max(preview_fps, 1)
+        self.show_contours = show_contours
+        self.show_centroids = show_centroids
+        self.show_labels = show_labels
+        self.show_epipolar_lines = show_epipolar_lines
+
+    def is_due(self):
+        """
+        Returns True when enough time has passed since the last preview frame, and claims
+        the current frame for the preview.
+        """
+        now = time.time()
+        if now - self.last_render_time < 1 / self.preview_fps:
+            return False
+        self.last_render_time = now
+        return True
+
+    def render(self, frames, contours, image_points, epipolar_lines):
+        for i in range(0, len(frames)):
+            if self.show_contours and i < len(contours):
+                frames[i] = cv.drawContours(frames[i], contours[i], -1, (0, 255, 0), 1)
+            if self.show_epipolar_lines and i < len(epipolar_lines):
+                frames[i] = drawlines(frames[i], epipolar_lines[i])
+            if i < len(image_points):
+                frames[i] = self._draw_points(frames[i], image_points[i])
+        return frames
+
+    def _draw_points(self, img, image_points):
+        for center_x, center_y in image_points:
+            if center_x is None:
+                continue
+            center_x_int = int(center_x)
+            center_y_int = int(center_y)
+            if self.show_labels:
+                cv.putText(
+                    img,
+                    f"({center_x_int}, {center_y_int})",
+                    (center_x_int, center_y_int - 15),
+                    cv.FONT_HERSHEY_SIMPLEX,
+                    0.3,
+                    (100, 255, 100),
+                    1,
+                )
+            if self.show_centroids:
+                cv.circle(img, (center_x_int, center_y_int), 1, (100, 255, 100), -1)
+        return img
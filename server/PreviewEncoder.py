@@ -0,0 +1,108 @@
+import time
+import threading
+import cv2 as cv
+
+DEFAULT_STREAM_FPS = 30
+DEFAULT_STREAM_SCALE = 1
+DEFAULT_JPEG_QUALITY = 80
+
+
+class PreviewEncoderSettings:
+    """
+    Stream settings shared by every preview encoder, changes apply from the next frame.
+    """
+
+    def __init__(self, fps=DEFAULT_STREAM_FPS, scale=DEFAULT_STREAM_SCALE, quality=DEFAULT_JPEG_QUALITY):
+        self.update(fps, scale, quality)
+
+    def update(self, fps, scale, quality):
+        self.fps = max(fps, 1)
+        self.scale = min(max(scale, 0.1), 1)
+        self.quality = min(max(int(quality), 1), 100)
+
+
+class PreviewEncoder:
+    """
+    JPEG encodes the frames from a FrameSubscription on its own thread for one stream viewer.
+
+    A frame is only encoded once the viewer has taken the last one, so while a frame is still
+    being sent nothing is encoded and a viewer on a slow link gets fewer, fresher frames rather
+    than a backlog. fps, scale and quality override the shared settings for this viewer.
+    Use it as a context manager, it closes the subscription when done.
+    """
+
+    def __init__(self, subscription, settings, fps=None, scale=None, quality=None):
+        self.subscription = subscription
+        self.settings = settings
+        self.fps = fps
+        self.scale = scale
+        self.quality = quality
+
+        self._jpeg = None
+        self._is_running = True
+        self._was_taken = threading.Event()
+        self._was_taken.set()
+        self._was_encoded = threading.Event()
+        self._thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self._thread.start()
+
+    def get(self, timeout=1):
+        """
+        Blocks until the next frame is encoded and returns it, or None on timeout. Calling get
+        again is what tells the encoder the previous frame has been sent.
+        """
+        self._was_taken.set()
+        if not self._was_encoded.wait(timeout):
+            return None
+        self._was_encoded.clear()
+        jpeg = self._jpeg
+        self._jpeg = None
+        return jpeg
+
+    def is_running(self):
+        return self._is_running and self._thread.is_alive()
+
+    def _encode_loop(self):
+        last_encode_time = 0
+        while self._is_running:
+            if not self._was_taken.wait(1):
+                continue
+            fps = self.fps or self.settings.fps
+            delay = last_encode_time + 1 / fps - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            frame = self.subscription.get()
+            if frame is None:
+                continue
+            last_encode_time = time.time()
+            jpeg = self._encode(frame)
+            if jpeg is None:
+                continue
+
+            self._was_taken.clear()
+            self._jpeg = jpeg
+            self._was_encoded.set()
+
+    def _encode(self, frame):
+        scale = self.scale or self.settings.scale
+        quality = self.quality or self.settings.quality
+        if scale != 1:
+            frame = cv.resize(frame, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+        jpeg = cv.imencode(".jpg", frame, [cv.IMWRITE_JPEG_QUALITY, quality])[1]
+        if not self.subscription.is_valid():
+            # the ring buffer slot was reused while encoding
+            return None
+        return jpeg.tobytes()
+
+    def close(self):
+        self._is_running = False
+        self._was_taken.set()
+        self._thread.join()
+        self.subscription.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,56 @@
+import time
+import numpy as np
+from CameraSource import CameraSource, SourceFinished
+from FrameRecorder import read_recording
+
+
+class ReplayCameraSource(CameraSource):
+    """
+    Plays a FrameRecorder recording back as if it were the cameras.
+
+    speed 1 paces frames to their original timestamps, 2 plays twice as fast and 0 as fast
+    as the pipeline can take them. Timestamps are passed through untouched so output lines up
+    with the original session. Once the recording runs out read raises SourceFinished unless loop is set.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        header, self.frames, self.timestamps = read_recording(path)
+        self.num_cameras = header["num_cameras"]
+        super().__init__()
+        self.width = header["width"]
+        self.camera_poses = header["camera_poses"]
+        if header["to_world_coords_matrix"] is not None:
+            self.to_world_coords_matrix = np.array(header["to_world_coords_matrix"])
+
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.num_frames = len(self.frames)
+        self.frame_number = 0
+        self.start_time = None
+        self.start_timestamp = None
+
+    def read(self, squeeze=False):
+        if self.frame_number >= self.num_frames:
+            if not self.loop:
+                raise SourceFinished(f"End of recording {self.path}")
+            self.frame_number = 0
+            self.start_time = None
+
+        timestamps = self.timestamps[self.frame_number]
+        frame_timestamp = np.mean(timestamps)
+        if self.start_time is None:
+            self.start_time = time.time()
+            self.start_timestamp = frame_timestamp
+        if self.speed > 0:
+            delay = self.start_time + (frame_timestamp - self.start_timestamp) / self.speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        frame_set = self.frames[self.frame_number]
+        self.frame_number += 1
+        frames = [frame_set[:, i * self.width:(i + 1) * self.width] for i in range(0, self.num_cameras)]
+        timestamps = timestamps.tolist()
+        if squeeze and self.num_cameras == 1:
+            return frames[0], timestamps[0]
+        return frames, timestamps
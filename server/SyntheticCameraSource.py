@@ -0,0 +1,221 @@
+import time
+import numpy as np
+import cv2 as cv
+from settings import intrinsic_matrices, distortion_coefs
+from CameraSource import CameraSource
+from helpers import distort_points
+
+DEFAULT_FPS = 125
+# Frame size for Camera.RES_SMALL
+FRAME_DIMENSIONS = (320, 240)
+# Blobs are drawn with 4 fractional bits so their centroids land between pixels
+SUBPIXEL_SHIFT = 4
+MIN_BLOB_RADIUS = 1.5
+NOISE_FRAMES = 8
+
+
+def look_at_pose(position, target, up=(0, 0, 1)):
+    """
+    World to camera pose for a camera at position pointing at target, in the opencv camera
+    convention (x right, y down, z forward).
+    """
+    position = np.asarray(position, dtype=np.float64)
+    forward = np.asarray(target, dtype=np.float64) - position
+    forward /= np.linalg.norm(forward)
+    right = np.cross(forward, up)
+    right /= np.linalg.norm(right)
+    down = np.cross(forward, right)
+    R = np.array([right, down, forward])
+    return {"R": R, "t": -R @ position}
+
+def ring_camera_poses(num_cameras, radius=2.5, height=2.0, target=(0, 0, 0)):
+    """
+    Cameras spaced evenly on a ring above the origin all looking at target, like a rig around a tank.
+    """
+    poses = []
+    for i in range(0, num_cameras):
+        angle = 2 * np.pi * i / num_cameras
+        position = (radius * np.cos(angle), radius * np.sin(angle), height)
+        poses.append(look_at_pose(position, target))
+    return poses
+
+def static_markers(points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    return lambda t: points
+
+def rigid_body_trajectory(
+    marker_offsets=((-0.0655, 0, 0), (0.0655, 0, 0)),
+    radius=0.3,
+    period=8.0,
+    wave_height=0.05,
+    wave_period=1.5,
+    center=(0, 0, 0.1)
+):
+    """
+    Markers fixed to a body that circles center once a period, turning to face along its path,
+    while heaving up and down on a wave. The default markers are the drone's in rigid_bodies.DEFAULT_TEMPLATES.
+    """
+    marker_offsets = np.asarray(marker_offsets, dtype=np.float64)
+    center = np.asarray(center, dtype=np.float64)
+
+    def trajectory(t):
+        angle = 2 * np.pi * t / period
+        heading = angle + np.pi / 2
+        rotation = np.array([
+            [np.cos(heading), -np.sin(heading), 0],
+            [np.sin(heading), np.cos(heading), 0],
+            [0, 0, 1]
+        ])
+        position = center + [
+            radius * np.cos(angle),
+            radius * np.sin(angle),
+            wave_height * np.sin(2 * np.pi * t / wave_period)
+        ]
+        return marker_offsets @ rotation.T + position
+
+    return trajectory
+
+
+class SyntheticCameraSource(CameraSource):
+    """
+    Renders IR style blobs for markers following a trajectory, as seen by a simulated rig.
+
+    Each marker is projected through the intrinsics, distortion and pose of each camera at that
+    camera's own timestamp, so the free running, unsynchronised capture of real cameras comes
+    through. Frames carry sensor noise, blob centres jitter and markers drop out of individual
+    cameras for a few frames at a time.
+
+    trajectory is a function of the time in seconds since the source started returning an
+    (N, 3) array of marker positions in world coordinates (z up). camera_world_poses are world
+    to camera poses, camera_poses and to_world_coords_matrix give the same rig in the form
+    MocapSystem calibrates to, relative to the first camera.
+
+    With realtime set, read blocks until the next frame is due like real cameras do, otherwise
+    frames are produced as fast as they are asked for with timestamps still spaced at fps.
+    """
+
+    def __init__(
+        self,
+        fps=DEFAULT_FPS,
+        intrinsic_matrices=intrinsic_matrices,
+        distortion_coefs=distortion_coefs,
+        camera_world_poses=None,
+        trajectory=None,
+        dimensions=FRAME_DIMENSIONS,
+        realtime=True,
+        marker_radius=0.015,
+        position_noise=0.1,
+        image_noise=4,
+        timestamp_jitter=0.0005,
+        occlusion_probability=0.002,
+        occlusion_frames=10,
+        seed=None
+    ):
+        self.num_cameras = len(intrinsic_matrices)
+        super().__init__()
+        self.exposure = [50] * self.num_cameras
+        self.gain = [1] * self.num_cameras
+
+        self.fps = fps
+        self.intrinsic_matrices = [np.asarray(K, dtype=np.float64) for K in intrinsic_matrices]
+        self.distortion_coefs = [np.asarray(d, dtype=np.float64) for d in distortion_coefs]
+        if camera_world_poses is None:
+            camera_world_poses = ring_camera_poses(self.num_cameras)
+        self.camera_world_poses = [
+            {"R": np.asarray(pose["R"], dtype=np.float64), "t": np.asarray(pose["t"], dtype=np.float64).flatten()}
+            for pose in camera_world_poses
+        ]
+        self.trajectory = trajectory if trajectory is not None else rigid_body_trajectory()
+        self.dimensions = dimensions
+        self.realtime = realtime
+        self.marker_radius = marker_radius
+        self.position_noise = position_noise
+        self.timestamp_jitter = timestamp_jitter
+        self.occlusion_probability = occlusion_probability
+        self.occlusion_frames = occlusion_frames
+        self.rng = np.random.default_rng(seed)
+
+        # Drawing noise for every frame would cost more than the rest of the frame put together
+        width, height = dimensions
+        self.noise_frames = np.repeat(
+            np.abs(self.rng.normal(0, image_noise, (NOISE_FRAMES, height, width, 1))).clip(0, 255).astype(np.uint8),
+            3,
+            axis=3
+        )
+
+        # Poses relative to the first camera and the matrix taking that frame back to world
+        R0 = self.camera_world_poses[0]["R"]
+        t0 = self.camera_world_poses[0]["t"]
+        self.camera_poses = []
+        for pose in self.camera_world_poses:
+            R = pose["R"] @ R0.T
+            self.camera_poses.append({"R": R.tolist(), "t": (pose["t"] - R @ t0).tolist()})
+        self.to_world_coords_matrix = np.eye(4)
+        self.to_world_coords_matrix[:3, :3] = R0.T
+        self.to_world_coords_matrix[:3, 3] = -R0.T @ t0
+
+        self.occluded = None
+        self.marker_positions = None
+        self.frame_number = 0
+        self.start_time = time.time()
+
+    def read(self, squeeze=False):
+        self.frame_number += 1
+        frame_time = self.start_time + self.frame_number / self.fps
+        if self.realtime:
+            delay = frame_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        timestamps = frame_time + self.rng.normal(0, self.timestamp_jitter, self.num_cameras)
+        camera_object_points = [self.trajectory(timestamp - self.start_time) for timestamp in timestamps]
+        self._update_occlusions(len(camera_object_points[0]))
+        frames = [self._render(i, object_points) for i, object_points in enumerate(camera_object_points)]
+        # Ground truth for the middle of the frame, for checking what gets triangulated
+        self.marker_positions = self.trajectory(frame_time - self.start_time)
+
+        timestamps = timestamps.tolist()
+        if squeeze and self.num_cameras == 1:
+            return frames[0], timestamps[0]
+        return frames, timestamps
+
+    def _update_occlusions(self, num_markers):
+        if self.occluded is None or self.occluded.shape[1] != num_markers:
+            self.occluded = np.zeros((self.num_cameras, num_markers), dtype=bool)
+            return
+        # Occlusions start at random and last occlusion_frames on average
+        changes = self.rng.random(self.occluded.shape)
+        starting = ~self.occluded & (changes < self.occlusion_probability)
+        ending = self.occluded & (changes < 1 / self.occlusion_frames)
+        self.occluded ^= starting | ending
+
+    def _render(self, camera, object_points):
+        width, height = self.dimensions
+        frame = self.noise_frames[self.rng.integers(NOISE_FRAMES)].copy()
+
+        pose = self.camera_world_poses[camera]
+        K = self.intrinsic_matrices[camera]
+        camera_points = object_points @ pose["R"].T + pose["t"]
+        depths = camera_points[:, 2]
+        in_front = (depths > 0.05) & ~self.occluded[camera]
+        if not np.any(in_front):
+            return frame
+
+        ideal_points = (camera_points[in_front, :2] / depths[in_front, np.newaxis]) * [K[0, 0], K[1, 1]] + K[:2, 2]
+        # Far outside the image the distortion polynomial folds back in, so cull before distorting
+        margin = 0.1 * width
+        in_view = (
+            (ideal_points[:, 0] > -margin) & (ideal_points[:, 0] < width + margin)
+            & (ideal_points[:, 1] > -margin) & (ideal_points[:, 1] < height + margin)
+        )
+        image_points = distort_points(ideal_points[in_view], K, self.distortion_coefs[camera])
+        image_points += self.rng.normal(0, self.position_noise, image_points.shape)
+        radii = np.maximum(K[0, 0] * self.marker_radius / depths[in_front][in_view], MIN_BLOB_RADIUS)
+
+        scale = 1 << SUBPIXEL_SHIFT
+        for (x, y), radius in zip(image_points, radii):
+            center = (int(round(x * scale)), int(round(y * scale)))
+            # dim halo then a saturated core, like an IR LED through the PSEye's filter
+            cv.circle(frame, center, int(radius * 1.8 * scale), (90, 90, 90), -1, cv.LINE_AA, SUBPIXEL_SHIFT)
+            cv.circle(frame, center, int(radius * scale), (255, 255, 255), -1, cv.LINE_AA, SUBPIXEL_SHIFT)
+        return frame
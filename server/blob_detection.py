@@ -0,0 +1,187 @@
+import numpy as np
+import cv2 as cv
+
+# Both detectors return an (N, 7) float array of dots with these columns
+DOT_X = 0
+DOT_Y = 1
+DOT_AREA = 2
+DOT_LEFT = 3
+DOT_TOP = 4
+DOT_WIDTH = 5
+DOT_HEIGHT = 6
+DOT_COLUMNS = 7
+
+# Blobs smaller than this are hot pixels and noise rather than markers. The contour detector
+# never reported them as their m00 is 0. Also the default in CameraSettings.tsx
+DEFAULT_MIN_DOT_AREA = 3
+
+# These are also used in CameraSettings.tsx in the front end, keep them in sync
+class Detectors():
+    Contours = "contours"
+    Components = "components"
+
+def dot_circularity(dots):
+    """
+    How close each dot is to a solid disc, 1 for a disc and smaller for elongated or ragged blobs.
+    Uses how much of its bounding ellipse the blob fills, scaled by the aspect ratio of its bounding
+    box, as connected component stats don't include a perimeter.
+    """
+    widths = dots[:, DOT_WIDTH]
+    heights = dots[:, DOT_HEIGHT]
+    fill = 4 * dots[:, DOT_AREA] / (np.pi * widths * heights)
+    aspect = np.minimum(widths, heights) / np.maximum(widths, heights)
+    return np.minimum(fill, 1) * aspect
+
+def dots_mask(dots, min_area, max_area, min_circularity):
+    mask = (dots[:, DOT_AREA] >= min_area) & (dots[:, DOT_AREA] <= max_area)
+    if min_circularity > 0:
+        mask &= dot_circularity(dots) >= min_circularity
+    return mask
+
+def find_dots_components(binary, min_area=DEFAULT_MIN_DOT_AREA, max_area=np.inf, min_circularity=0):
+    """
+    Finds every blob in a thresholded image with a single connected components pass.
+
+    Returns the dots array, no Python level work is done per blob.
+    """
+    # Grana's block based labelling is several times faster than the default on sparse IR frames
+    _, _, stats, centroids = cv.connectedComponentsWithStatsWithAlgorithm(binary, 8, cv.CV_32S, cv.CCL_GRANA)
+    # label 0 is the background
+    dots = np.hstack((
+        centroids[1:],
+        stats[1:, [cv.CC_STAT_AREA, cv.CC_STAT_LEFT, cv.CC_STAT_TOP, cv.CC_STAT_WIDTH, cv.CC_STAT_HEIGHT]]
+    ))
+
+    if min_area <= 0 and max_area == np.inf and min_circularity <= 0:
+        return dots
+    return dots[dots_mask(dots, min_area, max_area, min_circularity)]
+
+def find_dots_contours(binary):
+    """
+    Finds every blob in a thresholded image from its external contour, this is the original
+    detector and does no filtering.
+
+    Returns the dots array and the matching contours so they can be drawn on previews.
+    """
+    contours, _ = cv.findContours(binary, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_NONE)
+
+    dots = []
+    kept_contours = []
+    for contour in contours:
+        moments = cv.moments(contour)
+        if moments["m00"] != 0:
+            left, top, width, height = cv.boundingRect(contour)
+            dots.append([
+                moments["m10"] / moments["m00"],
+                moments["m01"] / moments["m00"],
+                moments["m00"],
+                left,
+                top,
+                width,
+                height
+            ])
+            kept_contours.append(contour)
+
+    return np.array(dots, dtype=np.float64).reshape(-1, DOT_COLUMNS), kept_contours
+
+def detect_dots(img, threshold, detector=Detectors.Components, min_area=DEFAULT_MIN_DOT_AREA, max_area=np.inf, min_circularity=0):
+    """
+    Thresholds a colour frame and runs the chosen detector on it.
+
+    Returns the contours (only found by the contour detector) and the dots array.
+    """
+    grey = cv.cvtColor(img, cv.COLOR_RGB2GRAY)
+    grey = cv.threshold(grey, 255 * threshold, 255, cv.THRESH_BINARY)[1]
+
+    contours = []
+    if detector == Detectors.Contours:
+        dots, contours = find_dots_contours(grey)
+    else:
+        dots = find_dots_components(grey, min_area, max_area, min_circularity)
+
+    return contours, dots
+
+def find_dots(img, threshold, detector=Detectors.Components, min_area=DEFAULT_MIN_DOT_AREA, max_area=np.inf, min_circularity=0):
+    """
+    Returns the contours (only found by the contour detector) and an (N, 2) array of centroids.
+    """
+    contours, dots = detect_dots(img, threshold, detector, min_area, max_area, min_circularity)
+    return contours, dots[:, DOT_X:DOT_Y + 1]
+
+def merge_windows(centers, radius, width, height):
+    """
+    Turns expected dot positions into square search windows clipped to the image, merging any
+    that overlap. Returns a list of [left, top, right, bottom, number of expected dots].
+    """
+    windows = [
+        [
+            max(int(x) - radius, 0),
+            max(int(y) - radius, 0),
+            min(int(x) + radius + 1, width),
+            min(int(y) + radius + 1, height),
+            1
+        ]
+        for x, y in centers
+    ]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(0, len(windows)):
+            for j in range(i + 1, len(windows)):
+                a = windows[i]
+                b = windows[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    windows[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]), a[4] + b[4]]
+                    del windows[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [window for window in windows if window[0] < window[2] and window[1] < window[3]]
+
+def find_dots_in_windows(img, centers, radius, threshold, detector=Detectors.Components, min_area=DEFAULT_MIN_DOT_AREA, max_area=np.inf, min_circularity=0):
+    """
+    Runs the detector only inside windows around where dots are expected to be.
+
+    Returns the contours and an (N, 2) array of centroids in full image coordinates, or None
+    when a window has fewer dots than expected or a dot is cut off by a window edge, in which
+    case the caller should fall back to searching the whole frame.
+    """
+    height, width = img.shape[:2]
+    all_contours = []
+    all_dots = []
+    for left, top, right, bottom, expected in merge_windows(centers, radius, width, height):
+        contours, dots = detect_dots(
+            img[top:bottom, left:right], threshold, detector, min_area, max_area, min_circularity
+        )
+        if len(dots) < expected:
+            return None
+        # A dot touching an edge of the window that isn't an edge of the image may be cut off
+        near = dots[:, DOT_LEFT:DOT_TOP + 1]
+        far = near + dots[:, DOT_WIDTH:DOT_HEIGHT + 1]
+        if (
+            (left > 0 and near[:, 0].min() == 0)
+            or (top > 0 and near[:, 1].min() == 0)
+            or (right < width and far[:, 0].max() >= right - left)
+            or (bottom < height and far[:, 1].max() >= bottom - top)
+        ):
+            return None
+        dots[:, DOT_X] += left
+        dots[:, DOT_Y] += top
+        all_dots.append(dots[:, DOT_X:DOT_Y + 1])
+        all_contours += [contour + np.array([left, top], dtype=np.int32) for contour in contours]
+
+    if len(all_dots) == 0:
+        return None
+    return all_contours, np.concatenate(all_dots)
+
+def find_dots_around(img, centers, radius, threshold, detector=Detectors.Components, min_area=DEFAULT_MIN_DOT_AREA, max_area=np.inf, min_circularity=0):
+    """
+    Searches the windows around the expected dot positions, falling back to the whole frame
+    when there are none or a dot has gone missing from its window.
+    """
+    if centers is not None and len(centers) > 0:
+        found = find_dots_in_windows(img, centers, radius, threshold, detector, min_area, max_area, min_circularity)
+        if found is not None:
+            return found
+    return find_dots(img, threshold, detector, min_area, max_area, min_circularity)
@@ -1 +1,23 @@
-ADVANCED_BA = True
\ No newline at end of file
+import os
+
+ADVANCED_BA = True
+# Run the per camera image stage in a worker process per camera
+CAMERA_WORKER_POOL = False
+# Where frames come from, one of CameraSources in CameraSource.py. Set the WECCAP_CAMERA_SOURCE
+# environment variable to "synthetic" to run the whole system without cameras
+CAMERA_SOURCE = os.environ.get("WECCAP_CAMERA_SOURCE", "pseye")
+# Recording played back by the replay camera source and how fast, 1 is the original pace and
+# 0 is as fast as frames can be processed
+REPLAY_RECORDING = os.environ.get("WECCAP_REPLAY_RECORDING")
+REPLAY_SPEED = float(os.environ.get("WECCAP_REPLAY_SPEED", 1))
+# Intrinsics written by scripts/generate_intrinsics.py, used in place of the values in
+# settings.py for the cameras it covers when the file exists
+INTRINSICS_PROFILE = os.environ.get(
+    "WECCAP_INTRINSICS_PROFILE", os.path.join(os.path.dirname(__file__), "intrinsics.json")
+)
+# Calibration profile loaded on start, a name in the calibration_profiles folder or a path to a
+# .npz, so the server can track straight away without waiting for the UI to send poses. Without
+# it the "default" profile is loaded, unless the camera source knows its own poses (a synthetic
+# rig or a recording's header), which a profile set here overrides. Profiles only supply the poses
+# and to-world matrix, intrinsics always come from INTRINSICS_PROFILE or settings.py
+CALIBRATION_PROFILE = os.environ.get("WECCAP_CALIBRATION_PROFILE")
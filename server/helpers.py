@@ -1,10 +1,10 @@
 import numpy as np
 import json
-from scipy import linalg, optimize
+from scipy import optimize, sparse
 import cv2 as cv
 from scipy.spatial.transform import Rotation
-import copy
-from sfm import fundamental_from_projections 
+import itertools
+from sfm import fundamental_from_projections, essential_from_fundamental, motion_from_essential
 
 class NumpyEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -12,334 +12,384 @@ class NumpyEncoder(json.JSONEncoder):
             return obj.tolist()
         return super().default(obj)
 
-def calculate_reprojection_errors(image_points, object_points, camera_poses, intrinsic_matrices):
-    errors = np.array([])
-    for image_points_i, object_point in zip(image_points, object_points):
-        error = calculate_reprojection_error(image_points_i, object_point, camera_poses, intrinsic_matrices)
-        if error is None:
-            continue
-        errors = np.concatenate([errors, [error]])
-
-    return errors
+def reprojection_errors(image_points, object_points, projection_matrices):
+    # Projects every object point into every camera at once. Returns the (N, num_cameras, 2)
+    # residuals (NaN where a camera did not see the point), the mean squared error of each point
+    # (NaN for points seen by fewer than two cameras) and the mean squared error of each camera
+    image_points = image_points_to_array(image_points)
+    num_cameras = image_points.shape[1]
+    if len(image_points) == 0:
+        return image_points, np.empty(0), np.full(num_cameras, np.nan)
 
+    residuals = project_points(object_points, projection_matrices) - image_points
+    squared_errors = residuals**2
+    visible = ~np.any(np.isnan(image_points), axis=2)
+    triangulated = np.sum(visible, axis=1) > 1
 
-def calculate_reprojection_error(image_points, object_point, camera_poses, intrinsic_matrices):
-    image_points = np.array(image_points)
-    none_indicies = np.where(np.all(image_points == None, axis=1))[0]
-    image_points = np.delete(image_points, none_indicies, axis=0)
-    camera_poses = np.delete(camera_poses, none_indicies, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        point_errors = np.nansum(squared_errors, axis=(1, 2)) / (2 * np.sum(visible, axis=1))
+        point_errors[~triangulated] = np.nan
 
-    if len(image_points) <= 1:
-        return None
+        camera_observations = visible & triangulated[:, np.newaxis]
+        camera_squared_errors = np.where(camera_observations[:, :, np.newaxis], squared_errors, 0)
+        camera_errors = np.sum(camera_squared_errors, axis=(0, 2)) / (2 * np.sum(camera_observations, axis=0))
 
-    image_points_t = image_points.transpose((0, 1))
+    return residuals, point_errors, camera_errors
 
-    errors = np.array([])
-    for i in range(0, len(image_points)):
-        camera_pose = camera_poses[i]
-        if np.all(image_points[i] == None, axis=0):
-            continue
-        projected_img_points, _ = cv.projectPoints(
-            np.expand_dims(object_point, axis=0).astype(np.float32),
-            np.array(camera_pose["R"], dtype=np.float64),
-            np.array(camera_pose["t"], dtype=np.float64),
-            intrinsic_matrices[i],
-            np.array([]),
-        )
-        projected_img_point = projected_img_points[:, 0, :][0]
-        errors = np.concatenate(
-            [errors, (image_points_t[i] - projected_img_point).flatten() ** 2]
-        )
+def calculate_reprojection_errors(image_points, object_points, projection_matrices):
+    # Mean squared reprojection error of every point that could be triangulated
+    _, point_errors, _ = reprojection_errors(image_points, object_points, projection_matrices)
+    return point_errors[~np.isnan(point_errors)]
 
-    return errors.mean()
 
+# Smallest f_scale in pixels a robust bundle adjustment pass picks for itself, so a near perfect
+# linear solve doesn't turn every observation into an outlier
+ROBUST_F_SCALE_MIN = 0.5
 
 # https://www.cs.jhu.edu/~misha/ReadingSeminar/Papers/Triggs00.pdf
-def bundle_adjustment(image_points, intrinsic_matrices, distortion_coefs, camera_poses):
-    num_cameras = len(intrinsic_matrices)
+# https://scipy-cookbook.readthedocs.io/items/bundle_adjustment.html
+
+def bundle_adjustment(image_points, intrinsic_matrices, distortion_coefs, camera_poses, loss="linear", f_scale=None, max_nfev=200, verbose=2, progress=None):
+    """
+    Refines the camera poses and the 3D points together by minimising the pixel reprojection error
+    of every observation. The first camera stays fixed as it defines the coordinate frame. Each
+    residual only depends on one camera and one point, so the jacobian is given to the solver as a
+    sparsity structure.
+
+    A robust loss makes outlying observations count for less, but started far from the answer it
+    stalls with every observation treated as an outlier. So any loss other than linear refines the
+    result of a linear solve, with f_scale (in pixels) taken from the spread of the linear
+    residuals unless given.
+
+    If given, progress is called with the number of residual evaluations so far and the sum of
+    squared residuals halved, whenever an evaluation improves on the best cost of the current solve.
+    Evaluations that don't, such as the finite difference probes for the jacobian, are not reported.
+    """
+    num_cameras = len(camera_poses)
     section_size = 6
+    intrinsic_matrices = np.asarray(intrinsic_matrices[:num_cameras], dtype=np.float64)
+
+    # Points seen by at least two cameras, triangulated with the starting poses
+    observations = image_points_to_array(image_points)
+    object_points = triangulate_points(observations, camera_poses_to_projection_matrices(camera_poses, intrinsic_matrices))
+    usable = np.all(np.isfinite(object_points), axis=1)
+    observations = observations[usable]
+    object_points = object_points[usable]
+    num_points = len(object_points)
+
+    point_indices, camera_indices = np.nonzero(~np.any(np.isnan(observations), axis=2))
+    observed = observations[point_indices, camera_indices]
 
     # function to turn params back into data structures
     def parse_params(params):
-        new_poses = []
-        for i in range(0, num_cameras):
-            section_boundary = i * section_size
-            new_poses.append(
-                {
-                    "R": Rotation.as_matrix(
-                        Rotation.from_rotvec(params[section_boundary  : section_boundary + 3])
-                    ),
-                    "t": params[section_boundary + 3 : section_boundary + 3 + 3],
-                }
-            )
-
-        return new_poses
+        camera_params = np.vstack((
+            np.concatenate((
+                Rotation.from_matrix(np.asarray(camera_poses[0]["R"], dtype=np.float64)).as_rotvec(),
+                np.asarray(camera_poses[0]["t"], dtype=np.float64).flatten()
+            )),
+            params[: (num_cameras - 1) * section_size].reshape(-1, section_size)
+        ))
+        points = params[(num_cameras - 1) * section_size :].reshape(num_points, 3)
+        return camera_params, points
 
     # residual function
-    def residual_function(params, image_points):
-        parsed_poses = parse_params(params)
-        new_projection_matrices = camera_poses_to_projection_matrices(parsed_poses, intrinsic_matrices)
-        object_points = triangulate_points(image_points, new_projection_matrices)
-        return calculate_reprojection_errors(
-            image_points, object_points, parsed_poses, intrinsic_matrices
-        )
+    evaluations = 0
+    best_cost = np.inf
+    def residual_function(params):
+        nonlocal evaluations, best_cost
+        camera_params, points = parse_params(params)
+        rotations = Rotation.from_rotvec(camera_params[camera_indices, :3])
+        camera_points = rotations.apply(points[point_indices]) + camera_params[camera_indices, 3:]
+        projected = np.einsum("nij,nj->ni", intrinsic_matrices[camera_indices], camera_points)
+        residuals = (projected[:, :2] / projected[:, 2:] - observed).ravel()
+        evaluations += 1
+        if progress is not None:
+            cost = 0.5 * np.sum(residuals**2)
+            if cost < best_cost:
+                best_cost = cost
+                progress(evaluations, cost)
+        return residuals
+
+    # Observation n gives rows 2n and 2n + 1, which depend on its camera's section (unless it is
+    # the fixed first camera) and on its point's three coordinates
+    num_params = (num_cameras - 1) * section_size + num_points * 3
+    jac_sparsity = sparse.lil_matrix((len(observed) * 2, num_params), dtype=int)
+    rows = np.arange(len(observed))
+    free_camera = camera_indices > 0
+    for i in range(section_size):
+        for row in (2 * rows[free_camera], 2 * rows[free_camera] + 1):
+            jac_sparsity[row, (camera_indices[free_camera] - 1) * section_size + i] = 1
+    for i in range(3):
+        for row in (2 * rows, 2 * rows + 1):
+            jac_sparsity[row, (num_cameras - 1) * section_size + point_indices * 3 + i] = 1
 
     # build initial params
-    # rotation_vector, translation_vector, intrinsics, distortion_coef
+    # rotation_vector, translation_vector for every camera but the first, then the points
     params = []
-    for i in range(0, num_cameras):
+    for i in range(1, num_cameras):
         camera_pose = camera_poses[i]
         rot_vec = Rotation.as_rotvec(Rotation.from_matrix(camera_pose["R"])).flatten()
         trans_vec = np.array(camera_pose["t"]).flatten()
         section = rot_vec.tolist() + trans_vec.tolist()
         params = params + section
-    dimensions = (320, 240)
-    optimal_matrices = []
-    for i in range(0, num_cameras):
-        opt, _ = cv.getOptimalNewCameraMatrix(intrinsic_matrices[i], distortion_coefs[i], dimensions, 1, dimensions)
-        optimal_matrices.append(opt)
-
-    res = optimize.least_squares(
-        residual_function,
-        params,
-        max_nfev=1000,
-        jac='3-point',
-        x_scale='jac',
-        verbose=2,
-        method='dogbox',
-        loss="linear",
-        ftol=1e-15,
-        xtol=None,
-        f_scale=1,
-        args=[image_points]
-    )
-    return parse_params(res.x)
-    
-
-def triangulate_point(image_points, projection_matrices):
-    image_points = np.array(image_points)
-    Ps = np.array(projection_matrices)
-    none_indicies = np.where(np.all(image_points == None, axis=1))[0]
-    image_points = np.delete(image_points, none_indicies, axis=0)
-    Ps = np.delete(Ps, none_indicies, axis=0)
-
-    if len(image_points) <= 1:
-        return [None, None, None]
+    params = np.concatenate((params, object_points.ravel()))
+
+    def solve(params, loss, f_scale):
+        nonlocal best_cost
+        # The robust refine starts from the linear result, its progress is tracked afresh
+        best_cost = np.inf
+        return optimize.least_squares(
+            residual_function,
+            params,
+            jac_sparsity=jac_sparsity,
+            x_scale="jac",
+            verbose=verbose,
+            method="trf",
+            loss=loss,
+            f_scale=f_scale,
+            max_nfev=max_nfev
+        )
 
-    object_point = DLT(Ps, image_points)
+    res = solve(params, "linear", 1.0)
+    if loss != "linear":
+        if f_scale is None:
+            # Three robust standard deviations, estimated from the median absolute residual
+            f_scale = max(3 * 1.4826 * np.median(np.abs(res.fun)), ROBUST_F_SCALE_MIN)
+        res = solve(res.x, loss, f_scale)
 
-    return object_point
+    camera_params, _ = parse_params(res.x)
+    return [
+        {"R": Rotation.from_rotvec(camera_param[:3]).as_matrix(), "t": camera_param[3:]}
+        for camera_param in camera_params
+    ]
 
-def triangulate_points(image_points, projection_matrices):
-    object_points = []
-    for image_points_i in image_points:
-        object_point = triangulate_point(image_points_i, projection_matrices)
-        object_points.append(object_point)
+def initial_camera_poses(image_points, intrinsic_matrices):
+    """
+    Rough camera poses, relative to the first camera, chained from the fundamental matrix between
+    each pair of neighbouring cameras. They are a starting point for bundle_adjustment. Raises a
+    ValueError if a pair of cameras doesn't share enough points.
+    """
+    image_points = image_points_to_array(image_points)
+    image_points_t = image_points.transpose((1, 0, 2))
+
+    camera_poses = [{"R": np.eye(3), "t": np.array([[0], [0], [0]], dtype=np.float32)}]
+    for camera_i in range(0, image_points.shape[1] - 1):
+        camera1_image_points = image_points_t[camera_i]
+        camera2_image_points = image_points_t[camera_i + 1]
+        not_none_indicies = np.where(
+            ~np.any(np.isnan(camera1_image_points), axis=1)
+            & ~np.any(np.isnan(camera2_image_points), axis=1)
+        )[0]
+        camera1_image_points = np.take(
+            camera1_image_points, not_none_indicies, axis=0
+        ).astype(np.float32)
+        camera2_image_points = np.take(
+            camera2_image_points, not_none_indicies, axis=0
+        ).astype(np.float32)
+
+        F, _ = cv.findFundamentalMat(
+            camera1_image_points, camera2_image_points, cv.FM_RANSAC, 3, 0.99999
+        )
+        if F is None:
+            raise ValueError("Could not compute fundamental matrix")
+        E = essential_from_fundamental(
+            F,
+            intrinsic_matrices[camera_i],
+            intrinsic_matrices[camera_i+1]
+        )
+        possible_Rs, possible_ts = motion_from_essential(E)
+
+        R = None
+        t = None
+        max_points_infront_of_camera = 0
+        for i in range(0, 4):
+            object_points = triangulate_points(
+                np.hstack(
+                    [
+                        np.expand_dims(camera1_image_points, axis=1),
+                        np.expand_dims(camera2_image_points, axis=1),
+                    ]
+                ),
+                camera_poses_to_projection_matrices(np.concatenate(
+                    [[camera_poses[-1]], [{"R": possible_Rs[i], "t": possible_ts[i]}]]
+                ), [
+                        intrinsic_matrices[camera_i],
+                        intrinsic_matrices[camera_i+1]
+                    ]),
+            )
+            object_points_camera_coordinate_frame = np.array(
+                [possible_Rs[i].T @ object_point for object_point in object_points]
+            )
 
-    return np.array(object_points)
+            points_infront_of_camera = np.sum(object_points[:, 2] > 0) + np.sum(
+                object_points_camera_coordinate_frame[:, 2] > 0
+            )
 
-# https://temugeb.github.io/computer_vision/2021/02/06/direct-linear-transorms.html
-def DLT(Ps, image_points):
-    A = []
+            if points_infront_of_camera > max_points_infront_of_camera:
+                max_points_infront_of_camera = points_infront_of_camera
+                R = possible_Rs[i]
+                t = possible_ts[i]
 
-    for P, image_point in zip(Ps, image_points):
-        A.append(image_point[1] * P[2, :] - P[1, :])
-        A.append(P[0, :] - image_point[0] * P[2, :])
+        R = R @ camera_poses[-1]["R"]
+        t = camera_poses[-1]["t"] + (camera_poses[-1]["R"] @ t)
 
-    A = np.array(A).reshape((len(Ps) * 2, 4))
-    B = A.transpose() @ A
+        camera_poses.append({"R": R, "t": t})
 
-    _, _, Vh = linalg.svd(B, full_matrices=False)
+    return camera_poses
 
-    object_point = Vh[3, 0:3] / Vh[3, 3]
+def image_points_to_array(image_points):
+    # Packs nested per-camera image points into a float (N, num_cameras, 2) array, cameras that
+    # did not see a point ([None, None]) become NaN
+    image_points = np.asarray(image_points, dtype=np.float64)
+    return image_points.reshape(-1, image_points.shape[-2], 2)
 
-    return object_point
+def triangulate_points(image_points, projection_matrices):
+    # Object points that fewer than two cameras saw come back as NaN
+    if len(image_points) == 0:
+        return np.empty((0, 3))
+    return DLT(projection_matrices, image_points_to_array(image_points))
 
-def find_point_correspondance_and_object_points(image_points, camera_poses, intrinsic_matrices, projection_matrices, frames=None):
+# https://temugeb.github.io/computer_vision/2021/02/06/direct-linear-transorms.html
+def DLT(Ps, image_points):
+    # Solves every point at once. image_points is (N, num_cameras, 2) with NaN for cameras that
+    # did not see a point, their rows of A are zeroed so they drop out of A^T A
+    Ps = np.asarray(Ps, dtype=np.float64)
+    image_points = np.asarray(image_points, dtype=np.float64)
+    visible = ~np.any(np.isnan(image_points), axis=2)
+    image_points = np.where(visible[:, :, np.newaxis], image_points, 0)
+
+    x = image_points[:, :, 0, np.newaxis]
+    y = image_points[:, :, 1, np.newaxis]
+    A = np.stack((y * Ps[:, 2] - Ps[:, 1], Ps[:, 0] - x * Ps[:, 2]), axis=2)
+    A *= visible[:, :, np.newaxis, np.newaxis]
+    A = A.reshape(len(image_points), -1, 4)
+    B = np.swapaxes(A, 1, 2) @ A
+
+    # B is symmetric, its eigenvector with the smallest eigenvalue is the last row of Vh from
+    # an SVD of B
+    _, eigenvectors = np.linalg.eigh(B)
+    solution = eigenvectors[:, :, 0]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        object_points = solution[:, 0:3] / solution[:, 3:]
+    object_points[np.sum(visible, axis=1) <= 1] = np.nan
+
+    return object_points
+
+# Pixel distance from an epipolar line within which two points may be the same marker
+EPIPOLAR_DISTANCE_THRESHOLD = 5
+# Matches kept for each root point in each other camera, the globally assigned one first
+MAX_CANDIDATES_PER_CAMERA = 2
+# Hard cap on the camera combinations triangulated for any one root point
+MAX_HYPOTHESES_PER_POINT = 16
+
+def epipolar_distances(points_a, points_b, fundamental_matrix):
+    # (len(points_a), len(points_b)) distances of each point in b from the epipolar line of each point in a
+    lines = epipolar_lines_for_points(points_a, fundamental_matrix)
+    points_b_homogeneous = np.hstack((points_b, np.ones((len(points_b), 1))))
+    return np.abs(lines @ points_b_homogeneous.T)
+
+def find_point_correspondance_and_object_points(image_points, projection_matrices, fundamental_matrices=None):
     for image_points_i in image_points:
         try:
             image_points_i.remove([None, None])
         except:
             pass
-    # use whatever camera has the most points visible as the root to reduce chances of losing a point
-    # root_camera_index = max(range(len(image_points)), key=lambda i: len(image_points[i]))
-    root_camera_index = 0
-    # [object_points, possible image_point groups, image_point from camera]
-    correspondances = [[[i]] for i in image_points[root_camera_index]]
-
-    Ps = projection_matrices
-
-    root_image_points = [{"camera": root_camera_index, "point": point} for point in image_points[root_camera_index]]
-    num_cams = len(camera_poses)
-    for offset in range(num_cams - 1):
-        i = (root_camera_index + 1 + offset) % num_cams
-        epipolar_lines = []
-        for root_image_point in root_image_points:
-            F = fundamental_from_projections(Ps[root_image_point["camera"]], Ps[i])
-            line = cv.computeCorrespondEpilines(
-                np.array([root_image_point["point"]], dtype=np.float32), 1, F
-            )
-            epipolar_lines.append(line[0, 0].tolist())
-            if frames:
-                frames[i] = drawlines(frames[i], line[0])
-
-        not_closest_match_image_points = np.array(image_points[i])
-        points = np.array(image_points[i])
-
-        for j, [a, b, c] in enumerate(epipolar_lines):
-            distances_to_line = np.array([])
-            if len(points) != 0:
-                distances_to_line = np.abs(
-                    a * points[:, 0] + b * points[:, 1] + c
-                ) / np.sqrt(a**2 + b**2)
-
-            possible_matches = points[distances_to_line < 5].copy()
-
-            # sort possible matches from smallest to largest
-            distances_to_line = distances_to_line[distances_to_line < 5]
-            possible_matches_sorter = distances_to_line.argsort()
-            possible_matches = possible_matches[possible_matches_sorter]
-
-            if len(possible_matches) == 0:
-                for possible_group in correspondances[j]:
-                    possible_group.append([None, None])
-            else:
-                not_closest_match_image_points = [
-                    row
-                    for row in not_closest_match_image_points.tolist()
-                    if row != possible_matches.tolist()[0]
-                ]
-                not_closest_match_image_points = np.array(
-                    not_closest_match_image_points
-                )
-
-                new_correspondances_j = []
-                for possible_match in possible_matches:
-                    temp = copy.deepcopy(correspondances[j])
-                    for possible_group in temp:
-                        possible_group.append(possible_match.tolist())
-                    new_correspondances_j += temp
-                correspondances[j] = new_correspondances_j
+    if fundamental_matrices is None:
+        fundamental_matrices = camera_fundamental_matrices(projection_matrices)
 
-    object_points = []
-    errors = []
-
-    for image_points in correspondances:
-        object_points_i = triangulate_points(image_points, Ps)
-
-        if np.all(object_points_i == None):
+    num_cams = len(projection_matrices)
+    points = [np.asarray(image_points_i, dtype=np.float64).reshape(-1, 2) for image_points_i in image_points[:num_cams]]
+    # use whatever camera has the most points visible as the root to reduce chances of losing a point
+    root_camera_index = max(range(num_cams), key=lambda i: len(points[i]))
+    root_points = points[root_camera_index]
+    num_root_points = len(root_points)
+    # kept so the overlay renderer can draw them on preview frames
+    camera_epipolar_lines = [[] for _ in range(num_cams)]
+    if num_root_points == 0:
+        return np.array([]), np.empty((0, 3)), camera_epipolar_lines
+
+    # candidate_options[i][r] lists the indexes of points in camera i that might match root point r,
+    # -1 stands for camera i not seeing it
+    other_cameras = [i for i in range(num_cams) if i != root_camera_index]
+    candidate_options = {}
+    for i in other_cameras:
+        F = fundamental_matrices[root_camera_index][i]
+        camera_epipolar_lines[i] = epipolar_lines_for_points(root_points, F).tolist()
+        if len(points[i]) == 0:
+            candidate_options[i] = [[-1]] * num_root_points
             continue
 
-        errors_i = calculate_reprojection_errors(
-            image_points, object_points_i, camera_poses, intrinsic_matrices
-        )
-
-        object_points.append(object_points_i[np.argmin(errors_i)])
-        errors.append(np.min(errors_i))
-
-    return np.array(errors), np.array(object_points), frames
-
-def locate_objects(object_points, errors):
-    dist = 0.131
-    dist1 = 0.089
-    dist2 = 0.133
+        # symmetric epipolar distance so neither camera's lines dominate the cost
+        costs = (
+            epipolar_distances(root_points, points[i], F)
+            + epipolar_distances(points[i], root_points, fundamental_matrices[i][root_camera_index]).T
+        ) / 2
+        gated = costs < EPIPOLAR_DISTANCE_THRESHOLD
+
+        # one-to-one assignment across every root point at once
+        assigned = np.full(num_root_points, -1)
+        rows, cols = optimize.linear_sum_assignment(np.where(gated, costs, EPIPOLAR_DISTANCE_THRESHOLD * 1e3))
+        matched = gated[rows, cols]
+        assigned[rows[matched]] = cols[matched]
+
+        options = []
+        for r in range(num_root_points):
+            alternatives = [j for j in np.argsort(costs[r]) if gated[r, j] and j != assigned[r]]
+            options.append(([assigned[r]] + alternatives)[:MAX_CANDIDATES_PER_CAMERA])
+        candidate_options[i] = options
+
+    # every hypothesis is one candidate (or none) per camera, bounded per root point
+    hypotheses = []
+    hypothesis_roots = []
+    for r in range(num_root_points):
+        combinations = itertools.product(*[candidate_options[i][r] for i in other_cameras])
+        for combination in itertools.islice(combinations, MAX_HYPOTHESES_PER_POINT):
+            hypotheses.append(combination)
+            hypothesis_roots.append(r)
+    hypotheses = np.array(hypotheses, dtype=np.int64).reshape(len(hypothesis_roots), len(other_cameras))
+    hypothesis_roots = np.array(hypothesis_roots)
+
+    hypothesis_points = np.full((len(hypotheses), num_cams, 2), np.nan)
+    hypothesis_points[:, root_camera_index] = root_points[hypothesis_roots]
+    for k, i in enumerate(other_cameras):
+        seen = hypotheses[:, k] >= 0
+        hypothesis_points[seen, i] = points[i][hypotheses[seen, k]]
+
+    # every non-root pair in a hypothesis has to agree with its own epipolar geometry too
+    consistent = np.ones(len(hypotheses), dtype=bool)
+    for a, b in itertools.combinations(other_cameras, 2):
+        both_seen = ~np.isnan(hypothesis_points[:, a, 0]) & ~np.isnan(hypothesis_points[:, b, 0])
+        if not np.any(both_seen):
+            continue
+        lines = epipolar_lines_for_points(hypothesis_points[both_seen, a], fundamental_matrices[a][b])
+        distances = np.abs(np.sum(lines[:, :2] * hypothesis_points[both_seen, b], axis=1) + lines[:, 2])
+        consistent[np.flatnonzero(both_seen)[distances >= EPIPOLAR_DISTANCE_THRESHOLD]] = False
 
-    distance_matrix = np.zeros((object_points.shape[0], object_points.shape[0]))
-    already_matched_points = []
-    objects = []
+    object_points_h = triangulate_points(hypothesis_points, projection_matrices)
+    _, errors_h, _ = reprojection_errors(hypothesis_points, object_points_h, projection_matrices)
+    errors_h[~consistent] = np.nan
 
-    for i in range(0, object_points.shape[0]):
-        for j in range(0, object_points.shape[0]):
-            distance_matrix[i, j] = np.sqrt(
-                np.sum((object_points[i] - object_points[j]) ** 2)
-            )
-    for i in range(0, object_points.shape[0]):
-        if i in already_matched_points:
+    # greedily accept the best hypotheses overall, never reusing a point from another camera
+    solved = np.zeros(num_root_points, dtype=bool)
+    claimed = set()
+    object_points = []
+    errors = []
+    for h in np.argsort(errors_h):
+        if np.isnan(errors_h[h]):
+            break
+        r = hypothesis_roots[h]
+        if solved[r]:
+            continue
+        observations = {(i, hypotheses[h, k]) for k, i in enumerate(other_cameras) if hypotheses[h, k] >= 0}
+        if observations & claimed:
             continue
-        matches = np.abs(distance_matrix[i] - dist) < 0.025
-        if np.any(matches):
-            best_match_i = np.argmax(matches)
-
-            already_matched_points.append(i)
-            already_matched_points.append(best_match_i)
-
-            location = (object_points[i]+object_points[best_match_i])/2
-            error = np.mean([errors[i], errors[best_match_i]])
-
-            heading_vec = object_points[best_match_i] - object_points[i]
-            heading_vec /= linalg.norm(heading_vec)
-            heading = np.arctan2(heading_vec[1], heading_vec[0])
-
-            heading = heading - np.pi if heading > np.pi/2 else heading
-            heading = heading + np.pi if heading < -np.pi/2 else heading
-
-            objects.append({
-                "pos": location,
-                "heading": -heading,
-                "error": error,
-                "droneIndex": 0
-            })
-        # distance_deltas = np.abs(distance_matrix[i] - dist1)
-        # print(distance_deltas < 0.025)
-        # num_matches = distance_deltas < 0.025
-        
-        # matches_index = np.where(distance_deltas < 0.025)[0]
-        # print("----")
-        # if np.sum(num_matches) >= 2:
-        #     for possible_pair in cartesian_product(matches_index, matches_index):
-        #         pair_distance = np.sqrt(
-        #             np.sum(
-        #                 (
-        #                     object_points[possible_pair[0]]
-        #                     - object_points[possible_pair[1]]
-        #                 )
-        #                 ** 2
-        #             )
-        #         )
-        #         print(pair_distance)
-
-        #         # if the pair isnt the correct distance apart
-        #         if np.abs(pair_distance - dist2) > 0.025:
-        #             continue
-
-        #         best_match_1_i = possible_pair[0]
-        #         best_match_2_i = possible_pair[1]
-
-        #         already_matched_points.append(i)
-        #         already_matched_points.append(best_match_1_i)
-        #         already_matched_points.append(best_match_2_i)
-
-        #         location = (
-        #             object_points[best_match_1_i] + object_points[best_match_2_i]
-        #         ) / 2
-        #         error = np.mean(
-        #             [errors[i], errors[best_match_1_i], errors[best_match_2_i]]
-        #         )
-
-        #         heading_vec = (
-        #             object_points[best_match_1_i] - object_points[best_match_2_i]
-        #         )
-        #         heading_vec /= linalg.norm(heading_vec)
-        #         heading = np.arctan2(heading_vec[1], heading_vec[0])
-
-        #         heading = heading - np.pi if heading > np.pi / 2 else heading
-        #         heading = heading + np.pi if heading < -np.pi / 2 else heading
-
-        #         # determine drone index based on which side third light is on
-        #         drone_index = 0 if (object_points[i] - location)[1] > 0 else 1
-
-        #         objects.append(
-        #             {
-        #                 "pos": location,
-        #                 "heading": -heading,
-        #                 "error": error,
-        #                 "droneIndex": drone_index,
-        #             }
-        #         )
-
-        #         break
-
-    return objects
+        solved[r] = True
+        claimed |= observations
+        object_points.append(object_points_h[h])
+        errors.append(errors_h[h])
+
+    return np.array(errors), np.array(object_points).reshape(-1, 3), camera_epipolar_lines
 
 def drawlines(img1, lines):
     _, c, _ = img1.shape
@@ -354,16 +404,11 @@ def drawlines(img1, lines):
 
 # TODO - Camera poses probably deserve their own type that can be marshalled at the api boundary
 def camera_poses_to_serializable(camera_poses):
-    for i in range(0, len(camera_poses)):
-        camera_poses[i] = {k: v.tolist() for (k, v) in camera_poses[i].items()}
-
-    return camera_poses
+    # Returns new dicts, the poses passed in may belong to the published CalibrationState
+    return [{k: np.asarray(v).tolist() for (k, v) in camera_pose.items()} for camera_pose in camera_poses]
 
 def camera_pose_to_internal(serialized_camera_poses):
-    for i in range(0, len(serialized_camera_poses)):
-        serialized_camera_poses[i] = {k: np.array(v) for (k, v) in serialized_camera_poses[i].items()}
-
-    return serialized_camera_poses
+    return [{k: np.array(v) for (k, v) in camera_pose.items()} for camera_pose in serialized_camera_poses]
 
 def camera_intrinsics_to_serializable(intrinsics):
     new_intrinsics = []
@@ -379,16 +424,84 @@ def camera_distortion_to_serializable(distortion):
 
     return new_distortion    
 
-def undistort_image_points(image_points, optimal_matrices, intrinsic_matrices, distortion_coefs):
-    fixed = copy.deepcopy(image_points)
-    for i, image_point_set in enumerate(image_points):
-        for j in range(0, len(image_point_set)):
-            wrapped_point = np.array(image_point_set[j], np.float32)
-            undistorted = cv.undistortPoints(wrapped_point, intrinsic_matrices[j], np.array([distortion_coefs[j]]), np.eye(3), optimal_matrices[j])
-            fixed[i][j] = undistorted[0][0]
-    return fixed
-# Opportunity for performance improvements here. This doesn't change
-# for a given capture but is recalculated fairly deep down the run loop
+def undistort_points(points, intrinsic_matrix, distortion_coef, new_intrinsic_matrix=None):
+    # Undistorts a batch of points from a single camera in one call. Projecting back through the
+    # original intrinsics keeps the points in the same pixel space as camera_undistort_maps
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    if len(points) == 0:
+        return points.reshape(-1, 2)
+    intrinsic_matrix = np.asarray(intrinsic_matrix, dtype=np.float64)
+    if new_intrinsic_matrix is None:
+        new_intrinsic_matrix = intrinsic_matrix
+    undistorted = cv.undistortPoints(
+        points,
+        intrinsic_matrix,
+        np.asarray(distortion_coef, dtype=np.float64),
+        R=np.eye(3),
+        P=np.asarray(new_intrinsic_matrix, dtype=np.float64)
+    )
+    return undistorted.reshape(-1, 2)
+
+def distort_points(points, intrinsic_matrix, distortion_coef):
+    # Inverse of undistort_points, maps ideal pinhole pixel coordinates back onto the raw camera
+    # image using the k1, k2, p1, p2, k3 lens model
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    intrinsic_matrix = np.asarray(intrinsic_matrix, dtype=np.float64)
+    k1, k2, p1, p2, k3 = np.pad(np.asarray(distortion_coef, dtype=np.float64).flatten(), (0, 5))[:5]
+    fx, fy = intrinsic_matrix[0, 0], intrinsic_matrix[1, 1]
+    cx, cy = intrinsic_matrix[0, 2], intrinsic_matrix[1, 2]
+
+    x = (points[:, 0] - cx) / fx
+    y = (points[:, 1] - cy) / fy
+    r2 = x**2 + y**2
+    radial = 1 + k1 * r2 + k2 * r2**2 + k3 * r2**3
+    distorted_x = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x**2)
+    distorted_y = y * radial + p1 * (r2 + 2 * y**2) + 2 * p2 * x * y
+    return np.column_stack((distorted_x * fx + cx, distorted_y * fy + cy))
+
+def camera_undistort_maps(intrinsic_matrices, distortion_coefs, dimensions):
+    # Fixed point maps are what cv.undistort builds internally on every call, building them
+    # once lets the run loop use a plain cv.remap
+    maps = []
+    for intrinsic_matrix, distortion_coef in zip(intrinsic_matrices, distortion_coefs):
+        intrinsic_matrix = np.asarray(intrinsic_matrix, dtype=np.float64)
+        map1, map2 = cv.initUndistortRectifyMap(
+            intrinsic_matrix,
+            np.asarray(distortion_coef, dtype=np.float64),
+            None,
+            intrinsic_matrix,
+            dimensions,
+            cv.CV_16SC2
+        )
+        maps.append((map1, map2))
+    return maps
+
+def project_points(object_points, projection_matrices):
+    # Projects (N, 3) object points into every camera at once, returns (N, num_cameras, 2)
+    object_points = np.asarray(object_points, dtype=np.float64).reshape(-1, 3)
+    Ps = np.asarray(projection_matrices, dtype=np.float64)
+    object_points_homogeneous = np.hstack((object_points, np.ones((len(object_points), 1))))
+    projected = np.einsum("cij,nj->nci", Ps, object_points_homogeneous)
+    return projected[:, :, :2] / projected[:, :, 2:]
+
+def camera_fundamental_matrices(projection_matrices):
+    # F[i][j] maps a point seen by camera i to its epipolar line in camera j, it does not change
+    # until the cameras are recalibrated
+    Ps = np.asarray(projection_matrices, dtype=np.float64)
+    num_cameras = len(Ps)
+    fundamental_matrices = np.zeros((num_cameras, num_cameras, 3, 3))
+    for i in range(num_cameras):
+        for j in range(num_cameras):
+            if i != j:
+                fundamental_matrices[i, j] = fundamental_from_projections(Ps[i], Ps[j])
+    return fundamental_matrices
+
+def epipolar_lines_for_points(points, fundamental_matrix):
+    # Same lines as cv.computeCorrespondEpilines, normalised so a^2 + b^2 = 1, for a whole batch
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    lines = np.hstack((points, np.ones((len(points), 1)))) @ np.asarray(fundamental_matrix).T
+    return lines / np.linalg.norm(lines[:, :2], axis=1, keepdims=True)
+
 def camera_poses_to_projection_matrices(camera_poses, intrinsic_matrices):
     Ps = []
     for i, camera_pose in enumerate(camera_poses):
@@ -1,31 +1,24 @@
-import time
-import json
-import cv2 as cv
 import numpy as np
-from scipy import linalg
 
 
 from flask import Flask, Response, request
 from flask_socketio import SocketIO
 from flask_cors import CORS
 
-from sfm import essential_from_fundamental, motion_from_essential
-from mocap_system import MocapSystem
+from mocap_system import MocapSystem, UndistortModes, FRAME_DIMENSIONS
+from PreviewEncoder import PreviewEncoder
+from CalibrationJobRunner import CalibrationJobRunner, CalibrationJobs
+from CalibrationSampleBuffer import select_samples
 from helpers import (
     camera_intrinsics_to_serializable,
     camera_distortion_to_serializable,
     camera_poses_to_serializable,
-    camera_pose_to_internal,
-    camera_poses_to_projection_matrices,
     calculate_reprojection_errors,
-    bundle_adjustment,
+    project_points,
     triangulate_points,
-    NumpyEncoder,
-    undistort_image_points,
     align_plane_to_axis
 )
 
-from settings import intrinsic_matrices
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
@@ -39,34 +32,34 @@ def camera_stream(random):
         print("is none")
     else:
         camera = int(camera)
+    # Optional per viewer overrides of the stream settings, e.g. for a slow remote link
+    fps = request.args.get("fps", type=float)
+    scale = request.args.get("scale", type=float)
+    quality = request.args.get("quality", type=int)
     mocapSystem = MocapSystem.instance()
     mocapSystem.set_socketio(socketio)
 
-    def gen(mocapSystem, camera):
-        last_frame_time = 0
-        frame_size = 20
-        i = 0
-
-        while True:
-            time_now = time.time()
-
-            i = (i + 1) % frame_size
-            if i == 0:
-                fps_frame_average = (time_now - last_frame_time)/frame_size
-                socketio.emit("fps", {"fps": round(1 / fps_frame_average)})
-                last_frame_time = time.time()
-
-            frames = mocapSystem.get_frames(camera)
-            jpeg_frame = cv.imencode(".jpg", frames)[1].tobytes()
-
-            yield (
-                b"--frame\r\n"
-                b"Content-Type: image/jpeg\r\n\r\n" + jpeg_frame + b"\r\n"
-            )
-
-    return Response(
-        gen(mocapSystem, camera), mimetype="multipart/x-mixed-replace; boundary=frame"
+    def gen(encoder):
+        # Leaving the with block when the client disconnects stops the encoder and drops the subscription
+        with encoder:
+            while True:
+                # get waits on the encoder for up to a second, so no frames does not spin here
+                jpeg_frame = encoder.get()
+                if jpeg_frame is None:
+                    if not encoder.is_running():
+                        # the encoder thread died, end the response rather than wait forever
+                        return
+                    continue
+
+                yield (
+                    b"--frame\r\n"
+                    b"Content-Type: image/jpeg\r\n\r\n" + jpeg_frame + b"\r\n"
+                )
+
+    encoder = PreviewEncoder(
+        mocapSystem.subscribe_frames(camera), mocapSystem.preview_encoder_settings, fps, scale, quality
     )
+    return Response(gen(encoder), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 @app.route("/api/camera_state")
 def camera_state():
@@ -100,7 +93,7 @@ def acquire_floor(data):
     print(f"Normal of the plane after applying new matrix: {np.round(new_plane_normal, 5)}")
     print("This should be close to [0, 0, -1] or [0, 0, 1].")
 
-    mocapSystem.to_world_coords_matrix = aligned_to_world_matrix 
+    mocapSystem.set_to_world_coords_matrix(aligned_to_world_matrix)
     wrapped_points = []
     for item in new_world_points.tolist():
         wrapped_points.append([item])
@@ -124,7 +117,7 @@ def set_origin(data):
     transform_matrix[:3, 3] = -object_point
 
     to_world_coords_matrix = transform_matrix @ to_world_coords_matrix
-    mocapSystem.to_world_coords_matrix = to_world_coords_matrix
+    mocapSystem.set_to_world_coords_matrix(to_world_coords_matrix)
 
     socketio.emit(
         "to-world-coords-matrix",
@@ -141,34 +134,49 @@ def change_camera_settings(data):
 def change_point_settings(data):
     mocapSystem = MocapSystem.instance()
     mocapSystem.contour_threshold = data["contourThreshold"]
-
-@socketio.on("calculate-bundle-adjustment")
-def calculate_bundle_adjustment(data):
+    mocapSystem.undistort_mode = UndistortModes.Points if data["undistortPoints"] else UndistortModes.Image
+    mocapSystem.dot_detector = data["dotDetector"]
+    mocapSystem.min_dot_area = data["minDotArea"]
+    mocapSystem.max_dot_area = data["maxDotArea"] if data["maxDotArea"] > 0 else np.inf
+    mocapSystem.min_dot_circularity = data["minDotCircularity"]
+    mocapSystem.roi_search = data["roiSearch"]
+    mocapSystem.roi_window_radius = data["roiWindowRadius"]
+
+@socketio.on("update-preview-settings")
+def change_preview_settings(data):
     mocapSystem = MocapSystem.instance()
-    image_points = np.array(data["cameraPoints"])
-    new_poses = bundle_adjustment(image_points, mocapSystem.intrinsic_matrices, mocapSystem.distortion_coefs, mocapSystem.camera_poses) 
+    mocapSystem.overlay_renderer.update_settings(
+        data["previewFps"],
+        data["showContours"],
+        data["showCentroids"],
+        data["showLabels"],
+        data["showEpipolarLines"]
+    )
+    mocapSystem.preview_encoder_settings.update(
+        data["streamFps"],
+        data["streamScale"],
+        data["streamQuality"]
+    )
+
+def calibration_started(job_id, kind):
+    socketio.emit("calibration-job", {"jobId": job_id, "kind": kind, "status": "started"})
+
+def calibration_progress(job_id, evaluations, cost):
+    socketio.emit("calibration-progress", {"jobId": job_id, "evaluations": evaluations, "cost": cost})
 
+def calibration_finished(job_id, kind, new_poses, image_points):
+    # Swapped in whole, tracking never sees a half published calibration
+    mocapSystem = MocapSystem.instance()
     mocapSystem.set_camera_poses(new_poses)
     object_points = triangulate_points(image_points, mocapSystem.projection_matrices)
     error = np.mean(
-        calculate_reprojection_errors(image_points, object_points, mocapSystem.camera_poses, mocapSystem.intrinsic_matrices)
+        calculate_reprojection_errors(image_points, object_points, mocapSystem.projection_matrices)
     )
     print(f"New pose computed, average reprojection error: {error}")
 
-    reprojected_points = []
-    for object_point in object_points:
-        reprojected_point = []
-        for i, camera_pose in enumerate(mocapSystem.camera_poses):
-            projected_img_points, _ = cv.projectPoints(
-                np.expand_dims(object_point, axis=0).astype(np.float32),
-                np.array(camera_pose["R"], dtype=np.float64),
-                np.array(camera_pose["t"], dtype=np.float64),
-                mocapSystem.intrinsic_matrices[i],
-                np.array([]),
-            )
-            reprojected_point.append(projected_img_points[0][0].tolist())
-        reprojected_points.append(reprojected_point)
-    
+    reprojected_points = project_points(object_points, mocapSystem.projection_matrices).tolist()
+
+    socketio.emit("calibration-job", {"jobId": job_id, "kind": kind, "status": "finished"})
     socketio.emit(
         "camera-pose", {
             "camera_poses": camera_poses_to_serializable(mocapSystem.camera_poses),
@@ -179,110 +187,114 @@ def calculate_bundle_adjustment(data):
         },
     )
 
+def calibration_error(job_id, message):
+    socketio.emit("calibration-job", {"jobId": job_id, "status": "failed"})
+    socketio.emit("error", message)
+
+def calibration_cancelled(job_id):
+    socketio.emit("calibration-job", {"jobId": job_id, "status": "cancelled"})
+
+calibration_jobs = CalibrationJobRunner(
+    calibration_started, calibration_progress, calibration_finished, calibration_error, calibration_cancelled
+)
+
+def start_calibration_job(kind, image_points, camera_poses=None):
+    mocapSystem = MocapSystem.instance()
+    # Solve on a bounded, well spread subset, the error is still reported over every sample
+    selected, coverage = select_samples(image_points, FRAME_DIMENSIONS)
+    print(f"Solving with {len(selected)} of {len(image_points)} calibration samples")
+    socketio.emit("calibration-coverage", {"samples": len(selected), "coverage": coverage})
+    calibration_jobs.start(
+        kind, image_points, mocapSystem.intrinsic_matrices, mocapSystem.distortion_coefs, camera_poses, selected
+    )
+
+@socketio.on("calculate-bundle-adjustment")
+def calculate_bundle_adjustment():
+    mocapSystem = MocapSystem.instance()
+    image_points = mocapSystem.calibration_samples.samples()
+    if len(image_points) == 0:
+        # The UI is already waiting on a job, tell it none is coming
+        socketio.emit("calibration-job", {"jobId": None, "status": "failed"})
+        socketio.emit("error", "No calibration samples captured")
+        return
+    start_calibration_job(CalibrationJobs.BundleAdjustment, image_points, mocapSystem.camera_poses)
+
 @socketio.on("calculate-camera-pose")
-def calculate_camera_pose(data):
+def calculate_camera_pose():
+    mocapSystem = MocapSystem.instance()
+    image_points = mocapSystem.calibration_samples.samples()
+    if len(image_points) == 0:
+        # The UI is already waiting on a job, tell it none is coming
+        socketio.emit("calibration-job", {"jobId": None, "status": "failed"})
+        socketio.emit("error", "No calibration samples captured")
+        return
+    start_calibration_job(CalibrationJobs.CameraPose, image_points)
+
+@socketio.on("start-calibration-capture")
+def start_calibration_capture(data):
+    mocapSystem = MocapSystem.instance()
+    mocapSystem.start_calibration_capture(data["continuous"])
+
+@socketio.on("stop-calibration-capture")
+def stop_calibration_capture():
     mocapSystem = MocapSystem.instance()
-    image_points = np.array(data["cameraPoints"])
-
-    image_points_t = image_points.transpose((1, 0, 2))
-
-    camera_poses = [{"R": np.eye(3), "t": np.array([[0], [0], [0]], dtype=np.float32)}]
-    for camera_i in range(0, mocapSystem.num_cameras - 1):
-        camera1_image_points = image_points_t[camera_i]
-        camera2_image_points = image_points_t[camera_i + 1]
-        not_none_indicies = np.where(
-            np.all(camera1_image_points != None, axis=1)
-            & np.all(camera2_image_points != None, axis=1)
-        )[0]
-        camera1_image_points = np.take(
-            camera1_image_points, not_none_indicies, axis=0
-        ).astype(np.float32)
-        camera2_image_points = np.take(
-            camera2_image_points, not_none_indicies, axis=0
-        ).astype(np.float32)
-
-        F, _ = cv.findFundamentalMat(
-            camera1_image_points, camera2_image_points, cv.FM_RANSAC, 3, 0.99999
+    mocapSystem.stop_calibration_capture()
+
+@socketio.on("clear-calibration-samples")
+def clear_calibration_samples():
+    mocapSystem = MocapSystem.instance()
+    mocapSystem.clear_calibration_samples()
+
+@socketio.on("save-calibration-samples")
+def save_calibration_samples(data):
+    mocapSystem = MocapSystem.instance()
+    mocapSystem.save_calibration_samples(data["name"])
+
+@socketio.on("load-calibration-samples")
+def load_calibration_samples(data):
+    mocapSystem = MocapSystem.instance()
+    try:
+        mocapSystem.load_calibration_samples(data["name"])
+    except (OSError, ValueError) as e:
+        socketio.emit("error", f"Could not load calibration samples: {e}")
+
+@socketio.on("save-calibration-profile")
+def save_calibration_profile(data):
+    mocapSystem = MocapSystem.instance()
+    mocapSystem.save_calibration_profile(data["name"])
+    socketio.emit("calibration-profiles", mocapSystem.calibration_profiles())
+
+@socketio.on("load-calibration-profile")
+def load_calibration_profile(data):
+    mocapSystem = MocapSystem.instance()
+    try:
+        mocapSystem.load_calibration_profile(data["name"])
+    except (OSError, KeyError, ValueError) as e:
+        socketio.emit("error", f"Could not load calibration profile: {e}")
+        return
+
+    if mocapSystem.camera_poses is not None:
+        socketio.emit(
+            "camera-pose", {
+                "camera_poses": camera_poses_to_serializable(mocapSystem.camera_poses),
+                "intrinsic_matrices": camera_intrinsics_to_serializable(mocapSystem.intrinsic_matrices),
+                "distortion_coefs": camera_distortion_to_serializable(mocapSystem.distortion_coefs)
+            },
         )
-        if F is None:
-            socketio.emit("error", "Could not compute fundamental matrix")
-            return
-        E = essential_from_fundamental(
-            F,
-            mocapSystem.intrinsic_matrices[camera_i],
-            mocapSystem.intrinsic_matrices[camera_i+1]
+    if mocapSystem.to_world_coords_matrix is not None:
+        socketio.emit(
+            "to-world-coords-matrix",
+            {"to_world_coords_matrix": mocapSystem.to_world_coords_matrix.tolist()},
         )
-        possible_Rs, possible_ts = motion_from_essential(E)
-
-        R = None
-        t = None
-        max_points_infront_of_camera = 0
-        for i in range(0, 4):
-            object_points = triangulate_points(
-                np.hstack(
-                    [
-                        np.expand_dims(camera1_image_points, axis=1),
-                        np.expand_dims(camera2_image_points, axis=1),
-                    ]
-                ),
-                camera_poses_to_projection_matrices(np.concatenate(
-                    [[camera_poses[-1]], [{"R": possible_Rs[i], "t": possible_ts[i]}]]
-                ), [
-                        intrinsic_matrices[camera_i],
-                        intrinsic_matrices[camera_i+1]
-                    ]),
-            )
-            object_points_camera_coordinate_frame = np.array(
-                [possible_Rs[i].T @ object_point for object_point in object_points]
-            )
-
-            points_infront_of_camera = np.sum(object_points[:, 2] > 0) + np.sum(
-                object_points_camera_coordinate_frame[:, 2] > 0
-            )
-
-            if points_infront_of_camera > max_points_infront_of_camera:
-                max_points_infront_of_camera = points_infront_of_camera
-                R = possible_Rs[i]
-                t = possible_ts[i]
-
-        R = R @ camera_poses[-1]["R"]
-        t = camera_poses[-1]["t"] + (camera_poses[-1]["R"] @ t)
-
-        camera_poses.append({"R": R, "t": t})
-
-    new_poses = bundle_adjustment(image_points, mocapSystem.intrinsic_matrices, mocapSystem.distortion_coefs, camera_poses) 
-    
-    mocapSystem.set_camera_poses(new_poses)
 
-    object_points = triangulate_points(image_points, mocapSystem.projection_matrices)
-    error = np.mean(
-        calculate_reprojection_errors(image_points, object_points, mocapSystem.camera_poses, mocapSystem.intrinsic_matrices)
-    )
-    print(f"New pose computed, average reprojection error: {error}")
+@socketio.on("list-calibration-profiles")
+def list_calibration_profiles():
+    mocapSystem = MocapSystem.instance()
+    socketio.emit("calibration-profiles", mocapSystem.calibration_profiles())
 
-    reprojected_points = []
-    for object_point in object_points:
-        reprojected_point = []
-        for i, camera_pose in enumerate(mocapSystem.camera_poses):
-            projected_img_points, _ = cv.projectPoints(
-                np.expand_dims(object_point, axis=0).astype(np.float32),
-                np.array(camera_pose["R"], dtype=np.float64),
-                np.array(camera_pose["t"], dtype=np.float64),
-                mocapSystem.intrinsic_matrices[i],
-                np.array([]),
-            )
-            reprojected_point.append(projected_img_points[0][0].tolist())
-        reprojected_points.append(reprojected_point)
-
-    socketio.emit(
-        "camera-pose", {
-            "camera_poses": camera_poses_to_serializable(mocapSystem.camera_poses),
-            "intrinsic_matrices": camera_intrinsics_to_serializable(mocapSystem.intrinsic_matrices),
-            "distortion_coefs": camera_distortion_to_serializable(mocapSystem.distortion_coefs),
-            "reprojected": reprojected_points,
-            "error": error
-        }
-    )
+@socketio.on("cancel-calibration-job")
+def cancel_calibration_job(data):
+    calibration_jobs.cancel(data["jobId"])
 
 @socketio.on("set-camera-poses")
 def set_camera_poses(data):
@@ -295,7 +307,7 @@ def set_to_world_matrix(data):
     m = data["toWorldCoordsMatrix"]
     
     mocapSystem = MocapSystem.instance()
-    mocapSystem.to_world_coords_matrix = np.array(m) 
+    mocapSystem.set_to_world_coords_matrix(np.array(m))
 
 @socketio.on("set-intrinsic-matrices")
 def set_camera_poses(data):
@@ -319,7 +331,6 @@ def determine_scale(data):
     object_points = data["objectPoints"]
     real_distance = 0.119
     mocapSystem = MocapSystem.instance()
-    camera_poses = mocapSystem.camera_poses
 
     observed_distances = []
     for object_points_i in object_points:
@@ -335,8 +346,10 @@ def determine_scale(data):
         return    
     scale_factor = real_distance / np.mean(observed_distances)
     
-    for i in range(0, len(camera_poses)):
-        camera_poses[i]["t"] = (np.array(camera_poses[i]["t"]) * scale_factor).tolist()
+    # Scale a copy, the current poses belong to the published calibration
+    camera_poses = camera_poses_to_serializable(mocapSystem.camera_poses)
+    for camera_pose in camera_poses:
+        camera_pose["t"] = (np.array(camera_pose["t"]) * scale_factor).tolist()
     mocapSystem.set_camera_poses(camera_poses)
     socketio.emit("scaled", {"scale_factor": scale_factor, "camera_poses": camera_poses})
 
@@ -344,8 +357,12 @@ def determine_scale(data):
 def start_recording(data):
     name = data["name"]
     record_video = data["recordVideo"]
+    record_raw = data.get("recordRaw", False)
     mocapSystem = MocapSystem.instance()
-    mocapSystem.start_recording(name, record_video)
+    try:
+        mocapSystem.start_recording(name, record_video, record_raw)
+    except FileExistsError:
+        socketio.emit("error", f"A recording named {name} already exists")
 
 @socketio.on("stop_recording")
 def stop_recording():
@@ -358,6 +375,7 @@ if __name__ == "__main__":
     mocapSystem = MocapSystem.instance()
     try:
         mocapSystem.set_socketio(socketio)
+        mocapSystem.start_tracking()
         socketio.run(app, port=3001, debug=True, use_reloader=False)
         socketio.emit("started")
     finally:
@@ -0,0 +1,44 @@
+import json
+import os
+import numpy as np
+
+PROFILE_VERSION = 1
+
+
+def save_intrinsics_profile(path, cameras, checkerboard):
+    """
+    Writes the intrinsics of every camera, in camera order, as json. Each camera is a dict of
+    name, image_size, intrinsic_matrix, distortion_coefs, rms error and the number of images used.
+    The file is replaced in one step so the server never reads half a profile.
+    """
+    profile = {
+        "version": PROFILE_VERSION,
+        "checkerboard": list(checkerboard),
+        "cameras": [
+            {
+                **camera,
+                "intrinsic_matrix": np.asarray(camera["intrinsic_matrix"], dtype=np.float64).tolist(),
+                "distortion_coefs": np.asarray(camera["distortion_coefs"], dtype=np.float64).flatten().tolist()
+            }
+            for camera in cameras
+        ]
+    }
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(temporary_path, path)
+
+
+def load_intrinsics_profile(path):
+    """
+    Reads a profile written by save_intrinsics_profile. Returns the intrinsic matrices and
+    distortion coefficients as lists of arrays, the layout settings.py uses.
+    """
+    with open(path) as f:
+        profile = json.load(f)
+    if profile.get("version") != PROFILE_VERSION:
+        raise ValueError(f"{path} is intrinsics profile version {profile.get('version')}, expected {PROFILE_VERSION}")
+
+    intrinsic_matrices = [np.array(camera["intrinsic_matrix"], dtype=np.float64) for camera in profile["cameras"]]
+    distortion_coefs = [np.array(camera["distortion_coefs"], dtype=np.float64) for camera in profile["cameras"]]
+    return intrinsic_matrices, distortion_coefs
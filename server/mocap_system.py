@@ -1,23 +1,57 @@
 import os
+import time
 import uuid
+import threading
+import traceback
 import numpy as np
 import cv2 as cv
 from settings import intrinsic_matrices, distortion_coefs
-from pseyepy import Camera, cam_count, Stream
 from Singleton import Singleton
 from KalmanFilter import KalmanFilter
+from FrameBroadcaster import FrameBroadcaster
+from OverlayRenderer import OverlayRenderer
+from PreviewEncoder import PreviewEncoderSettings
+from CameraWorkerPool import CameraWorkerPool, CameraWorkerError
+from FrameRingBuffer import FrameRingBuffer
+from CameraSource import CameraSources, PSEyeCameraSource, SourceFinished
+from SyntheticCameraSource import SyntheticCameraSource
+from ReplayCameraSource import ReplayCameraSource
+from FrameRecorder import FrameRecorder
+from CalibrationState import CalibrationState
+from CalibrationSampleBuffer import CalibrationSampleBuffer
+from blob_detection import Detectors, DEFAULT_MIN_DOT_AREA, find_dots_around
+from rigid_bodies import DEFAULT_TEMPLATES, locate_objects
 from helpers import (
     find_point_correspondance_and_object_points,
-    locate_objects,
-    make_square,
-    camera_poses_to_projection_matrices,
-    undistort_image_points,
+    undistort_points,
+    distort_points,
+    project_points,
     camera_intrinsics_to_serializable,
-    camera_distortion_to_serializable
+    camera_distortion_to_serializable,
+    camera_poses_to_serializable
 )
-from flags import ADVANCED_BA
+from flags import ADVANCED_BA, CAMERA_WORKER_POOL, CAMERA_SOURCE, REPLAY_RECORDING, REPLAY_SPEED, CALIBRATION_PROFILE
 
 DEFAULT_FPS = 125
+# Frame size for Camera.RES_SMALL
+FRAME_DIMENSIONS = (320, 240)
+# Number of tracking iterations averaged for each "fps" update sent to the UI
+FPS_AVERAGE_FRAMES = 20
+# Tracking stops after this many iterations in a row fail, about five seconds of failures
+MAX_TRACKING_FAILURES = 5 * DEFAULT_FPS
+# Half width in pixels of the windows searched around predicted markers
+DEFAULT_ROI_WINDOW_RADIUS = 16
+# Even while every marker is found in its window the whole frame is searched this often so
+# markers that have come into view are picked up
+ROI_FULL_SEARCH_INTERVAL = 30
+# A calibration sample is only kept when at least this many cameras each see exactly one dot
+MIN_CALIBRATION_SAMPLE_CAMERAS = 2
+# Least time in seconds between sending newly captured calibration samples to the UI
+CALIBRATION_SAMPLES_EMIT_INTERVAL = 0.1
+CALIBRATION_SAMPLES_DIRECTORY = "calibration_samples"
+CALIBRATION_PROFILES_DIRECTORY = "calibration_profiles"
+# Loaded on start when no profile is asked for and the camera source doesn't know its poses
+DEFAULT_CALIBRATION_PROFILE = "default"
 
 # This enum is also defined in modes.ts in the front end, keep them in sync
 class Modes():
@@ -40,6 +74,12 @@ readable_modes = {
     Modes.ObjectDetection: "Detecting objects"
 }
 
+# Where lens distortion is removed once points are being captured. Image undistorts every
+# pixel before detection, Points detects on the raw frame and only undistorts the centroids
+class UndistortModes():
+    Image = 0
+    Points = 1
+
 Transitions = {
     Modes.SaveImage: [Modes.CamerasFound],
     Modes.CamerasFound: [Modes.ImageProcessing, Modes.SaveImage],
@@ -51,22 +91,52 @@ Transitions = {
 @Singleton
 class MocapSystem:
     def __init__(self):
-        self.camera_poses = None
         self.cameras = None
         self.stream = None
         self.output_file = None
-        self.intrinsic_matrices = intrinsic_matrices
-        self.distortion_coefs = distortion_coefs
-        self.projection_matrices = None
+        self.frame_recorder = None
+        self.calibration = CalibrationState(intrinsic_matrices, distortion_coefs, 0, FRAME_DIMENSIONS)
         self.optimal_matrices = None
-        self.to_world_coords_matrix = None
+        self.raw_frames = None
+        self.processed_frames = None
+        self.camera_worker_pool = None
         self.capture_mode = Modes.Initializing
         self.num_cameras = 0
 
         self.contour_threshold = 0.4
-
-        self.kalman_filter = KalmanFilter(1)
+        self.undistort_mode = UndistortModes.Points
+        self.dot_detector = Detectors.Components
+        self.min_dot_area = DEFAULT_MIN_DOT_AREA
+        self.max_dot_area = np.inf
+        self.min_dot_circularity = 0
+
+        # Predicted-ROI search, markers are looked for near where the last triangulation and
+        # kalman velocity say they will be rather than across the whole frame
+        self.roi_search = False
+        self.roi_window_radius = DEFAULT_ROI_WINDOW_RADIUS
+        self.predicted_object_points = None
+        self.frames_since_full_search = 0
+
+        # Pose calibration samples are captured into a buffer here rather than in the UI
+        self.calibration_samples = None
+        self.is_capturing_calibration_samples = False
+        self.continuous_calibration_capture = False
+        self.calibration_samples_emitted = 0
+        self.last_calibration_samples_emit = 0
+
+        # Each template is tracked as its own object, droneIndex is its index in this list
+        self.rigid_body_templates = DEFAULT_TEMPLATES
+        self.kalman_filter = KalmanFilter(len(self.rigid_body_templates))
         self.socketio = None
+
+        # Tracking runs on its own thread at the camera rate, preview streams
+        # subscribe to the frames it produces rather than reading the cameras
+        self.is_tracking = False
+        self.tracking_thread = None
+        self.frame_broadcaster = FrameBroadcaster()
+        self.overlay_renderer = OverlayRenderer()
+        self.preview_encoder_settings = PreviewEncoderSettings()
+
         self.initialize_cameras(DEFAULT_FPS)
         self.kernel = np.array(
                 [
@@ -81,36 +151,168 @@ class MocapSystem:
     def initialize_cameras(self, target_fps):
         print("\nInitializing cameras")
         try:
-            self.cameras = Camera(
-                fps=target_fps, resolution=Camera.RES_SMALL, colour=True, gain=1, exposure=50
-            )
+            self.cameras = self._create_camera_source(target_fps)
             self.capture_mode = Modes.ImageProcessing
         except:
             self.capture_mode = Modes.CamerasNotFound
 
         if self.capture_mode >= Modes.CamerasFound:
-            self.num_cameras = cam_count()
+            self.num_cameras = self.cameras.num_cameras
             print(f"{self.num_cameras} cameras found")
+            if self.cameras.camera_poses is not None:
+                # The source knows where its cameras are, the true rig of the synthetic source or
+                # the calibration a recording was made with
+                self.calibration = CalibrationState(
+                    self.intrinsic_matrices,
+                    self.distortion_coefs,
+                    self.num_cameras,
+                    FRAME_DIMENSIONS,
+                    self.cameras.camera_poses,
+                    self.cameras.to_world_coords_matrix
+                )
+            else:
+                self.calibration = self.calibration.with_num_cameras(self.num_cameras)
+
+            # A profile asked for by name wins over the source's poses, the default one doesn't
+            profile = CALIBRATION_PROFILE
+            if profile is None and self.cameras.camera_poses is None:
+                if os.path.exists(self._calibration_profile_path(DEFAULT_CALIBRATION_PROFILE)):
+                    profile = DEFAULT_CALIBRATION_PROFILE
+            if profile is not None:
+                try:
+                    self.load_calibration_profile(profile)
+                    print(f"Loaded calibration profile {profile}")
+                except (OSError, KeyError, ValueError) as e:
+                    print(f"Could not load calibration profile {profile}: {e}")
+            self.calibration_samples = CalibrationSampleBuffer(self.num_cameras)
+            self.raw_frames = FrameRingBuffer(self.num_cameras, FRAME_DIMENSIONS)
+            self.processed_frames = FrameRingBuffer(self.num_cameras, FRAME_DIMENSIONS)
+            if CAMERA_WORKER_POOL:
+                self.camera_worker_pool = CameraWorkerPool(
+                    self.num_cameras, FRAME_DIMENSIONS, self.raw_frames, self.processed_frames
+                )
+                self.camera_worker_pool.set_intrinsics(self.intrinsic_matrices, self.distortion_coefs)
             if ADVANCED_BA == True:
                 self._calculate_optimal_matrices()
         else:
             print(f"Failed to find cameras, please check connections")
 
+    def _create_camera_source(self, target_fps):
+        if CAMERA_SOURCE == CameraSources.Synthetic:
+            print("Using synthetic cameras")
+            return SyntheticCameraSource(fps=target_fps)
+        if CAMERA_SOURCE == CameraSources.Replay:
+            print(f"Replaying {REPLAY_RECORDING}")
+            return ReplayCameraSource(REPLAY_RECORDING, speed=REPLAY_SPEED)
+        return PSEyeCameraSource(fps=target_fps, exposure=50, gain=1)
+
     def end(self):
+        self.stop_tracking()
+        if self.camera_worker_pool:
+            self.camera_worker_pool.end()
         self.cameras.end()
+        self.raw_frames.end()
+        self.processed_frames.end()
 
-    def start_recording(self, name, record_video):
+    def start_tracking(self):
+        if self.tracking_thread is not None:
+            return
+        self.is_tracking = True
+        self.tracking_thread = threading.Thread(target=self._tracking_loop, daemon=True)
+        self.tracking_thread.start()
+
+    def stop_tracking(self):
+        self.is_tracking = False
+        if self.tracking_thread is not None:
+            self.tracking_thread.join()
+            self.tracking_thread = None
+
+    def start_recording(self, name, record_video, record_raw=False):
+        """
+        Raises FileExistsError if a raw recording with this name already exists, before anything
+        else is opened.
+        """
         print("starting record")
+        if record_raw:
+            self.frame_recorder = FrameRecorder(
+                f"recordings/{name}",
+                self.num_cameras,
+                FRAME_DIMENSIONS,
+                camera_poses_to_serializable(self.camera_poses) if self.camera_poses is not None else None,
+                self.to_world_coords_matrix
+            )
         self.output_file = open(f"data/{name}.csv", "w")
         if record_video:
-            self.stream = Stream(self.cameras, file_name=f'videos/{name}.avi', display=True)
+            self.stream = self.cameras.stream(f'videos/{name}.avi')
 
     def stop_recording(self):
         if self.stream:
             self.stream.end()
             self.stream = None
-        self.output_file.close()
-        self.output_file = None
+        if self.frame_recorder:
+            self.frame_recorder.end()
+            self.frame_recorder = None
+        if self.output_file:
+            self.output_file.close()
+            self.output_file = None
+
+    def start_calibration_capture(self, continuous):
+        """
+        Captures pose calibration samples from the next frames, just the next usable one unless
+        continuous, in which case it goes on until stop_calibration_capture.
+        """
+        self.continuous_calibration_capture = continuous
+        self.is_capturing_calibration_samples = True
+
+    def stop_calibration_capture(self):
+        self.is_capturing_calibration_samples = False
+        self._emit_calibration_samples()
+
+    def clear_calibration_samples(self):
+        self.calibration_samples.clear()
+        self._emit_calibration_samples(reset=True)
+
+    def save_calibration_samples(self, name):
+        os.makedirs(CALIBRATION_SAMPLES_DIRECTORY, exist_ok=True)
+        self.calibration_samples.save(os.path.join(CALIBRATION_SAMPLES_DIRECTORY, f"{name}.npz"))
+
+    def load_calibration_samples(self, name):
+        self.calibration_samples.load(os.path.join(CALIBRATION_SAMPLES_DIRECTORY, f"{name}.npz"))
+        self._emit_calibration_samples(reset=True)
+
+    def save_calibration_profile(self, name):
+        os.makedirs(CALIBRATION_PROFILES_DIRECTORY, exist_ok=True)
+        self.calibration.save(self._calibration_profile_path(name))
+
+    def load_calibration_profile(self, name):
+        """
+        Takes the camera poses and to-world matrix from the saved profile. Intrinsics stay as
+        settings.py loaded them, from intrinsics.json when there is one, so re-running the
+        intrinsic calibration is never undone by an older profile. Raises a ValueError if the
+        profile was made for a different number of cameras or frame size.
+        """
+        profile = CalibrationState.load(self._calibration_profile_path(name))
+        if profile.num_cameras != self.num_cameras or profile.dimensions != FRAME_DIMENSIONS:
+            raise ValueError(
+                f"Profile {name} is for {profile.num_cameras} cameras at {profile.dimensions}, "
+                f"not {self.num_cameras} at {FRAME_DIMENSIONS}"
+            )
+        self.calibration = self.calibration.with_profile(profile)
+
+    def calibration_profiles(self):
+        if not os.path.isdir(CALIBRATION_PROFILES_DIRECTORY):
+            return []
+        return sorted(
+            os.path.splitext(file_name)[0]
+            for file_name in os.listdir(CALIBRATION_PROFILES_DIRECTORY)
+            if file_name.endswith(".npz")
+        )
+
+    def _calibration_profile_path(self, name):
+        # Anything ending in .npz is taken as a path, so profiles can be used from outside server/
+        if name.endswith(".npz"):
+            return name
+        return os.path.join(CALIBRATION_PROFILES_DIRECTORY, f"{name}.npz")
 
     def set_socketio(self, socketio):
         self.socketio = socketio
@@ -120,21 +322,46 @@ class MocapSystem:
         return {
             "mode": self.capture_mode, 
             "camera_poses": self.camera_poses,
-            "to_world_coords_matrix": self.to_world_coords_matrix,
+            "to_world_coords_matrix": (
+                np.asarray(self.to_world_coords_matrix).tolist() if self.to_world_coords_matrix is not None else None
+            ),
             "intrinsic_matrices": camera_intrinsics_to_serializable(self.intrinsic_matrices),
             "distortion_coefs": camera_distortion_to_serializable(self.distortion_coefs),
             "exposure": self.cameras.exposure if self.cameras else 0,
             "gain": self.cameras.gain if self.cameras else 0
         }
 
+    # The calibration is only ever replaced as a whole, through the setters below
+    @property
+    def intrinsic_matrices(self):
+        return self.calibration.intrinsic_matrices
+
+    @property
+    def distortion_coefs(self):
+        return self.calibration.distortion_coefs
+
+    @property
+    def camera_poses(self):
+        return self.calibration.camera_poses
+
+    @property
+    def to_world_coords_matrix(self):
+        return self.calibration.to_world_coords_matrix
+
+    @property
+    def projection_matrices(self):
+        return self.calibration.projection_matrices
+
     def set_camera_intrinsics(self, intrinsic_matrices, distortion_coefs):
-        self.intrinsic_matrices = intrinsic_matrices
-        self.distortion_coefs = distortion_coefs
-        self.projection_matrices = camera_poses_to_projection_matrices(self.camera_poses, self.intrinsic_matrices)
+        self.calibration = self.calibration.with_intrinsics(intrinsic_matrices, distortion_coefs)
+        if self.camera_worker_pool:
+            self.camera_worker_pool.set_intrinsics(intrinsic_matrices, distortion_coefs)
 
     def set_camera_poses(self, poses):
-        self.camera_poses = poses
-        self.projection_matrices = camera_poses_to_projection_matrices(self.camera_poses, self.intrinsic_matrices)
+        self.calibration = self.calibration.with_camera_poses(poses)
+
+    def set_to_world_coords_matrix(self, to_world_coords_matrix):
+        self.calibration = self.calibration.with_to_world_coords_matrix(np.asarray(to_world_coords_matrix))
 
     def edit_settings(self, exposure, gain, sharpness, contrast):
         self.cameras.exposure = [exposure] * self.num_cameras
@@ -144,7 +371,16 @@ class MocapSystem:
 
     def _camera_read(self):
         frames, timestamps = self.cameras.read(squeeze=False)
+        # From here on everything works on views into the ring buffers rather than fresh copies
+        sequence_number = self.raw_frames.write(frames, timestamps)
+        frames = self.raw_frames.camera_views(sequence_number)
+        if self.frame_recorder:
+            self.frame_recorder.write(self.raw_frames.view(sequence_number), timestamps)
+        # Only frames picked for the preview are undistorted for display and annotated
+        preview = self.frame_broadcaster.has_subscribers() and self.overlay_renderer.is_due()
         image_points = []
+        contours = []
+        epipolar_lines = []
         object_points = []
         errors = []
         objects = []
@@ -154,28 +390,108 @@ class MocapSystem:
             self._capture_image(frames)
             self.change_mode(Modes.CamerasFound)
 
-        if self.capture_mode >= Modes.ImageProcessing:
-            frames = self._image_processing(frames)
-        
-        if self.capture_mode >= Modes.PointCapture:
-            image_points = self._point_capture(frames)
+        point_space = self.undistort_mode == UndistortModes.Points and self.capture_mode >= Modes.PointCapture
+
+        processed_sequence_number = None
+        if self.capture_mode >= Modes.ImageProcessing and (preview or not point_space):
+            processed_sequence_number = self.processed_frames.claim()
+            processed_frames = self.processed_frames.camera_views(processed_sequence_number)
+
+        search_centers = self._roi_search_centers(point_space)
+
+        if self.camera_worker_pool and self.capture_mode >= Modes.ImageProcessing:
+            image_points, contours = self._pooled_processing(
+                sequence_number, processed_sequence_number, point_space, preview, search_centers
+            )
+            if processed_sequence_number is not None:
+                frames = processed_frames
+        else:
+            if self.capture_mode >= Modes.ImageProcessing and not point_space:
+                frames = self._image_processing(frames, processed_frames)
+
+            if self.capture_mode >= Modes.PointCapture:
+                image_points, contours = self._point_capture(frames, point_space, preview, search_centers)
+
+            if preview and point_space:
+                # Only frames that are going to be displayed need every pixel undistorted
+                frames = self._image_processing(frames, processed_frames)
+
+        if self.is_capturing_calibration_samples and self.capture_mode >= Modes.PointCapture:
+            self._capture_calibration_sample(image_points)
 
         if self.capture_mode >= Modes.Triangulation:
-            object_points, errors, frames = self._triangulation(frames, image_points)
+            object_points, errors, epipolar_lines = self._triangulation(image_points)
 
         if self.capture_mode >= Modes.ObjectDetection:
             objects, filtered_objects = self._object_detection(object_points, errors)
 
+        if self.capture_mode >= Modes.Triangulation:
+            self._predict_object_points(object_points, filtered_objects)
+
         average_time = np.mean(timestamps)
         self._emit_data(average_time, image_points, object_points, errors, objects, filtered_objects)
-        return frames
 
-    def get_frames(self, camera=None):
+        if processed_sequence_number is not None:
+            self.processed_frames.commit(processed_sequence_number, timestamps)
+        if not preview:
+            return None
+
+        self.overlay_renderer.render(frames, contours, image_points, epipolar_lines)
+        if processed_sequence_number is None:
+            return self.raw_frames, sequence_number
+        return self.processed_frames, processed_sequence_number
+
+    def _tracking_loop(self):
+        last_fps_time = time.time()
+        i = 0
+        failures = 0
+        while self.is_tracking:
+            if self.capture_mode < Modes.CamerasFound:
+                time.sleep(1 / DEFAULT_FPS)
+                continue
+
+            try:
+                # cameras.read blocks until the next frame so this paces the loop to the camera rate
+                preview_frames = self._camera_read()
+            except SourceFinished:
+                print("Camera source has no more frames, tracking stopped")
+                self.is_tracking = False
+                break
+            except CameraWorkerError:
+                # Carry on processing in this process rather than stop tracking
+                traceback.print_exc()
+                print("Camera worker pool failed, processing images in the tracking thread")
+                self.camera_worker_pool.end()
+                self.camera_worker_pool = None
+                continue
+            except Exception:
+                traceback.print_exc()
+                failures += 1
+                if failures >= MAX_TRACKING_FAILURES:
+                    message = f"Tracking stopped after {failures} failed frames in a row"
+                    print(message)
+                    if self.socketio:
+                        self.socketio.emit("error", message)
+                    self.is_tracking = False
+                    break
+                # Don't spin on a camera or processing step that keeps failing
+                time.sleep(1 / DEFAULT_FPS)
+                continue
+            failures = 0
+
+            if preview_frames is not None:
+                self.frame_broadcaster.publish(*preview_frames)
+
+            i = (i + 1) % FPS_AVERAGE_FRAMES
+            if i == 0 and self.socketio:
+                time_now = time.time()
+                fps_frame_average = (time_now - last_fps_time) / FPS_AVERAGE_FRAMES
+                self.socketio.emit("fps", {"fps": round(1 / fps_frame_average)})
+                last_fps_time = time_now
+
+    def subscribe_frames(self, camera=None):
         if self.capture_mode >= Modes.CamerasFound:
-            frames = self._camera_read()
-            if camera == None:
-                return np.hstack(frames)
-            return frames[camera]
+            return self.frame_broadcaster.subscribe(camera)
         else:
             raise RuntimeError("Cannot get frames mode is {self.capture_mode}, should be greater than {Modes.CameraFound}")
 
@@ -184,12 +500,13 @@ class MocapSystem:
             print(f"Storing image to {os.getcwd()}")
             cv.imwrite(f"./images/camera_{i}_{uuid.uuid4()}.png", frames[i])
 
-    def _image_processing(self, frames):
+    def _image_processing(self, frames, outputs):
+        undistort_maps = self.calibration.undistort_maps
         for i in range(0, self.num_cameras):
-            frames[i] = np.copy(frames[i])
             # frames[i] = np.rot90(frames[i], k=0)
-            
-            frames[i] = cv.undistort(frames[i], self.intrinsic_matrices[i], self.distortion_coefs[i])
+
+            map1, map2 = undistort_maps[i]
+            frames[i] = cv.remap(frames[i], map1, map2, cv.INTER_LINEAR, dst=outputs[i])
             # many of these things were also done in _find_dot
             # frames[i] = cv.medianBlur(frames[i],9)
             # frames[i] = cv.GaussianBlur(frames[i],(9,9),0)
@@ -197,62 +514,178 @@ class MocapSystem:
             # frames[i] = cv.cvtColor(frames[i], cv.COLOR_RGB2BGR)
         return frames
 
-    def _point_capture(self, frames):
+    def _point_capture(self, frames, point_space, preview, search_centers=None):
         image_points = []
+        contours = []
         for i in range(0, self.num_cameras):
-            frames[i], single_camera_image_points = self._find_dot(frames[i])
+            single_camera_contours, single_camera_image_points = self._find_dot(
+                frames[i], search_centers[i] if search_centers is not None else None
+            )
+            if point_space:
+                single_camera_image_points = undistort_points(
+                    single_camera_image_points, self.intrinsic_matrices[i], self.distortion_coefs[i]
+                ).tolist()
+                if preview and self.overlay_renderer.show_contours:
+                    single_camera_contours = [
+                        np.round(
+                            undistort_points(contour, self.intrinsic_matrices[i], self.distortion_coefs[i])
+                        ).astype(np.int32).reshape(-1, 1, 2)
+                        for contour in single_camera_contours
+                    ]
             image_points.append(single_camera_image_points)
-        return image_points
+            contours.append(single_camera_contours)
 
-    def _find_dot(self, img):
-        # img = cv.GaussianBlur(img,(5,5),0)
-        grey = cv.cvtColor(img, cv.COLOR_RGB2GRAY)
-        grey = cv.threshold(grey, 255 * self.contour_threshold, 255, cv.THRESH_BINARY)[1]
-        contours, _ = cv.findContours(grey, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_NONE)
-        img = cv.drawContours(img, contours, -1, (0, 255, 0), 1)
+        for i in range(0, self.num_cameras):
+            if len(image_points[i]) == 0:
+                image_points[i] = [[None, None]]
+
+        return image_points, contours
+
+    def _pooled_processing(self, sequence_number, processed_sequence_number, point_space, preview, search_centers=None):
+        detect = self.capture_mode >= Modes.PointCapture
+        camera_image_points, contours = self.camera_worker_pool.process(
+            sequence_number,
+            processed_sequence_number,
+            detect,
+            point_space,
+            preview,
+            preview and self.overlay_renderer.show_contours,
+            self._detection_settings(),
+            search_centers,
+            self.roi_window_radius
+        )
 
         image_points = []
-        for contour in contours:
-            moments = cv.moments(contour)
-            if moments["m00"] != 0:
-                center_x = moments["m10"] / moments["m00"]
-                center_y = moments["m01"] / moments["m00"]
-                center_x_int = int(center_x)
-                center_y_int = int(center_y)
-                cv.putText(
-                    img,
-                    f"({center_x_int}, {center_y_int})",
-                    (center_x_int, center_y_int - 15),
-                    cv.FONT_HERSHEY_SIMPLEX,
-                    0.3,
-                    (100, 255, 100),
-                    1,
-                )
-                cv.circle(img, (center_x_int, center_y_int), 1, (100, 255, 100), -1)
-                image_points.append([center_x, center_y])
+        if detect:
+            for single_camera_image_points in camera_image_points:
+                if len(single_camera_image_points) == 0:
+                    image_points.append([[None, None]])
+                else:
+                    image_points.append(single_camera_image_points.tolist())
+        return image_points, contours
+
+    def _find_dot(self, img, search_centers=None):
+        # img = cv.GaussianBlur(img,(5,5),0)
+        contours, image_points = find_dots_around(
+            img, search_centers, self.roi_window_radius, **self._detection_settings()
+        )
+        return contours, image_points.tolist()
+
+    def _roi_search_centers(self, point_space):
+        """
+        Projects the predicted markers into every camera. Returns the expected image positions
+        for each camera, None for a camera that should search its whole frame, or None when
+        every camera should.
+        """
+        if (
+            not self.roi_search
+            or self.predicted_object_points is None
+            or self.capture_mode < Modes.Triangulation
+        ):
+            self.frames_since_full_search = 0
+            return None
+
+        self.frames_since_full_search += 1
+        if self.frames_since_full_search >= ROI_FULL_SEARCH_INTERVAL:
+            self.frames_since_full_search = 0
+            return None
+
+        # predictions are in world coordinates
+        projected_points = project_points(
+            self.predicted_object_points, self.calibration.world_projection_matrices
+        )
 
-        if len(image_points) == 0:
-            image_points = [[None, None]]
+        width, height = FRAME_DIMENSIONS
+        search_centers = []
+        for i in range(0, self.num_cameras):
+            centers = projected_points[:, i]
+            if point_space:
+                # point space detection runs on the raw, still distorted, frame
+                centers = distort_points(centers, self.intrinsic_matrices[i], self.distortion_coefs[i])
+            in_view = (
+                np.isfinite(centers).all(axis=1)
+                & (centers[:, 0] >= 0) & (centers[:, 0] < width)
+                & (centers[:, 1] >= 0) & (centers[:, 1] < height)
+            )
+            centers = centers[in_view]
+            search_centers.append(centers if len(centers) > 0 else None)
+        return search_centers
+
+    def _capture_calibration_sample(self, image_points):
+        # With one light on the wand, a camera that found several dots can't say which is which
+        points = np.zeros((self.num_cameras, 2))
+        visible = np.zeros(self.num_cameras, dtype=bool)
+        for i, camera_image_points in enumerate(image_points[:self.num_cameras]):
+            if len(camera_image_points) == 1 and camera_image_points[0][0] is not None:
+                points[i] = camera_image_points[0]
+                visible[i] = True
+        if np.sum(visible) < MIN_CALIBRATION_SAMPLE_CAMERAS:
+            return
 
-        return img, image_points
+        self.calibration_samples.add(points, visible)
+        if not self.continuous_calibration_capture:
+            self.is_capturing_calibration_samples = False
+        if (
+            not self.is_capturing_calibration_samples
+            or time.time() - self.last_calibration_samples_emit >= CALIBRATION_SAMPLES_EMIT_INTERVAL
+        ):
+            self._emit_calibration_samples()
+
+    def _emit_calibration_samples(self, reset=False):
+        # Only the samples the UI hasn't been sent yet, unless it should start over
+        start = 0 if reset else self.calibration_samples_emitted
+        samples = self.calibration_samples.to_serializable(start)
+        self.calibration_samples_emitted = start + len(samples)
+        self.last_calibration_samples_emit = time.time()
+        if self.socketio is None:
+            return
+        self.socketio.emit(
+            "calibration-samples",
+            {
+                "reset": reset,
+                "samples": samples,
+                "count": self.calibration_samples_emitted,
+                "cameraCounts": self.calibration_samples.camera_counts().tolist(),
+                "capturing": self.is_capturing_calibration_samples
+            }
+        )
+
+    def _predict_object_points(self, object_points, filtered_objects):
+        if len(object_points) == 0:
+            self.predicted_object_points = None
+            return
 
-    def _triangulation(self, frames, image_points):
-        errors, object_points, frames = (
+        predicted_object_points = np.array(object_points, dtype=np.float64).reshape(-1, 3)
+        if len(filtered_objects) > 0:
+            # Move each marker on by one frame at the velocity of the closest tracked object
+            positions = np.array([filtered_object["pos"] for filtered_object in filtered_objects])
+            velocities = np.array([filtered_object["vel"] for filtered_object in filtered_objects])
+            distances = np.linalg.norm(predicted_object_points[:, np.newaxis] - positions, axis=2)
+            predicted_object_points += velocities[np.argmin(distances, axis=1)] / DEFAULT_FPS
+        self.predicted_object_points = predicted_object_points
+
+    def _detection_settings(self):
+        return {
+            "threshold": self.contour_threshold,
+            "detector": self.dot_detector,
+            "min_area": self.min_dot_area,
+            "max_area": self.max_dot_area,
+            "min_circularity": self.min_dot_circularity
+        }
+
+    def _triangulation(self, image_points):
+        # The world transform is folded into the cached projection matrices, so these come out
+        # in world coordinates
+        calibration = self.calibration
+        errors, object_points, epipolar_lines = (
             find_point_correspondance_and_object_points(
-                image_points, self.camera_poses, self.intrinsic_matrices, self.projection_matrices, frames
+                image_points, calibration.world_projection_matrices, calibration.fundamental_matrices
             )
         )
-        # convert to world coordinates
-        for i, object_point in enumerate(object_points):
-            object_point_homogeneous = np.concatenate((object_point, [1]))
-            world_point_homogeneous = (
-                np.array(self.to_world_coords_matrix) @ object_point_homogeneous
-            )
-            object_points[i] = world_point_homogeneous[:3]
-        return object_points, errors, frames
+        return object_points, errors, epipolar_lines
 
     def _object_detection(self, object_points, errors):
-        objects = locate_objects(object_points, errors)
+        objects = locate_objects(object_points, errors, self.rigid_body_templates)
         filtered_objects = self.kalman_filter.predict_location(objects)
 
         if len(filtered_objects) != 0:
@@ -269,6 +702,8 @@ class MocapSystem:
     def _emit_data(self, time, image_points, object_points, errors, objects, filtered_objects):
         if self.output_file:
             self._write_to_file(time, object_points)
+        if self.socketio is None:
+            return
         if self.capture_mode == Modes.PointCapture:
             self.socketio.emit("image-points", [x[0] for x in image_points])
         elif self.capture_mode >= Modes.Triangulation:
@@ -292,13 +727,13 @@ class MocapSystem:
 
     def _calculate_optimal_matrices(self):
         self.optimal_matrices = []
-        dimensions = (320, 240)
+        dimensions = FRAME_DIMENSIONS
         for i in range(0, self.num_cameras):
             opt, _ = cv.getOptimalNewCameraMatrix(self.intrinsic_matrices[i], self.distortion_coefs[i], dimensions, 1, dimensions)
             self.optimal_matrices.append(opt)
 
     def _write_to_file(self, time, object_points):
-        coords = object_points.flatten().tolist()
+        coords = np.asarray(object_points).flatten().tolist()
         self.output_file.write(f"{time},{",".join(str(x) for x in coords)}\n")
 
     def change_mode(self, target_mode):
@@ -0,0 +1,140 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# How far in metres a measured marker spacing can be from the template's and still match
+DISTANCE_TOLERANCE = 0.025
+# Above this many points neighbours come from a KD-tree rather than a full distance matrix
+KDTREE_MIN_POINTS = 64
+
+
+class RigidBodyTemplate:
+    """
+    The marker layout of a tracked body, positions in metres in the body's own frame.
+
+    Heading is taken along the line from the first marker to the second. Bodies with only two
+    markers can't tell their ends apart, so their heading is folded into [-pi/2, pi/2].
+    """
+
+    def __init__(self, name, markers):
+        self.name = name
+        self.markers = np.asarray(markers, dtype=np.float64).reshape(-1, 3)
+        assert len(self.markers) >= 2, "A rigid body needs at least two markers"
+        # The distance signature, every pairwise marker spacing
+        self.distances = np.linalg.norm(self.markers[:, np.newaxis] - self.markers[np.newaxis], axis=2)
+        self.max_distance = np.max(self.distances)
+
+
+# The pair of markers 0.131m apart on the drone, the same layout the synthetic cameras default to
+DEFAULT_TEMPLATES = [RigidBodyTemplate("drone", [(-0.0655, 0, 0), (0.0655, 0, 0)])]
+
+
+def point_pairs(object_points, max_distance):
+    """
+    Every pair of points closer than max_distance. Returns an (M, 2) array of indexes, i < j, and
+    their distances.
+    """
+    if len(object_points) >= KDTREE_MIN_POINTS:
+        pairs = cKDTree(object_points).query_pairs(max_distance, output_type="ndarray")
+        pairs = pairs.reshape(-1, 2)
+        distances = np.linalg.norm(object_points[pairs[:, 0]] - object_points[pairs[:, 1]], axis=1)
+        return pairs, distances
+
+    distance_matrix = np.linalg.norm(object_points[:, np.newaxis] - object_points[np.newaxis], axis=2)
+    i, j = np.triu_indices(len(object_points), k=1)
+    close = distance_matrix[i, j] < max_distance
+    return np.column_stack((i[close], j[close])), distance_matrix[i[close], j[close]]
+
+
+def distance_buckets(distances, tolerance):
+    # Hashes pairs by their spacing so each template edge only looks at pairs in nearby buckets
+    keys = np.floor(distances / tolerance).astype(np.int64)
+    order = np.argsort(keys, kind="stable")
+    unique_keys, starts = np.unique(keys[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+    return {key: order[start:end] for key, start, end in zip(unique_keys, starts, ends)}
+
+
+def match_template(template, object_points, pairs, distances, buckets, tolerance):
+    """
+    Every placement of template's markers onto object_points that fits its distance signature.
+    Returns a list of (marker point indexes, mean spacing residual).
+    """
+    seed_distance = template.distances[0, 1]
+    seed_key = int(np.floor(seed_distance / tolerance))
+    candidates = np.concatenate(
+        [buckets.get(key, np.empty(0, dtype=np.int64)) for key in (seed_key - 1, seed_key, seed_key + 1)]
+    ).astype(np.int64)
+    candidates = candidates[np.abs(distances[candidates] - seed_distance) < tolerance]
+
+    matches = []
+    for pair in pairs[candidates]:
+        # the seed edge can run either way along the pair
+        for first, second in ((pair[0], pair[1]), (pair[1], pair[0])):
+            assigned = [first, second]
+            for marker in range(2, len(template.markers)):
+                residuals = np.abs(
+                    np.linalg.norm(object_points[:, np.newaxis] - object_points[assigned], axis=2)
+                    - template.distances[marker, :marker]
+                )
+                fits = np.all(residuals < tolerance, axis=1)
+                fits[assigned] = False
+                if not np.any(fits):
+                    break
+                assigned.append(int(np.argmin(np.where(fits, np.sum(residuals, axis=1), np.inf))))
+            if len(assigned) < len(template.markers):
+                continue
+
+            assigned = np.array(assigned)
+            measured = np.linalg.norm(object_points[assigned][:, np.newaxis] - object_points[assigned][np.newaxis], axis=2)
+            residual = np.mean(np.abs(measured - template.distances)[np.triu_indices(len(assigned), k=1)])
+            matches.append((assigned, residual))
+            if len(template.markers) == 2:
+                # both directions of a two marker body are the same placement
+                break
+    return matches
+
+
+def locate_objects(object_points, errors, templates=DEFAULT_TEMPLATES, tolerance=DISTANCE_TOLERANCE):
+    """
+    Finds instances of the rigid body templates among the triangulated object points. Each point
+    belongs to at most one body, the placements that best fit their template are taken first.
+    droneIndex is the index of the matched template.
+    """
+    object_points = np.asarray(object_points, dtype=np.float64).reshape(-1, 3)
+    if len(object_points) < 2 or len(templates) == 0:
+        return []
+
+    max_distance = max(template.max_distance for template in templates) + tolerance
+    pairs, distances = point_pairs(object_points, max_distance)
+    if len(pairs) == 0:
+        return []
+    buckets = distance_buckets(distances, tolerance)
+
+    placements = []
+    for template_index, template in enumerate(templates):
+        for assigned, residual in match_template(template, object_points, pairs, distances, buckets, tolerance):
+            placements.append((residual, template_index, assigned))
+    placements.sort(key=lambda placement: placement[0])
+
+    used = np.zeros(len(object_points), dtype=bool)
+    objects = []
+    for _, template_index, assigned in placements:
+        if np.any(used[assigned]):
+            continue
+        used[assigned] = True
+        template = templates[template_index]
+
+        heading_vec = object_points[assigned[1]] - object_points[assigned[0]]
+        heading = np.arctan2(heading_vec[1], heading_vec[0])
+        if len(template.markers) == 2:
+            heading = heading - np.pi if heading > np.pi/2 else heading
+            heading = heading + np.pi if heading < -np.pi/2 else heading
+
+        objects.append({
+            "pos": np.mean(object_points[assigned], axis=0),
+            "heading": -heading,
+            "error": np.mean(np.asarray(errors)[assigned]),
+            "droneIndex": template_index
+        })
+
+    return objects
@@ -1,4 +1,7 @@
+import os
 import numpy as np
+from flags import INTRINSICS_PROFILE
+from intrinsics_profile import load_intrinsics_profile
 
 intrinsic_cam1 = np.array([
     [274.3007,   0.        , 168.9204],
@@ -30,3 +33,9 @@ intrinsic_cam4 = np.array([
 dist_cam4 = np.array([-0.1265,0.1176,    0.0005,    0.0009,0])
 intrinsic_matrices = [intrinsic_cam1, intrinsic_cam2, intrinsic_cam3,  intrinsic_cam4]
 distortion_coefs = [dist_cam1, dist_cam2, dist_cam3,  dist_cam4]
+
+# Cameras missing from the profile keep the values above
+if os.path.exists(INTRINSICS_PROFILE):
+    profile_intrinsics, profile_distortion = load_intrinsics_profile(INTRINSICS_PROFILE)
+    intrinsic_matrices = profile_intrinsics + intrinsic_matrices[len(profile_intrinsics):]
+    distortion_coefs = profile_distortion + distortion_coefs[len(profile_distortion):]
@@ -0,0 +1,40 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# The server runs from server/ and imports its modules by name
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from settings import intrinsic_matrices
+from SyntheticCameraSource import FRAME_DIMENSIONS, ring_camera_poses
+from helpers import camera_poses_to_projection_matrices, project_points
+
+
+def relative_camera_poses(world_poses):
+    # Poses relative to the first camera, as pose calibration produces them
+    R0, t0 = world_poses[0]["R"], world_poses[0]["t"]
+    return [{"R": pose["R"] @ R0.T, "t": pose["t"] - pose["R"] @ R0.T @ t0} for pose in world_poses]
+
+
+@pytest.fixture
+def synthetic_capture():
+    """
+    A wand capture seen by the ring of synthetic cameras, with pixel noise and dropped
+    observations. Returns the image points (NaN where unseen), the true poses relative to the
+    first camera and the world points.
+    """
+    rng = np.random.default_rng(0)
+    num_samples = 600
+    num_cameras = len(intrinsic_matrices)
+
+    world_poses = ring_camera_poses(num_cameras)
+    true_poses = relative_camera_poses(world_poses)
+    world_points = rng.uniform((-1, -1, 0), (1, 1, 1), (num_samples, 3))
+    camera_points = world_points @ world_poses[0]["R"].T + world_poses[0]["t"]
+
+    image_points = project_points(camera_points, camera_poses_to_projection_matrices(true_poses, intrinsic_matrices))
+    image_points += rng.normal(0, 0.3, image_points.shape)
+    out_of_frame = np.any((image_points < 0) | (image_points >= FRAME_DIMENSIONS), axis=2)
+    image_points[out_of_frame | (rng.random((num_samples, num_cameras)) < 0.2)] = np.nan
+    return image_points, true_poses, camera_points
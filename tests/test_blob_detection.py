@@ -0,0 +1,25 @@
+import cv2 as cv
+import numpy as np
+
+from blob_detection import Detectors, find_dots
+
+
+def frame_with_hot_pixels():
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    cv.circle(frame, (80, 60), 3, (255, 255, 255), -1)
+    frame[10, 10] = 255
+    frame[100, 20:22] = 255
+    return frame
+
+def test_components_ignores_hot_pixels_by_default():
+    frame = frame_with_hot_pixels()
+
+    _, components = find_dots(frame, 0.4, Detectors.Components)
+    _, contours = find_dots(frame, 0.4, Detectors.Contours)
+
+    assert len(components) == len(contours) == 1
+    np.testing.assert_allclose(components[0], (80, 60), atol=0.5)
+
+def test_components_reports_hot_pixels_without_an_area_floor():
+    _, components = find_dots(frame_with_hot_pixels(), 0.4, Detectors.Components, min_area=0)
+    assert len(components) == 3
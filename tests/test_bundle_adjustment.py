@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation
+
+from settings import intrinsic_matrices, distortion_coefs
+from helpers import (
+    bundle_adjustment,
+    calculate_reprojection_errors,
+    camera_poses_to_projection_matrices,
+    triangulate_points
+)
+
+
+def perturbed_poses(poses, rng):
+    return [poses[0]] + [
+        {
+            "R": Rotation.from_rotvec(rng.normal(0, 0.02, 3)).as_matrix() @ pose["R"],
+            "t": pose["t"] + rng.normal(0, 0.05, 3)
+        }
+        for pose in poses[1:]
+    ]
+
+def worst_rotation_error(poses, true_poses):
+    return max(
+        Rotation.from_matrix(np.asarray(pose["R"]) @ np.asarray(true_pose["R"]).T).magnitude()
+        for pose, true_pose in zip(poses, true_poses)
+    )
+
+
+@pytest.mark.parametrize("loss", ["linear", "huber", "soft_l1"])
+def test_bundle_adjustment_recovers_poses(synthetic_capture, loss):
+    image_points, true_poses, _ = synthetic_capture
+    starting_poses = perturbed_poses(true_poses, np.random.default_rng(1))
+
+    poses = bundle_adjustment(image_points, intrinsic_matrices, distortion_coefs, starting_poses, loss=loss, verbose=0)
+
+    projection_matrices = camera_poses_to_projection_matrices(poses, intrinsic_matrices)
+    object_points = triangulate_points(image_points, projection_matrices)
+    error = np.mean(calculate_reprojection_errors(image_points, object_points, projection_matrices))
+    # 0.3 px noise on each axis gives a mean squared error around 0.05 px^2 once converged
+    assert error < 0.1
+    assert np.degrees(worst_rotation_error(poses, true_poses)) < 0.2
+    # the first camera defines the frame and never moves
+    np.testing.assert_allclose(poses[0]["R"], true_poses[0]["R"], atol=1e-12)
+
+def test_bundle_adjustment_progress_only_reports_improvements(synthetic_capture):
+    image_points, true_poses, _ = synthetic_capture
+    starting_poses = perturbed_poses(true_poses, np.random.default_rng(1))
+    reports = []
+
+    bundle_adjustment(
+        image_points, intrinsic_matrices, distortion_coefs, starting_poses, verbose=0,
+        progress=lambda evaluations, cost: reports.append((evaluations, cost))
+    )
+
+    evaluations, costs = np.array(reports).T
+    assert len(reports) > 1
+    assert np.all(np.diff(costs) < 0)
+    # the jacobian probes in between are skipped
+    assert evaluations[-1] > len(reports)
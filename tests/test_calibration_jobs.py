@@ -0,0 +1,62 @@
+import threading
+import numpy as np
+
+from settings import intrinsic_matrices, distortion_coefs
+from CalibrationJobRunner import CalibrationJobRunner, CalibrationJobs
+
+
+class RecordingCallbacks:
+    def __init__(self):
+        self.events = []
+        self.done = threading.Event()
+
+    def runner(self):
+        return CalibrationJobRunner(
+            lambda job_id, kind: self.events.append(("started", job_id)),
+            lambda job_id, evaluations, cost: None,
+            self.finished,
+            self.error,
+            lambda job_id: self.events.append(("cancelled", job_id))
+        )
+
+    def finished(self, job_id, kind, camera_poses, image_points):
+        self.events.append(("finished", job_id, camera_poses, image_points))
+        self.done.set()
+
+    def error(self, job_id, message):
+        self.events.append(("error", job_id, message))
+        self.done.set()
+
+
+def test_superseded_job_is_cancelled_and_finished_job_gets_all_samples(synthetic_capture):
+    image_points, true_poses, _ = synthetic_capture
+    callbacks = RecordingCallbacks()
+    runner = callbacks.runner()
+    selected = np.arange(0, len(image_points), 2)
+
+    first = runner.start(
+        CalibrationJobs.BundleAdjustment, image_points, intrinsic_matrices, distortion_coefs, true_poses
+    )
+    second = runner.start(
+        CalibrationJobs.BundleAdjustment, image_points, intrinsic_matrices, distortion_coefs, true_poses, selected
+    )
+    assert callbacks.done.wait(60)
+
+    assert [event[:2] for event in callbacks.events] == [
+        ("started", first), ("cancelled", first), ("started", second), ("finished", second)
+    ]
+    assert callbacks.events[-1][3] is image_points
+    assert len(callbacks.events[-1][2]) == len(true_poses)
+
+def test_cancel_only_stops_the_given_job(synthetic_capture):
+    image_points, true_poses, _ = synthetic_capture
+    callbacks = RecordingCallbacks()
+    runner = callbacks.runner()
+
+    job_id = runner.start(
+        CalibrationJobs.BundleAdjustment, image_points, intrinsic_matrices, distortion_coefs, true_poses
+    )
+    assert not runner.cancel(job_id + 1)
+    assert runner.cancel(job_id)
+    assert not runner.cancel(job_id)
+    assert callbacks.events == [("started", job_id), ("cancelled", job_id)]
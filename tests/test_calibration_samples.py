@@ -0,0 +1,56 @@
+import numpy as np
+
+from CalibrationSampleBuffer import CalibrationSampleBuffer, select_samples
+from SyntheticCameraSource import FRAME_DIMENSIONS
+
+
+def test_select_samples_keeps_everything_under_the_cap(synthetic_capture):
+    image_points, _, _ = synthetic_capture
+    seen_twice = np.sum(~np.any(np.isnan(image_points), axis=2), axis=1) >= 2
+
+    selected, coverage = select_samples(image_points, FRAME_DIMENSIONS, max_samples=len(image_points))
+
+    np.testing.assert_array_equal(selected, np.flatnonzero(seen_twice))
+    assert len(coverage) == image_points.shape[1]
+
+def test_select_samples_drops_only_true_duplicates(synthetic_capture):
+    image_points, _, _ = synthetic_capture
+    # the wand held still, the same sample repeated with sub-pixel jitter
+    held = np.repeat(image_points[:1], 50, axis=0)
+    held = np.floor(held) + np.random.default_rng(0).uniform(0.1, 0.9, held.shape)
+    samples = np.concatenate((image_points, held))
+
+    selected, _ = select_samples(samples, FRAME_DIMENSIONS, max_samples=len(samples))
+
+    assert np.sum(selected >= len(image_points)) <= 1
+    assert np.sum(selected < len(image_points)) > 0.9 * len(image_points)
+
+def test_select_samples_fills_to_the_cap_and_spreads_out(synthetic_capture):
+    image_points, _, _ = synthetic_capture
+    max_samples = 200
+
+    selected, coverage = select_samples(image_points, FRAME_DIMENSIONS, max_samples=max_samples)
+    _, all_coverage = select_samples(image_points, FRAME_DIMENSIONS, max_samples=len(image_points))
+
+    assert len(selected) == max_samples
+    assert len(np.unique(selected)) == max_samples
+    # picking for coverage keeps most of the image covered with a third of the samples
+    for camera, all_camera in zip(coverage, all_coverage):
+        assert camera["coverage"] >= 0.8 * all_camera["coverage"]
+
+def test_sample_buffer_grows_and_round_trips(tmp_path):
+    buffer = CalibrationSampleBuffer(3, capacity=2)
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 100, (5, 3, 2))
+    visible = rng.random((5, 3)) < 0.7
+    for sample_points, sample_visible in zip(points, visible):
+        buffer.add(sample_points, sample_visible)
+
+    expected = np.where(visible[:, :, np.newaxis], points.astype(np.float32), np.nan)
+    np.testing.assert_array_equal(buffer.samples(), expected)
+    np.testing.assert_array_equal(buffer.camera_counts(), np.sum(visible, axis=0))
+
+    buffer.save(tmp_path / "samples.npz")
+    loaded = CalibrationSampleBuffer(3)
+    loaded.load(tmp_path / "samples.npz")
+    np.testing.assert_array_equal(loaded.samples(), expected)
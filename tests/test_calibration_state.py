@@ -0,0 +1,85 @@
+import numpy as np
+
+from settings import intrinsic_matrices, distortion_coefs
+from CalibrationState import CalibrationState
+from helpers import camera_poses_to_serializable
+from SyntheticCameraSource import FRAME_DIMENSIONS
+
+
+def calibrated_state(true_poses):
+    to_world = np.eye(4)
+    to_world[:3, 3] = (0.1, -0.2, 0.3)
+    return CalibrationState(
+        intrinsic_matrices, distortion_coefs, len(true_poses), FRAME_DIMENSIONS, true_poses, to_world
+    )
+
+def test_save_load_round_trip(synthetic_capture, tmp_path):
+    _, true_poses, _ = synthetic_capture
+    state = calibrated_state(true_poses)
+
+    state.save(tmp_path / "profile.npz")
+    loaded = CalibrationState.load(tmp_path / "profile.npz")
+
+    assert loaded.num_cameras == state.num_cameras
+    assert loaded.dimensions == state.dimensions
+    np.testing.assert_array_equal(loaded.intrinsic_matrices, state.intrinsic_matrices)
+    np.testing.assert_array_equal(loaded.to_world_coords_matrix, state.to_world_coords_matrix)
+    for pose, loaded_pose in zip(state.camera_poses, loaded.camera_poses):
+        np.testing.assert_array_equal(loaded_pose["R"], pose["R"])
+        np.testing.assert_array_equal(np.ravel(loaded_pose["t"]), np.ravel(pose["t"]))
+    for name in ("projection_matrices", "world_projection_matrices", "fundamental_matrices"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(state, name))
+    for (map1, map2), (loaded_map1, loaded_map2) in zip(state.undistort_maps, loaded.undistort_maps):
+        np.testing.assert_array_equal(loaded_map1, map1)
+        np.testing.assert_array_equal(loaded_map2, map2)
+
+def test_profile_without_poses_round_trips(tmp_path):
+    state = CalibrationState(intrinsic_matrices, distortion_coefs, 2, FRAME_DIMENSIONS)
+
+    state.save(tmp_path / "profile.npz")
+    loaded = CalibrationState.load(tmp_path / "profile.npz")
+
+    assert loaded.camera_poses is None
+    assert loaded.projection_matrices is None
+    assert loaded.to_world_coords_matrix is None
+
+def test_with_profile_keeps_current_intrinsics(synthetic_capture, tmp_path):
+    _, true_poses, _ = synthetic_capture
+    calibrated_state(true_poses).save(tmp_path / "profile.npz")
+    profile = CalibrationState.load(tmp_path / "profile.npz")
+
+    # the intrinsics were re-calibrated since the profile was saved
+    new_intrinsics = [K.copy() for K in intrinsic_matrices]
+    new_intrinsics[1][0, 0] += 5
+    current = CalibrationState(new_intrinsics, distortion_coefs, len(true_poses), FRAME_DIMENSIONS)
+    state = current.with_profile(profile)
+
+    assert state.intrinsic_matrices is new_intrinsics
+    expected = CalibrationState(
+        new_intrinsics, distortion_coefs, len(true_poses), FRAME_DIMENSIONS, true_poses, profile.to_world_coords_matrix
+    )
+    np.testing.assert_allclose(state.world_projection_matrices, expected.world_projection_matrices)
+    np.testing.assert_allclose(state.fundamental_matrices, expected.fundamental_matrices)
+
+def test_with_profile_reuses_caches_for_matching_intrinsics(synthetic_capture, tmp_path):
+    _, true_poses, _ = synthetic_capture
+    calibrated_state(true_poses).save(tmp_path / "profile.npz")
+    profile = CalibrationState.load(tmp_path / "profile.npz")
+
+    current = CalibrationState(intrinsic_matrices, distortion_coefs, len(true_poses), FRAME_DIMENSIONS)
+    state = current.with_profile(profile)
+
+    assert state.fundamental_matrices is profile.fundamental_matrices
+    assert state.undistort_maps is profile.undistort_maps
+
+def test_serializing_poses_leaves_state_untouched(synthetic_capture):
+    _, true_poses, _ = synthetic_capture
+    state = calibrated_state(true_poses)
+
+    serialized = camera_poses_to_serializable(state.camera_poses)
+    serialized[0]["t"] = [0, 0, 0]
+
+    assert isinstance(state.camera_poses[0]["R"], np.ndarray)
+    np.testing.assert_array_equal(state.camera_poses[0]["t"], true_poses[0]["t"])
+    # poses set from the UI are already lists
+    assert camera_poses_to_serializable(serialized) == serialized
@@ -0,0 +1,49 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from settings import intrinsic_matrices, distortion_coefs
+from CameraWorkerPool import CameraWorkerPool, CameraWorkerError
+from FrameRingBuffer import FrameRingBuffer
+from SyntheticCameraSource import FRAME_DIMENSIONS
+
+NUM_CAMERAS = 2
+DETECTION_SETTINGS = {"threshold": 0.4}
+
+
+@pytest.fixture
+def pool():
+    raw_frames = FrameRingBuffer(NUM_CAMERAS, FRAME_DIMENSIONS)
+    processed_frames = FrameRingBuffer(NUM_CAMERAS, FRAME_DIMENSIONS)
+    pool = CameraWorkerPool(NUM_CAMERAS, FRAME_DIMENSIONS, raw_frames, processed_frames)
+    pool.set_intrinsics(intrinsic_matrices, distortion_coefs)
+    yield pool, raw_frames
+    pool.end()
+    raw_frames.end()
+    processed_frames.end()
+
+def frame_with_dot(center):
+    width, height = FRAME_DIMENSIONS
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    cv.circle(frame, center, 3, (255, 255, 255), -1)
+    return frame
+
+def test_bad_frame_gives_no_dots_and_the_worker_carries_on(pool):
+    pool, raw_frames = pool
+    sequence_number = raw_frames.write([frame_with_dot((100, 80)), frame_with_dot((200, 150))], [0, 0])
+
+    # an unknown detection setting makes the detector raise in every worker
+    image_points, _ = pool.process(sequence_number, None, True, True, False, False, {**DETECTION_SETTINGS, "bad": 1})
+    assert all(len(points) == 0 for points in image_points)
+
+    image_points, _ = pool.process(sequence_number, None, True, True, False, False, DETECTION_SETTINGS)
+    assert all(len(points) == 1 for points in image_points)
+
+def test_dead_worker_raises(pool):
+    pool, raw_frames = pool
+    sequence_number = raw_frames.write([frame_with_dot((100, 80)), frame_with_dot((200, 150))], [0, 0])
+    pool.processes[1].kill()
+    pool.processes[1].join()
+
+    with pytest.raises(CameraWorkerError):
+        pool.process(sequence_number, None, True, True, False, False, DETECTION_SETTINGS)
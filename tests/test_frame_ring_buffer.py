@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from FrameRingBuffer import FrameRingBuffer
+
+NUM_CAMERAS = 2
+DIMENSIONS = (8, 4)
+NUM_SLOTS = 3
+
+
+@pytest.fixture
+def ring_buffer():
+    ring_buffer = FrameRingBuffer(NUM_CAMERAS, DIMENSIONS, num_slots=NUM_SLOTS)
+    yield ring_buffer
+    ring_buffer.end()
+
+def frames(value):
+    width, height = DIMENSIONS
+    return [np.full((height, width, 3), value + camera, dtype=np.uint8) for camera in range(NUM_CAMERAS)]
+
+def test_write_returns_increasing_sequence_numbers(ring_buffer):
+    sequence_numbers = [ring_buffer.write(frames(i), [i, i]) for i in range(5)]
+    assert sequence_numbers == list(range(5))
+
+def test_wrapping_invalidates_overwritten_frames(ring_buffer):
+    sequence_numbers = [ring_buffer.write(frames(10 * i), [i, i]) for i in range(NUM_SLOTS + 1)]
+
+    assert not ring_buffer.is_valid(sequence_numbers[0])
+    for sequence_number in sequence_numbers[1:]:
+        assert ring_buffer.is_valid(sequence_number)
+    # the first slot now holds the newest frame
+    assert ring_buffer.view(sequence_numbers[-1], 1)[0, 0, 0] == 10 * NUM_SLOTS + 1
+    np.testing.assert_array_equal(ring_buffer.timestamps[ring_buffer.slot(sequence_numbers[-1])], [NUM_SLOTS] * 2)
+
+def test_claimed_slot_is_invalid_until_committed(ring_buffer):
+    old = [ring_buffer.write(frames(0), [0, 0]) for _ in range(NUM_SLOTS)]
+
+    sequence_number = ring_buffer.claim()
+    assert ring_buffer.slot(sequence_number) == ring_buffer.slot(old[0])
+    assert not ring_buffer.is_valid(old[0])
+    assert not ring_buffer.is_valid(sequence_number)
+
+    ring_buffer.commit(sequence_number, [1, 1])
+    assert ring_buffer.is_valid(sequence_number)
+    assert not ring_buffer.is_valid(old[0])
+
+def test_views_share_memory_with_the_slot(ring_buffer):
+    sequence_number = ring_buffer.write(frames(0), [0, 0])
+    width = DIMENSIONS[0]
+
+    stacked = ring_buffer.view(sequence_number)
+    assert stacked.shape == (DIMENSIONS[1], width * NUM_CAMERAS, 3)
+    assert np.shares_memory(stacked, ring_buffer.view(sequence_number, 1))
+    np.testing.assert_array_equal(stacked[:, width:], frames(0)[1])
+
+def test_attached_buffer_sees_owner_frames(ring_buffer):
+    sequence_number = ring_buffer.write(frames(5), [0, 0])
+    attached = FrameRingBuffer(NUM_CAMERAS, DIMENSIONS, num_slots=NUM_SLOTS, name=ring_buffer.name)
+    try:
+        np.testing.assert_array_equal(attached.view(sequence_number, 0), frames(5)[0])
+    finally:
+        attached.end()
@@ -0,0 +1,46 @@
+import numpy as np
+from scipy.signal import butter, lfilter
+
+from LowPassFilter import LowPassFilter
+
+CUTOFF_FREQUENCY = 8
+SAMPLING_FREQUENCY = 100
+
+
+def lfilter_reference(samples, order=5):
+    b, a = butter(order, CUTOFF_FREQUENCY / (SAMPLING_FREQUENCY / 2), btype="low")
+    return lfilter(b, a, samples, axis=0)
+
+def test_streaming_matches_lfilter():
+    rng = np.random.default_rng(0)
+    samples = rng.normal(size=(200, 3, 2)).cumsum(axis=0)
+    low_pass_filter = LowPassFilter(CUTOFF_FREQUENCY, SAMPLING_FREQUENCY, (3, 2))
+
+    filtered = np.array([low_pass_filter.filter(sample).copy() for sample in samples])
+
+    np.testing.assert_allclose(filtered, lfilter_reference(samples), atol=1e-9)
+
+def test_index_filters_rows_independently():
+    rng = np.random.default_rng(1)
+    samples = rng.normal(size=(100, 2, 3))
+    low_pass_filter = LowPassFilter(CUTOFF_FREQUENCY, SAMPLING_FREQUENCY, (2, 3))
+
+    # Row 1 only gets every other sample, as if that object was missed in between
+    filtered = [[], []]
+    for i, sample in enumerate(samples):
+        filtered[0].append(low_pass_filter.filter(sample[0], 0).copy())
+        if i % 2 == 0:
+            filtered[1].append(low_pass_filter.filter(sample[1], 1).copy())
+
+    np.testing.assert_allclose(filtered[0], lfilter_reference(samples[:, 0]), atol=1e-9)
+    np.testing.assert_allclose(filtered[1], lfilter_reference(samples[::2, 1]), atol=1e-9)
+
+def test_reset_starts_from_zero_state():
+    samples = np.ones((50, 3))
+    low_pass_filter = LowPassFilter(CUTOFF_FREQUENCY, SAMPLING_FREQUENCY, 3)
+    for sample in samples:
+        low_pass_filter.filter(sample)
+
+    low_pass_filter.reset()
+
+    np.testing.assert_allclose(low_pass_filter.filter(samples[0]), lfilter_reference(samples)[0])
@@ -0,0 +1,38 @@
+import time
+import numpy as np
+import pytest
+
+from FrameBroadcaster import FrameBroadcaster
+from FrameRingBuffer import FrameRingBuffer
+from PreviewEncoder import PreviewEncoder, PreviewEncoderSettings
+from SyntheticCameraSource import FRAME_DIMENSIONS
+
+
+@pytest.fixture
+def stream():
+    ring_buffer = FrameRingBuffer(1, FRAME_DIMENSIONS)
+    broadcaster = FrameBroadcaster()
+    encoder = PreviewEncoder(broadcaster.subscribe(0), PreviewEncoderSettings(fps=1000))
+    yield ring_buffer, broadcaster, encoder
+    encoder.close()
+    ring_buffer.end()
+
+def test_get_blocks_until_timeout_without_frames(stream):
+    _, _, encoder = stream
+    start = time.time()
+    assert encoder.get(timeout=0.2) is None
+    assert time.time() - start >= 0.2
+    assert encoder.is_running()
+
+def test_get_returns_published_frame(stream):
+    ring_buffer, broadcaster, encoder = stream
+    width, height = FRAME_DIMENSIONS
+    sequence_number = ring_buffer.write([np.zeros((height, width, 3), dtype=np.uint8)], [0])
+    broadcaster.publish(ring_buffer, sequence_number)
+    jpeg = encoder.get(timeout=2)
+    assert jpeg is not None and jpeg.startswith(b"\xff\xd8")
+
+def test_is_running_false_after_close(stream):
+    _, _, encoder = stream
+    encoder.close()
+    assert not encoder.is_running()
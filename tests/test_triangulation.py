@@ -0,0 +1,41 @@
+import numpy as np
+
+from settings import intrinsic_matrices
+from helpers import DLT, camera_poses_to_projection_matrices
+
+
+def dlt_loop(Ps, image_points):
+    # The one point at a time DLT the batched version replaced, fed only the cameras that saw it
+    object_points = []
+    for image_points_i in image_points:
+        visible = ~np.any(np.isnan(image_points_i), axis=1)
+        if np.sum(visible) <= 1:
+            object_points.append(np.full(3, np.nan))
+            continue
+        A = []
+        for P, image_point in zip(Ps[visible], image_points_i[visible]):
+            A.append(image_point[1] * P[2, :] - P[1, :])
+            A.append(P[0, :] - image_point[0] * P[2, :])
+        A = np.array(A)
+        _, _, Vh = np.linalg.svd(A.T @ A)
+        object_points.append(Vh[3, 0:3] / Vh[3, 3])
+    return np.array(object_points)
+
+def test_batched_dlt_matches_loop(synthetic_capture):
+    image_points, true_poses, _ = synthetic_capture
+    Ps = np.array(camera_poses_to_projection_matrices(true_poses, intrinsic_matrices))
+
+    object_points = DLT(Ps, image_points)
+
+    np.testing.assert_allclose(object_points, dlt_loop(Ps, image_points), atol=1e-6)
+
+def test_dlt_recovers_points_seen_by_two_cameras(synthetic_capture):
+    image_points, true_poses, camera_points = synthetic_capture
+    Ps = np.array(camera_poses_to_projection_matrices(true_poses, intrinsic_matrices))
+    seen = np.sum(~np.any(np.isnan(image_points), axis=2), axis=1)
+
+    object_points = DLT(Ps, image_points)
+
+    assert np.all(np.isnan(object_points[seen <= 1]))
+    errors = np.linalg.norm(object_points[seen >= 2] - camera_points[seen >= 2], axis=1)
+    assert np.median(errors) < 0.01
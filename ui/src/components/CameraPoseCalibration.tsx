@@ -1,6 +1,6 @@
 import { useEffect, useState } from 'react';
 import { socket } from '../lib/socket';
-import { Button, Col, Container, Row } from 'react-bootstrap';
+import { Button, Col, Container, Form, Row } from 'react-bootstrap';
 import { Modes } from '../lib/modes';
 import InfoTooltip from './InfoTooltip';
 import useSocketListener from '../hooks/useSocketListener';
@@ -8,16 +8,6 @@ import SmallHeader from './SmallHeader';
 import Toast from 'react-bootstrap/Toast';
 import { ToastContainer } from 'react-bootstrap';
 
-const isValidJson = (str: string) => {
-    try {
-        const o = JSON.parse(str);
-        if (o && typeof o === "object") {
-            return true;
-        }
-    } catch (e) { }
-    return false;
-}
-
 interface Props { 
     mocapMode: Modes,
     cameraPoses: any,
@@ -25,57 +15,82 @@ interface Props {
     setReprojectedPoints: (newPoints: unknown) => void
 }
 
-function numberOfAngles(point: Array<Array<number>>){
-    let notNull = 0;
-    point.forEach((cam) => {
-        if (cam[0] != null) {
-            notNull++;
-        }
-    })
-    return notNull;
-}
-
 export default function CameraPoseCalibration({ mocapMode, cameraPoses, setParsedCapturedPointsForPose, setReprojectedPoints }: Props) {
     const [isCalculatingPose, setIsCalculatingPose] = useState(false);
-    const [captureNextPointForPose, setCaptureNextPointForPose] = useState(false)
-    const [capturedPointsForPose, setCapturedPointsForPose] = useState("");
     const [showPoseCalibrationResult, setShowPoseCalibrationResult] = useState(false)
     const [reprojectionError, setReprojectionError] = useState(0);
+    const [calibrationJobId, setCalibrationJobId] = useState<number | null>(null);
+    const [calibrationProgress, setCalibrationProgress] = useState<{evaluations: number, cost: number} | null>(null);
+    // How many samples the last solve used and how much of each camera image they covered
+    const [solveSampleCount, setSolveSampleCount] = useState<number | null>(null);
+    const [solveCoverage, setSolveCoverage] = useState<Array<{samples: number, coverage: number}>>([]);
+    // Samples are captured and kept on the server, these are copies for drawing
+    const [calibrationSamples, setCalibrationSamples] = useState<Array<Array<Array<number>>>>([]);
+    const [cameraSampleCounts, setCameraSampleCounts] = useState<Array<number>>([]);
+    const [isCapturingSamples, setIsCapturingSamples] = useState(false);
+    const [samplesName, setSamplesName] = useState("calibration");
+    // Whole calibrations, poses, to-world matrix and intrinsics, saved on the server by name
+    const [profileName, setProfileName] = useState("default");
+    const [calibrationProfiles, setCalibrationProfiles] = useState<Array<string>>([]);
+
     useEffect(() => {
-        const handler = (data: any) => {
-            if (captureNextPointForPose) {
-                // TODO - This should consider the number of active cams
-                if (numberOfAngles(data) === 4) {
-                    const newVal = `${capturedPointsForPose}${JSON.stringify(data)},`;
-                    setCapturedPointsForPose(newVal);
-                    setParsedCapturedPointsForPose(JSON.parse(`[${newVal.slice(0, -1)}]`))
-                    setCaptureNextPointForPose(false);
-                }
-            }
-        }
-        socket.on("image-points", handler)
+        socket.emit("list-calibration-profiles");
+    }, []);
+    useSocketListener("calibration-profiles", setCalibrationProfiles);
 
-        return () => {
-            socket.off("image-points", handler)
-        }
-    }, [capturedPointsForPose, captureNextPointForPose])
-    const calculateCameraPose = async (cameraPoints: Array<Array<Array<number>>>) => {
+    useEffect(() => {
+        setParsedCapturedPointsForPose(calibrationSamples);
+    }, [calibrationSamples]);
+
+    useSocketListener("calibration-samples", (data) => {
+        // Batches can arrive faster than renders, so append to the latest samples rather than the closure's
+        setCalibrationSamples(prev => data.reset ? data.samples : [...prev, ...data.samples]);
+        setCameraSampleCounts(data.cameraCounts);
+        setIsCapturingSamples(data.capturing);
+    });
+
+    const calculateCameraPose = async () => {
         setIsCalculatingPose(true);
-        socket.emit("calculate-camera-pose", { cameraPoints })
+        socket.emit("calculate-camera-pose")
     }
 
-    const calculateBundleAdjustment = async (cameraPoints: Array<Array<Array<number>>>) => {
+    const calculateBundleAdjustment = async () => {
         setIsCalculatingPose(true);
-        socket.emit("calculate-bundle-adjustment", { cameraPoints, cameraPoses })
+        socket.emit("calculate-bundle-adjustment")
+    }
+    const cancelCalibrationJob = () => {
+        if (calibrationJobId === null) {
+            // No job has started on the server, so there is nothing to wait for
+            setIsCalculatingPose(false);
+            return;
+        }
+        socket.emit("cancel-calibration-job", { jobId: calibrationJobId })
     }
+    useSocketListener("calibration-job", (data) => {
+        if (data.status === "started") {
+            setIsCalculatingPose(true);
+            setCalibrationJobId(data.jobId);
+            setCalibrationProgress(null);
+        } else {
+            // finished jobs are followed by a camera-pose event
+            setIsCalculatingPose(false);
+            setCalibrationJobId(null);
+        }
+    });
+    useSocketListener("calibration-coverage", (data) => {
+        setSolveSampleCount(data.samples);
+        setSolveCoverage(data.coverage);
+    });
+    useSocketListener("calibration-progress", (data) => {
+        setCalibrationProgress({evaluations: data.evaluations, cost: data.cost});
+    });
     useSocketListener("camera-pose", (data) => {
         setIsCalculatingPose(false);
         setShowPoseCalibrationResult(true);
         setReprojectionError(data.error)
     });
 
-    const parsedPoints = isValidJson(`[${capturedPointsForPose.slice(0, -1)}]`) ? JSON.parse(`[${capturedPointsForPose.slice(0, -1)}]`) : [];
-    const countOfPointsForCameraPoseCalibration =  parsedPoints.length;
+    const countOfPointsForCameraPoseCalibration = calibrationSamples.length;
     const pointCaptureAvailable = mocapMode === Modes.PointCapture;
 
     return <>
@@ -87,22 +102,39 @@ export default function CameraPoseCalibration({ mocapMode, cameraPoses, setParse
                         size='sm'
                         variant="outline-primary"
                         className="mr-2"
-                        disabled={!pointCaptureAvailable || isCalculatingPose}
+                        disabled={!pointCaptureAvailable || isCalculatingPose || isCapturingSamples}
                         onClick={() => {
-                            setCaptureNextPointForPose(true);
+                            socket.emit("start-calibration-capture", { continuous: false });
                         }
                         }>
                         Record point
                     </Button>
                 </InfoTooltip>
+                <InfoTooltip disabled={pointCaptureAvailable} message="Enable point capture mode to record points">
+                    <Button
+                        size='sm'
+                        variant={isCapturingSamples ? "primary" : "outline-primary"}
+                        className="mr-2"
+                        disabled={!pointCaptureAvailable || isCalculatingPose}
+                        onClick={() => {
+                            if (isCapturingSamples) {
+                                socket.emit("stop-calibration-capture");
+                            } else {
+                                setIsCapturingSamples(true);
+                                socket.emit("start-calibration-capture", { continuous: true });
+                            }
+                        }
+                        }>
+                        {isCapturingSamples ? "Stop recording" : "Record continuously"}
+                    </Button>
+                </InfoTooltip>
                 <InfoTooltip disabled={countOfPointsForCameraPoseCalibration > 0} message="No points recorded">
                     <Button
                         size='sm'
                         variant="outline-danger"
                         disabled={countOfPointsForCameraPoseCalibration === 0 || isCalculatingPose}
                         onClick={() => {
-                            setCapturedPointsForPose("")
-                            setParsedCapturedPointsForPose([]);
+                            socket.emit("clear-calibration-samples");
                             setReprojectedPoints([])
                         }
                     }>
@@ -114,9 +146,60 @@ export default function CameraPoseCalibration({ mocapMode, cameraPoses, setParse
             <Row>
                 <Col>
                     <SmallHeader>Recorded points</SmallHeader>
-                    <pre style={{border: "1px solid", height: 300, overflowY: "auto"}}>
-                        {JSON.stringify(parsedPoints, null, 2)}
-                    </pre>
+                    <p>
+                        {cameraSampleCounts.map((count, i) => `Camera ${i + 1}: ${count}`).join(", ")}
+                    </p>
+                    <Form.Control
+                        size='sm'
+                        value={samplesName}
+                        onChange={(event) => setSamplesName(event.target.value)}
+                        className="mb-2"
+                    />
+                    <Button
+                        size='sm'
+                        className="mr-2"
+                        variant="outline-primary"
+                        disabled={countOfPointsForCameraPoseCalibration === 0}
+                        onClick={() => socket.emit("save-calibration-samples", { name: samplesName })}>
+                        Save points
+                    </Button>
+                    <Button
+                        size='sm'
+                        variant="outline-primary"
+                        disabled={isCapturingSamples || isCalculatingPose}
+                        onClick={() => socket.emit("load-calibration-samples", { name: samplesName })}>
+                        Load points
+                    </Button>
+                </Col>
+            </Row>
+            <Row className="mt-2">
+                <Col>
+                    <SmallHeader>Calibration profile</SmallHeader>
+                    <Form.Control
+                        size='sm'
+                        list="calibration-profiles"
+                        value={profileName}
+                        onChange={(event) => setProfileName(event.target.value)}
+                        className="mb-2"
+                    />
+                    <datalist id="calibration-profiles">
+                        {calibrationProfiles.map((name) => <option key={name} value={name} />)}
+                    </datalist>
+                    <Button
+                        size='sm'
+                        className="mr-2"
+                        variant="outline-primary"
+                        disabled={isCalculatingPose}
+                        onClick={() => socket.emit("save-calibration-profile", { name: profileName })}>
+                        Save profile
+                    </Button>
+                    <Button
+                        size='sm'
+                        variant="outline-primary"
+                        disabled={isCalculatingPose}
+                        onClick={() => socket.emit("load-calibration-profile", { name: profileName })}>
+                        Load profile
+                    </Button>
                 </Col>
             </Row>
             <Row className="mt-2">
@@ -125,9 +208,9 @@ export default function CameraPoseCalibration({ mocapMode, cameraPoses, setParse
                         size='sm'
                         className="mr-2"
                         variant="outline-primary"
-                        // disabled={countOfPointsForCameraPoseCalibration === 0 || isCalculatingPose}
+                        disabled={countOfPointsForCameraPoseCalibration === 0 || isCalculatingPose}
                         onClick={() => {
-                            calculateCameraPose(parsedPoints)
+                            calculateCameraPose()
                         }}>
                         Full camera pose
                     </Button>
@@ -137,13 +220,30 @@ export default function CameraPoseCalibration({ mocapMode, cameraPoses, setParse
                         variant="outline-primary"
                         disabled={countOfPointsForCameraPoseCalibration === 0 || isCalculatingPose}
                         onClick={() => {
-                            calculateBundleAdjustment(parsedPoints)
+                            calculateBundleAdjustment()
                         }}>
                         Bundle Adjustment
                     </Button>
-                    {isCalculatingPose && <span onClick={() => setIsCalculatingPose(false)}>Calculating...</span>}
+                    {isCalculatingPose && <>
+                        <span className="mr-2">
+                            Calculating...
+                            {calibrationProgress && ` ${calibrationProgress.evaluations} evaluations, cost ${calibrationProgress.cost.toFixed(2)}`}
+                        </span>
+                        <Button
+                            size='sm'
+                            variant="outline-danger"
+                            onClick={cancelCalibrationJob}>
+                            Cancel
+                        </Button>
+                    </>}
                 </Col>
             </Row>
+            {solveSampleCount !== null && <Row className="mt-2">
+                <Col>
+                    Solved with {solveSampleCount} of {countOfPointsForCameraPoseCalibration} samples. Image coverage:
+                    {solveCoverage.map((camera, i) => ` cam ${i} ${Math.round(camera.coverage*100)}% (${camera.samples})`).join(",")}
+                </Col>
+            </Row>}
             <Row>
                 <Col>
                 <details>
@@ -153,7 +253,7 @@ export default function CameraPoseCalibration({ mocapMode, cameraPoses, setParse
                         <li>Turn on <em>one</em> light on the tracker object.</li>
                         <li>Place the object in the scene where it can be seen by multiple cameras.</li>
                         <li>Enable <em>Point detection</em></li>
-                        <li>Press the <em>Record point</em> button. The captured point will be displayed on the camera feed. A green point indicates the point was visible to all cameras, a blue point was visible to n-1 cameras and a red point was visible to n-2 cameras.</li>
+                        <li>Press the <em>Record point</em> button, or <em>Record continuously</em> while moving the object around. Points are kept on the server and can be saved and loaded by name. The captured point will be displayed on the camera feed. A green point indicates the point was visible to all cameras, a blue point was visible to n-1 cameras and a red point was visible to n-2 cameras.</li>
                         <li>Repeat until at least 10-20 points are captured. Try to cover as much of the image as possible with points.</li>
                         <li>Once happy with points, click on either "Full Pose" or "Bundle Adjustment". A full pose is necessary if you do not have an existing camera pose that is close to your camera arrangement. A bundle adjustment is preferred if there is an existing camera pose that is close.</li>
                     </ol>
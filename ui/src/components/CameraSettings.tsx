@@ -10,6 +10,22 @@ export default function CameraSettings() {
     const [sharpness, setSharpness] = useState(0);
     const [contrast, setContrast]= useState(0);
     const [contourThreshold, setContourThreshold] = useState(40);
+    const [undistortPoints, setUndistortPoints] = useState(true);
+    // Detector names are also defined in blob_detection.py in the back end, keep them in sync
+    const [dotDetector, setDotDetector] = useState("components");
+    const [minDotArea, setMinDotArea] = useState(3);
+    const [maxDotArea, setMaxDotArea] = useState(0);
+    const [minDotCircularity, setMinDotCircularity] = useState(0);
+    const [roiSearch, setRoiSearch] = useState(false);
+    const [roiWindowRadius, setRoiWindowRadius] = useState(16);
+    const [previewFps, setPreviewFps] = useState(30);
+    const [showContours, setShowContours] = useState(true);
+    const [showCentroids, setShowCentroids] = useState(true);
+    const [showLabels, setShowLabels] = useState(true);
+    const [showEpipolarLines, setShowEpipolarLines] = useState(true);
+    const [streamFps, setStreamFps] = useState(30);
+    const [streamScale, setStreamScale] = useState(100);
+    const [streamQuality, setStreamQuality] = useState(80);
     const target = useRef(null);
 
     const updateCameraSettings: FormEventHandler = useCallback((e) => {
@@ -25,9 +41,30 @@ export default function CameraSettings() {
     const updatePointCaptureSettings: FormEventHandler = useCallback((e) => {
         e.preventDefault()
         socket.emit("update-point-capture-settings", {
-            contourThreshold: contourThreshold/100
+            contourThreshold: contourThreshold/100,
+            undistortPoints,
+            dotDetector,
+            minDotArea,
+            maxDotArea,
+            minDotCircularity: minDotCircularity/100,
+            roiSearch,
+            roiWindowRadius
         })
-    }, [contourThreshold]);
+    }, [contourThreshold, undistortPoints, dotDetector, minDotArea, maxDotArea, minDotCircularity, roiSearch, roiWindowRadius]);
+
+    const updatePreviewSettings: FormEventHandler = useCallback((e) => {
+        e.preventDefault()
+        socket.emit("update-preview-settings", {
+            previewFps,
+            showContours,
+            showCentroids,
+            showLabels,
+            showEpipolarLines,
+            streamFps,
+            streamScale: streamScale/100,
+            streamQuality
+        })
+    }, [previewFps, showContours, showCentroids, showLabels, showEpipolarLines, streamFps, streamScale, streamQuality]);
 
     return <>
         <Button size="sm" className="me-3" variant="outline-secondary" ref={target} onClick={() => setOverlayVisible(!overlayVisible)}>⚙️ Camera Settings</Button>
@@ -58,6 +95,70 @@ export default function CameraSettings() {
                         <Form.Label>Contour Threshold: {contourThreshold}</Form.Label>
                         <Form.Range value={contourThreshold} min={1} max={100} onChange={(event) => setContourThreshold(parseFloat(event.target.value))} />
                     </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Check
+                            type="switch"
+                            label="Undistort points only"
+                            checked={undistortPoints}
+                            onChange={(event) => setUndistortPoints(event.target.checked)}
+                        />
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Label>Dot detector</Form.Label>
+                        <Form.Select size="sm" value={dotDetector} onChange={(event) => setDotDetector(event.target.value)}>
+                            <option value="components">Connected components</option>
+                            <option value="contours">Contours</option>
+                        </Form.Select>
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Label>Min dot area: {minDotArea}px</Form.Label>
+                        <Form.Range value={minDotArea} min={0} max={100} disabled={dotDetector !== "components"} onChange={(event) => setMinDotArea(parseFloat(event.target.value))} />
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Label>Max dot area: {maxDotArea === 0 ? "unlimited" : `${maxDotArea}px`}</Form.Label>
+                        <Form.Range value={maxDotArea} min={0} max={1000} step={10} disabled={dotDetector !== "components"} onChange={(event) => setMaxDotArea(parseFloat(event.target.value))} />
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Label>Min dot circularity: {minDotCircularity}</Form.Label>
+                        <Form.Range value={minDotCircularity} min={0} max={100} disabled={dotDetector !== "components"} onChange={(event) => setMinDotCircularity(parseFloat(event.target.value))} />
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Check
+                            type="switch"
+                            label="Search around predicted markers"
+                            checked={roiSearch}
+                            onChange={(event) => setRoiSearch(event.target.checked)}
+                        />
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Label>Search window radius: {roiWindowRadius}px</Form.Label>
+                        <Form.Range value={roiWindowRadius} min={4} max={64} disabled={!roiSearch} onChange={(event) => setRoiWindowRadius(parseFloat(event.target.value))} />
+                    </Form.Group>
+                </Form>
+                <Form onChange={updatePreviewSettings} as={Col} className='ps-3'>
+                <hr />
+                    <Form.Group className="mb-1">
+                        <Form.Label>Preview FPS: {previewFps}</Form.Label>
+                        <Form.Range value={previewFps} min={1} max={60} onChange={(event) => setPreviewFps(parseFloat(event.target.value))} />
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Check type="switch" label="Show contours" checked={showContours} onChange={(event) => setShowContours(event.target.checked)} />
+                        <Form.Check type="switch" label="Show centroids" checked={showCentroids} onChange={(event) => setShowCentroids(event.target.checked)} />
+                        <Form.Check type="switch" label="Show labels" checked={showLabels} onChange={(event) => setShowLabels(event.target.checked)} />
+                        <Form.Check type="switch" label="Show epipolar lines" checked={showEpipolarLines} onChange={(event) => setShowEpipolarLines(event.target.checked)} />
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Label>Stream FPS: {streamFps}</Form.Label>
+                        <Form.Range value={streamFps} min={1} max={60} onChange={(event) => setStreamFps(parseFloat(event.target.value))} />
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Label>Stream scale: {streamScale}%</Form.Label>
+                        <Form.Range value={streamScale} min={10} max={100} step={5} onChange={(event) => setStreamScale(parseFloat(event.target.value))} />
+                    </Form.Group>
+                    <Form.Group className="mb-1">
+                        <Form.Label>Stream JPEG quality: {streamQuality}</Form.Label>
+                        <Form.Range value={streamQuality} min={10} max={100} onChange={(event) => setStreamQuality(parseFloat(event.target.value))} />
+                    </Form.Group>
                 </Form>
             </div>
         </Overlay>
@@ -24,6 +24,7 @@ interface Props {
 export default function Capture({ cameraPoses, intrinsicMatrices, distortionCoefs, toWorldCoordsMatrix, mocapMode, objectPoints, objectPointErrors, lastObjectPointTimestamp, isRecording, setIsRecording }: Props) {
     const [currentCaptureName, setCurrentCaptureName] = useState("");
     const [recordVideo, setRecordVideo] = useState(false);
+    const [recordRaw, setRecordRaw] = useState(false);
     const [percentageComplete, setPercentageComplete] = useState(0);
     const [currentFileBeingZipped, setCurrentFileBeingZipped] = useState("");
     const objectPointTimes = useRef<Array<Array<Array<number>>>>([]);
@@ -101,6 +102,14 @@ export default function Capture({ cameraPoses, intrinsicMatrices, distortionCoef
                         onChange={() => setRecordVideo(!recordVideo)}
                         className="p-6"
                     />
+                    <Form.Check
+                        type="checkbox"
+                        label="Record raw frames for replay"
+                        checked={recordRaw}
+                        id="recordRawCB"
+                        onChange={() => setRecordRaw(!recordRaw)}
+                        className="p-6"
+                    />
                 </Col>
             </Row>
             <Row className="mt-2">
@@ -116,7 +125,7 @@ export default function Capture({ cameraPoses, intrinsicMatrices, distortionCoef
                                 objectPointTimes.current = [];
                                 imagePoints.current = [];
                                 objectPointErrors.current = [];
-                                socket.emit("start_recording", {name: currentCaptureName, recordVideo})
+                                socket.emit("start_recording", {name: currentCaptureName, recordVideo, recordRaw})
                                 setIsRecording(true);
                             }}>
                             {isRecording ? "Recording..." : "Start recording"}